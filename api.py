@@ -0,0 +1,273 @@
+import hashlib
+import json
+from datetime import datetime
+
+from flask import Blueprint, Response, current_app, request, abort
+
+from models import Venue, Artist
+from replicas import read_only
+from queries import (
+    venue_detail,
+    artist_detail,
+    entity_version,
+    venues_query,
+    artists_query,
+    shows_query,
+    show_filters,
+    booking_conflicts,
+    default_end_time,
+    paginate_request,
+    VENUES_KEY,
+    ARTISTS_KEY,
+    SHOWS_KEY,
+)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# ----------------------------------------------------------------------------#
+# JSON API.
+# ----------------------------------------------------------------------------#
+# Read only, versioned API over the same queries as the HTML views. Responses
+# carry an ETag and 'Cache-Control: no-cache', so clients revalidate on every
+# poll and get an empty 304 when nothing changed. '/shows/check' only reads too:
+# it validates proposed bookings without writing them.
+
+api = Blueprint("api", __name__, url_prefix="/api/v1")
+
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError("%r is not JSON serializable" % (value,))
+
+
+def dumps(payload):
+    """
+    function for serializing a payload to JSON bytes, with orjson when it is installed
+    """
+    if orjson is not None:
+        return orjson.dumps(payload, default=_json_value)
+    return json.dumps(payload, default=_json_value, separators=(",", ":")).encode("utf-8")
+
+
+def select_fields(obj):
+    """
+    function for keeping only the keys listed in the 'fields' argument of the request
+
+    Args:
+        obj: dict of an entity, returned as is when no 'fields' are asked for
+    """
+    fields = request.args.get("fields")
+    if not fields:
+        return obj
+    wanted = set(field.strip() for field in fields.split(","))
+    return {key: value for key, value in obj.items() if key in wanted}
+
+
+def json_response(payload, etag=None):
+    """
+    function for building a revalidatable JSON response
+
+    Args:
+        payload: data to serialize
+        etag: entity tag of the data, a hash of the body when not given
+
+    returns:
+        'Response' object, turned into a 304 when the request's If-None-Match matches
+    """
+    body = dumps(payload)
+    response = Response(body, mimetype="application/json")
+    response.set_etag(etag or hashlib.sha1(body).hexdigest())
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+
+def not_modified(etag):
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def entity_etag(model, entity_id):
+    """
+    function for computing the ETag of a venue or artist without loading its page
+
+    The tag changes with the row version, with any show added or removed, as
+    upcoming shows become past ones and with the versions of the artists (or
+    venues) embedded in its shows. Aborts with 404 if there is no such row.
+    """
+    return version_etag(model, entity_id, entity_version(model, entity_id))
+
+
+def version_etag(model, entity_id, version):
+    """
+    function for hashing the result of 'entity_version' into an ETag, aborts with
+    404 when it is None
+    """
+    if version is None:
+        abort(404)
+    raw = "%s:%s:%s:%s" % (model.__tablename__, entity_id, version, request.args.get("fields"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def page_payload(page):
+    return {
+        "data": [select_fields(row._asdict()) for row in page],
+        "next": page.next_cursor,
+        "prev": page.prev_cursor,
+    }
+
+
+# ----------------------------------------------------------------------------#
+# Endpoints.
+# ----------------------------------------------------------------------------#
+
+
+@api.route("/venues")
+def venues():
+    """
+    function for listing venues with their number of upcoming shows, in pages
+    """
+    page = paginate_request(venues_query(request.args.get("genre")), VENUES_KEY)
+    return json_response(page_payload(page))
+
+
+@api.route("/venues/<int:venue_id>")
+def venue(venue_id):
+    """
+    function for reading a venue with its past and upcoming shows
+
+    Args:
+        venue_id: represent the number of id of the venue row on Venues table
+    """
+    etag = entity_etag(Venue, venue_id)
+    if request.if_none_match.contains(etag):
+        return not_modified(etag)
+    return json_response(select_fields(venue_detail(venue_id)), etag)
+
+
+@api.route("/artists")
+def artists():
+    """
+    function for listing artists, in pages
+    """
+    page = paginate_request(artists_query(request.args.get("genre")), ARTISTS_KEY)
+    return json_response(page_payload(page))
+
+
+@api.route("/artists/<int:artist_id>")
+def artist(artist_id):
+    """
+    function for reading an artist with its past and upcoming shows
+
+    Args:
+        artist_id: represent the number of id of the artist row on Artist table
+    """
+    etag = entity_etag(Artist, artist_id)
+    if request.if_none_match.contains(etag):
+        return not_modified(etag)
+    return json_response(select_fields(artist_detail(artist_id)), etag)
+
+
+@api.route("/shows")
+def shows():
+    """
+    function for listing shows by start time, in pages, filtered by the
+    'from', 'to', 'city' and 'state' arguments
+    """
+    page = paginate_request(shows_query(**show_filters()), SHOWS_KEY)
+    return json_response(page_payload(page))
+
+
+def read_bookings():
+    """
+    function for reading the proposed bookings of a '/shows/check' request: a
+    JSON body of {"shows": [{"venue_id", "artist_id", "start_time", "end_time"}]},
+    the end time defaulting to 'SHOW_DEFAULT_HOURS' after the start
+
+    returns:
+        list of dicts, aborts with 400 on a malformed body
+    """
+    payload = request.get_json(silent=True)
+    shows = payload.get("shows") if isinstance(payload, dict) else None
+    if not isinstance(shows, list):
+        abort(400, 'expected a JSON body of {"shows": [...]}')
+    if len(shows) > current_app.config["MAX_BOOKING_CHECKS"]:
+        abort(400, "at most %d shows per check" % current_app.config["MAX_BOOKING_CHECKS"])
+
+    bookings = []
+    for index, show in enumerate(shows):
+        try:
+            start_time = datetime.fromisoformat(show["start_time"])
+            end_time = (datetime.fromisoformat(show["end_time"]) if show.get("end_time")
+                        else default_end_time(start_time))
+            bookings.append({
+                "venue_id": int(show["venue_id"]),
+                "artist_id": int(show["artist_id"]),
+                "start_time": start_time,
+                "end_time": end_time,
+            })
+        except (AttributeError, KeyError, TypeError, ValueError):
+            abort(400, "show %d: expected venue_id, artist_id and ISO start_time and end_time" % index)
+        if end_time <= start_time:
+            abort(400, "show %d: end_time is not after start_time" % index)
+    return bookings
+
+
+def batch_conflicts(bookings):
+    """
+    function for finding the proposed bookings that double-book each other
+
+    returns:
+        list of (booking, conflict, other booking) tuples, both ways round
+    """
+    conflicts = []
+    for conflict in ("venue", "artist"):
+        key = conflict + "_id"
+        order = sorted(range(len(bookings)),
+                       key=lambda i: (bookings[i][key], bookings[i]["start_time"]))
+        for position, i in enumerate(order):
+            # the following bookings of the same venue or artist starting before this one ends
+            for j in order[position + 1:]:
+                if (bookings[j][key] != bookings[i][key]
+                        or bookings[j]["start_time"] >= bookings[i]["end_time"]):
+                    break
+                conflicts += [(i, conflict, j), (j, conflict, i)]
+    return conflicts
+
+
+@api.route("/shows/check", methods=["POST"])
+@read_only
+def check_shows():
+    """
+    function for validating many proposed bookings at once: each one is checked
+    against the booked shows, in one query, and against the other proposals
+
+    returns:
+        JSON with, for each proposed show in order, whether it can be booked and
+        the shows or proposals ('booking': index) it would double-book
+    """
+    bookings = read_bookings()
+    results = [{"ok": True, "conflicts": []} for _ in bookings]
+    for row in booking_conflicts(bookings):
+        show = row._asdict()
+        index, conflict = show.pop("booking"), show.pop("conflict")
+        results[index]["conflicts"].append({"with": conflict, "show": show})
+    for index, conflict, other in batch_conflicts(bookings):
+        results[index]["conflicts"].append({"with": conflict, "booking": other})
+    for result in results:
+        result["ok"] = not result["conflicts"]
+
+    return Response(dumps({"data": results, "ok": all(r["ok"] for r in results)}),
+                    mimetype="application/json")
+
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+def api_error(error):
+    return Response(dumps({"error": error.description}), status=error.code,
+                    mimetype="application/json")
@@ -5,6 +5,7 @@
 import json
 import dateutil.parser
 import babel
+import babel.dates
 from flask import (
     Flask, 
     render_template, 
@@ -12,7 +13,11 @@ from flask import (
     Response, 
     flash, 
     redirect, 
-    url_for
+    url_for,
+    abort,
+    jsonify,
+    stream_template,
+    stream_with_context
 )
 from flask_migrate import Migrate
 from flask_moment import Moment
@@ -20,7 +25,34 @@ from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.dialects.postgresql import JSON
 from sqlalchemy import cast, Date
+from sqlalchemy.exc import IntegrityError
 from models import setup, Venue, Artist, Shows
+from queries import (
+    venue_detail,
+    artist_detail,
+    venues_query,
+    artists_query,
+    shows_query,
+    show_filters,
+    booking_conflicts,
+    default_end_time,
+    venue_pages,
+    artist_pages,
+    paginate_request,
+    search_by_name,
+    VENUES_KEY,
+    ARTISTS_KEY,
+    SHOWS_KEY
+)
+from cache import init_cache
+from dbpool import pool_stats
+from metrics import init_metrics
+from importer import import_data
+from counters import counters
+from exporter import FORMATS, export_data, iter_export
+from api import api
+from assets import init_assets
+from thumbs import init_image_proxy
 import logging
 from datetime import date,datetime
 from logging import Formatter, FileHandler
@@ -28,6 +60,8 @@ from flask_wtf import Form
 from forms import *  
 import string
 from time import time
+from itertools import groupby
+from functools import lru_cache
 
 # ----------------------------------------------------------------------------#
 # App Config.
@@ -37,23 +71,99 @@ app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object("config")
 db = setup(app)
+cache = init_cache(app)
+with app.app_context():
+    metrics = init_metrics(app, *db.engines.values())
+app.cli.add_command(import_data)
+app.cli.add_command(export_data)
+app.cli.add_command(counters)
+app.register_blueprint(api)
+init_assets(app)
+init_image_proxy(app)
 
 # ----------------------------------------------------------------------------#
 # Filters.
 # ----------------------------------------------------------------------------#
 
 
-def format_datetime(value, format="medium"):
-    date = dateutil.parser.parse(value)
-    if format == "full":
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == "medium":
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format)
+DATETIME_FORMATS = {
+    "full": "EEEE MMMM, d, y 'at' h:mma",
+    "medium": "EE MM, dd, y h:mma",
+}
+
+
+@lru_cache(maxsize=64)
+def datetime_pattern(format, locale):
+    """
+    function for compiling a Babel date pattern and locale once per (format, locale)
+    """
+    return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format)), babel.Locale.parse(locale)
+
+
+@lru_cache(maxsize=4096)
+def format_datetime_cached(value, format, locale):
+    """
+    function for formatting a timezone aware datetime, memoized for the most recent values
+    """
+    pattern, locale = datetime_pattern(format, locale)
+    return pattern.apply(value, locale)
+
+
+def format_datetime(value, format="medium", locale=None):
+    """
+    jinja filter for formatting show times; takes datetime objects as they come from
+    the database, and only parses strings. Recently formatted values are memoized.
+    """
+    if not isinstance(value, datetime):
+        value = dateutil.parser.parse(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=babel.dates.UTC)
+    return format_datetime_cached(value, format, locale or babel.dates.LC_TIME)
 
 
 app.jinja_env.filters["datetime"] = format_datetime
 
+
+def buffered(chunks, size):
+    """
+    generator for joining the many small strings Jinja streams into pieces of about
+    'size' bytes, so each write to the client carries more than a tag or two
+    """
+    buffer, length = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield "".join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def closing(chunks, session):
+    """
+    generator for passing a streamed body through and closing the session its
+    queries run on once it is sent or its client goes away
+    """
+    try:
+        yield from chunks
+    finally:
+        session.close()
+
+
+def stream_page(template_name, **context):
+    """
+    function for streaming a template while it renders, for the list pages
+
+    The layout head and the first rows go out as soon as 'STREAM_BUFFER_SIZE'
+    bytes are rendered, while the rest of the rows are still being fetched.
+    """
+    chunks = stream_template(template_name, **context)
+    # the rows are fetched through the view's session after the request's
+    # teardown removed it, so nothing else would give its connection back
+    return Response(closing(buffered(chunks, app.config["STREAM_BUFFER_SIZE"]), db.session()),
+                    mimetype="text/html")
+
 # ----------------------------------------------------------------------------#
 # Controllers.
 # ----------------------------------------------------------------------------#
@@ -69,34 +179,44 @@ def index():
 
 
 @app.route("/venues")
+@cache.cached("venues")
 def venues():
     """
-    function for showing list of venues on /venues directory
+    function for showing list of venues on /venues directory, optionally only the
+    venues playing the '?genre=' genre
 
     returns:
         data object that contains list of venues
     """
 
     # TODO: replace with real venues data. (DONE)
-    #       num_shows should be aggregated based on number of upcoming shows per venue.
-  
-    venues = Venue.query.group_by(Venue.id, Venue.city, Venue.state).all()
-    data = []
+    #       num_shows should be aggregated based on number of upcoming shows per venue. (DONE)
+    venues = paginate_request(venues_query(request.args.get("genre")), VENUES_KEY, stream=True)
 
-    for venue in venues :
-        data.append({
-            "city": venue.city,
-            "state":venue.state,
-            "venues":[{
-                "id": venue.id,
-                "name": venue.name
-            }]
-        })
+    return stream_page("pages/venues.html", areas=venue_areas(venues), page=venues)
 
-    return render_template("pages/venues.html", areas=data)
 
+def venue_areas(venues):
+    """
+    function for grouping the rows of the venue listing by city
 
-@app.route("/venues/search", methods=["POST"])
+    returns:
+        generator of the areas, built while the page streams, one area's venues
+        in memory at a time
+    """
+    for (city, state), area in groupby(venues, key=lambda v: (v.city, v.state)):
+        yield {
+            "city": city,
+            "state": state,
+            "venues": [{
+                "id": v.id,
+                "name": v.name,
+                "num_upcoming_shows": v.num_upcoming_shows
+            } for v in area]
+        }
+
+
+@app.route("/venues/search", methods=["GET", "POST"])
 def search_venues():
     """
     function for searching for venues using 'search_term' variable that comes from the 'pages/search_venues.html' file
@@ -108,32 +228,32 @@ def search_venues():
     # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
     # seach for Hop should return "The Musical Hop". (DONE)
     # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee" (DONE)
-    response = request.form.get('search_term', '')
-    response = response.lower()
-
-    venues = db.session.query(Venue).filter(Venue.name.ilike('%' + response + '%')).all()
-    results = []
-    
-    for v in venues:
-        print(v.name)
-        results.append({
-                'id': v.id,
-                'name' : v.name
-        })
-
-    response={
-        "count": len(results),
-        "data": results
-    }
+    page = search_by_name(Venue, request.values.get("search_term", ""))
 
     return render_template(
         "pages/search_venues.html",
-        results=response,
-        search_term=request.form.get("search_term", ""),
+        results=search_results(page),
+        search_term=request.values.get("search_term", ""),
+        page=page,
     )
 
 
+def search_results(page):
+    """
+    function for laying out a page of search results for the search templates
+
+    returns:
+        dict with the 'count' and the 'data' (list of id and name) of the results
+    """
+    results = [{"id": row.id, "name": row.name} for row in page]
+    return {
+        "count": len(results),
+        "data": results
+    }
+
+
 @app.route("/venues/<int:venue_id>")
+@cache.cached(lambda venue_id: "venue:%s" % venue_id)
 def show_venue(venue_id):
     """
     function for viewing venues by'venue_id' 
@@ -145,52 +265,11 @@ def show_venue(venue_id):
         response object that contains 'count' and 'data' (have list of venues) of venues
     """
     # shows the venue page with the given venue_id
-    result = db.session.query(Venue).filter(Venue.id == venue_id)
-    result = result[0]
-
-    past_shows_count = 0
-    upcoming_shows_count = 0
-
-    past_shows = []
-    upcoming_shows = []
-
-    all_shows = Shows.query.all()
-
-    print(all_shows)
-
-    for show in all_shows:
-        if show.venue_id == result.id:
-            show_time = datetime.strptime(show.start_time, '%Y-%m-%d %H:%M:%S')
-            if show_time > datetime.now() :
-                upcoming_shows.append(show)
-            else: 
-                past_shows.append(show)
-            
-    past_shows_count = len(past_shows)
-    upcoming_shows_count = len(upcoming_shows)
-    
-
     # TODO: replace with real venue data from the venues table, using venue_id (DONE)
-    resdata = {
-        "id": result.id,
-        "name": result.name,
-        "genres": json.loads(result.genres),
-        "address": result.address,
-        "city": result.city,
-        "state": result.state,
-        "phone": result.phone,
-        "website": result.website,
-        "facebook_link": result.facebook_link,
-        "seeking_talent": result.seeking_talent,
-        "seeking_description": result.seeking_description,
-        "image_link": result.image_link,
-        "past_shows": past_shows,
-        "upcoming_shows": upcoming_shows,
-        "past_shows_count": past_shows_count,
-        "upcoming_shows_count": upcoming_shows_count,
-    }
-    
-    data = list(filter(lambda d: d["id"] == venue_id, [resdata]))[0]
+    data = venue_detail(venue_id)
+    if data is None:
+        abort(404)
+
     return render_template("pages/show_venue.html", venue=data)
 
 
@@ -244,6 +323,7 @@ def create_venue_submission():
 
         db.session.add(venue_to_add)
         db.session.commit()
+        cache.invalidate("venues")
 
         # on successful db insert, flash success
         flash("Venue " + request.form["name"] + " was successfully listed!")
@@ -271,12 +351,14 @@ def delete_venue(venue_id):
     # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
 
     try:
-        print('DELETING VENUE NUMBER: ' + venue_id)
+        app.logger.info("deleting venue %s", venue_id)
         result = Venue.query.filter(Venue.id==venue_id)
         result = result[0]
+        pages = venue_pages(result.id)
 
         db.session.delete(result)
         db.session.commit()
+        cache.invalidate(*pages)
     except:
             flash("An error occurred. Venue could not be deleted.")
             db.session.rollback()
@@ -296,28 +378,23 @@ def delete_venue(venue_id):
 
 
 @app.route("/artists")
+@cache.cached("artists")
 def artists():
     """
-    function for viewing artists
+    function for viewing artists, optionally only the artists playing the '?genre=' genre
 
     returns:
         data object that contains list of artists
     """
     # TODO: replace with real data returned from querying the database (DONE)
-    artists = Artist.query.group_by(Artist.id, Artist.name).all()
-
-    data = []
+    artists = paginate_request(artists_query(request.args.get("genre")), ARTISTS_KEY, stream=True)
 
-    for a in artists :
-        data.append({
-            'id' : a.id,
-            'name' : a.name
-        })
+    data = ({"id": a.id, "name": a.name} for a in artists)
 
-    return render_template("pages/artists.html", artists=data)
+    return stream_page("pages/artists.html", artists=data, page=artists)
 
 
-@app.route("/artists/search", methods=["POST"])
+@app.route("/artists/search", methods=["GET", "POST"])
 def search_artists():
 
     """
@@ -328,32 +405,18 @@ def search_artists():
     """
     # TODO: implement search on artists with partial string search. Ensure it is case-insensitive. (DONE)
 
-    response = request.form.get('search_term', '')
-    response = response.lower()
-
-    artists = db.session.query(Artist).filter(Artist.name.ilike('%' + response + '%')).all()
-    results = []
-    
-    for a in artists:
-        print(a.name)
-        results.append({
-                'id': a.id,
-                'name' : a.name
-        })
-
-    response={
-        "count": len(results),
-        "data": results
-    }
+    page = search_by_name(Artist, request.values.get("search_term", ""))
 
     return render_template(
         "pages/search_artists.html",
-        results=response,
-        search_term=request.form.get("search_term", ""),
+        results=search_results(page),
+        search_term=request.values.get("search_term", ""),
+        page=page,
     )
 
 
 @app.route("/artists/<int:artist_id>")
+@cache.cached(lambda artist_id: "artist:%s" % artist_id)
 def show_artist(artist_id):
 
     """
@@ -366,49 +429,10 @@ def show_artist(artist_id):
         response data object that contains all the artist info
     """
 
-    result = db.session.query(Artist).filter(Artist.id == artist_id)
-    result = result[0]
-
-    past_shows_count = 0
-    upcoming_shows_count = 0
-
-    past_shows = []
-    upcoming_shows = []
-
-    all_shows = Shows.query.all()
-
-    print(all_shows)
-
-    for show in all_shows:
-        if show.artist_id == result.id:
-            show_time = datetime.strptime(show.start_time, '%Y-%m-%d %H:%M:%S')
-            if show_time > datetime.now() :
-                upcoming_shows.append(show)
-            else: 
-                past_shows.append(show)
-            
-    past_shows_count = len(past_shows)
-    upcoming_shows_count = len(upcoming_shows)
-
-    resdata = {
-        "id": result.id,
-        "name": result.name,
-        "genres": json.loads(result.genres),
-        "city": result.city,
-        "state": result.state,
-        "phone": result.phone,
-        "website": result.website,
-        "facebook_link": result.facebook_link,
-        "seeking_venue": result.seeking_venue,
-        "seeking_description": result.seeking_description,
-        "image_link": result.image_link,
-        "past_shows": past_shows,
-        "upcoming_shows": upcoming_shows,
-        "past_shows_count": past_shows_count,
-        "upcoming_shows_count": upcoming_shows_count,
-    }
+    data = artist_detail(artist_id)
+    if data is None:
+        abort(404)
 
-    data = list(filter(lambda d: d["id"] == artist_id, [resdata]))[0]
     return render_template("pages/show_artist.html", artist=data)
 
 
@@ -479,6 +503,7 @@ def edit_artist_submission(artist_id):
     artist.seeking_description = seeking_description
 
     db.session.commit()
+    cache.invalidate(*artist_pages(artist_id))
     db.session.close()
 
     # artist record with ID <artist_id> using the new attributes
@@ -539,6 +564,7 @@ def edit_venue_submission(venue_id):
     venue.seeking_description = seeking_description
 
     db.session.commit()
+    cache.invalidate(*venue_pages(venue_id))
     db.session.close()
 
     # venue record with ID <venue_id> using the new attributes
@@ -596,6 +622,7 @@ def create_artist_submission():
 
         db.session.add(artist_to_add)
         db.session.commit()
+        cache.invalidate("artists")
 
         # on successful db insert, flash success
         flash("Artist " + request.form["name"] + " was successfully listed!")
@@ -618,19 +645,18 @@ def delete_artist(artist_id):
         artist_id: represent the number of id of the artist row on Artist table
     """
 
-    print('DELETING ARTIST NUMBER: ' + artist_id)
     err = False
 
     try:
-        print('DELETING ARTIST NUMBER: ' + artist_id)
+        app.logger.info("deleting artist %s", artist_id)
         result = Artist.query.filter(Artist.id==artist_id)
         result = result[0]
+        # its shows go with it, lowering the venues' upcoming show counts
+        pages = artist_pages(result.id) + ["venues"]
 
         db.session.delete(result)
         db.session.commit()
-
-
-        db.session.commit()
+        cache.invalidate(*pages)
     except:
             err = True
             db.session.rollback()
@@ -648,40 +674,22 @@ def delete_artist(artist_id):
 
 
 @app.route("/shows")
+@cache.cached("shows")
 def shows():
     """
-    function for viewing shows 
-    
-    returns:   
+    function for viewing shows, one page at a time in start time order, optionally
+    only the shows in the '?from=&to=' range and the '?city=&state=' location
+
+    returns:
         'data' object that contains list of shows.
     """
-    
 
     # displays list of shows at /shows
-    shows = Shows.query.all()
+    shows = paginate_request(shows_query(**show_filters()), SHOWS_KEY, stream=True)
 
-    data = []
+    data = (show._asdict() for show in shows)
 
-    for show in shows :
-        
-        v = Venue.query.get(show.venue_id)
-        a = Artist.query.get(show.artist_id)
-
-        t = str(datetime.strptime(show.start_time, "%Y-%m-%d %H:%M:%S"))
-
-        data.append({
-            "venue_id": show.id,
-            "venue_name": v.name,
-            "artist_id": a.id,
-            "artist_name": a.name,
-            "artist_image_link": a.image_link,
-            "start_time": t
-        })
-
-    # TODO: replace with real venues data.
-    #       num_shows should be aggregated based on number of upcoming shows per venue.
-    
-    return render_template("pages/shows.html", shows=data)
+    return stream_page("pages/shows.html", shows=data, page=shows)
 
 
 @app.route("/shows/create")
@@ -691,6 +699,10 @@ def create_shows():
     return render_template("forms/new_show.html", form=form)
 
 
+# SQLSTATE of a row refused by an exclusion constraint
+EXCLUSION_VIOLATION = "23P01"
+
+
 @app.route("/shows/create", methods=["POST"])
 def create_show_submission():
     """
@@ -701,6 +713,7 @@ def create_show_submission():
     # TODO: insert form data as a new Show record in the db, instead (DONE)
 
     err = False
+    conflicts = []
     try:
 
         date_format = '%Y-%m-%d %H:%M:%S'
@@ -708,10 +721,22 @@ def create_show_submission():
         show.artist_id = request.form['artist_id']
         show.venue_id = request.form['venue_id']
         show.start_time = datetime.strptime(request.form['start_time'], date_format)
+        if request.form.get('end_time'):
+            show.end_time = datetime.strptime(request.form['end_time'], date_format)
+        else:
+            show.end_time = default_end_time(show.start_time)
         db.session.add(show)
         db.session.commit()
+        cache.invalidate("shows", "venues", "venue:%s" % show.venue_id, "artist:%s" % show.artist_id)
 
-
+    # a double-booking is refused by the exclusion constraints on "Shows", also
+    # when a concurrent request booked the venue or artist first
+    except IntegrityError as e:
+        err = True
+        db.session.rollback()
+        if getattr(e.orig, "pgcode", None) == EXCLUSION_VIOLATION:
+            conflicts = booking_conflicts([{"venue_id": int(show.venue_id), "artist_id": int(show.artist_id),
+                                            "start_time": show.start_time, "end_time": show.end_time}])
     # TODO: on unsuccessful db insert, flash an error instead.
     # e.g., flash('An error occurred. Show could not be listed.')
     # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
@@ -720,7 +745,11 @@ def create_show_submission():
         db.session.rollback()
     finally:
         db.session.close()
-        if err: flash('ERROR. The entered show has not been listed.')
+        if conflicts:
+            for conflict in conflicts:
+                flash('ERROR. The %s is already booked from %s to %s (show %d).'
+                      % (conflict.conflict, conflict.start_time, conflict.end_time, conflict.id))
+        elif err: flash('ERROR. The entered show has not been listed.')
         else: flash('Show was successfully listed!')
 
     # on successful db insert, flash success
@@ -728,6 +757,61 @@ def create_show_submission():
     return render_template("pages/home.html")
 
 
+#  Export
+#  ----------------------------------------------------------------
+
+
+@app.route("/export/<any(artists, venues, shows):kind>")
+def export(kind):
+    """
+    function for streaming the whole table of artists, venues or shows
+
+    Args:
+        kind: 'artists', 'venues' or 'shows'
+
+    returns:
+        streamed CSV (default) or NDJSON ('?format=ndjson') response
+    """
+    format = request.args.get("format", "csv")
+    if format not in FORMATS:
+        abort(400)
+
+    return Response(
+        stream_with_context(iter_export(kind, format)),
+        mimetype=FORMATS[format],
+        headers={"Content-Disposition": "attachment; filename=%s.%s" % (kind, format)},
+    )
+
+
+@app.route("/cache/stats")
+def cache_stats():
+    """
+    function for reading the hit/miss counters of this worker's response cache
+    """
+    return jsonify(cache.stats())
+
+
+@app.route("/pool/stats")
+def db_pool_stats():
+    """
+    function for reading the live connection pool statistics of this worker
+    """
+    stats = pool_stats(db.engine)
+    replicas = app.extensions.get("replicas")
+    if replicas is not None:
+        stats["replicas"] = [dict(replica, **pool_stats(engine))
+                             for replica, engine in zip(replicas.stats(), replicas.engines)]
+    return jsonify(stats)
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """
+    function for exposing this worker's request and SQL metrics to Prometheus
+    """
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template("errors/404.html"), 404
@@ -0,0 +1,406 @@
+import asyncio
+from functools import wraps
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import g, request, render_template, abort, make_response
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from werkzeug.exceptions import HTTPException
+
+from app import app as flask_app, cache, venue_areas, search_results
+from api import json_response, not_modified, page_payload, select_fields, version_etag
+from dbpool import async_database_url, async_engine_options, install_statement_timeout
+from models import Venue, Artist
+from pagination import seek, make_page
+from queries import (
+    venues_query,
+    artists_query,
+    shows_query,
+    show_filters,
+    search_query,
+    split_queries,
+    venue_shows_query,
+    artist_shows_query,
+    venue_dict,
+    artist_dict,
+    entity_version_query,
+    version_tuple,
+    page_args,
+    VENUES_KEY,
+    ARTISTS_KEY,
+    SHOWS_KEY,
+)
+
+# ----------------------------------------------------------------------------#
+# Async mode.
+# ----------------------------------------------------------------------------#
+# ASGI entry point serving the read endpoints (listings, detail pages, searches
+# and the JSON API) from coroutines over an asyncpg engine, so a worker waiting
+# on the database or on a slow client holds no thread:
+#
+#     uvicorn asgi:application --workers 4
+#
+# The views build their statements with the same query functions as the Flask
+# views and run them through an AsyncSession; a detail page's independent
+# queries run concurrently, each on its own connection, on a replica when the
+# Flask app's replica set picks one for the request. They run inside a Flask
+# request context, so the Flask app's request hooks, error handlers, templates,
+# response cache and metrics apply unchanged. Every other route (forms, writes,
+# exports, assets, thumbnails, stats) is passed to the Flask app through a WSGI
+# adapter, which runs it in a thread.
+
+
+
+def make_engine(uri):
+    engine = create_async_engine(async_database_url(uri), **async_engine_options(flask_app.config))
+    flask_app.extensions["request_metrics"].instrument(engine.sync_engine)
+    if flask_app.config.get("DB_PGBOUNCER") and flask_app.config.get("DB_STATEMENT_TIMEOUT"):
+        install_statement_timeout(engine.sync_engine, flask_app.config["DB_STATEMENT_TIMEOUT"])
+    return engine
+
+
+engine = make_engine(flask_app.config["SQLALCHEMY_DATABASE_URI"])
+Session = async_sessionmaker(engine, expire_on_commit=False)
+
+# one per 'SQLALCHEMY_REPLICA_URIS' entry, picked by the Flask app's replica set
+replica_engines = [make_engine(uri) for uri in flask_app.config.get("SQLALCHEMY_REPLICA_URIS") or ()]
+replica_sessions = [async_sessionmaker(e, expire_on_commit=False) for e in replica_engines]
+
+# ----------------------------------------------------------------------------#
+# Queries.
+# ----------------------------------------------------------------------------#
+
+
+def read_session():
+    """
+    function for opening a session on the database the request reads from
+    """
+    return g.get("read_session", Session)()
+
+
+async def fetch_all(query):
+    """
+    function for running a query of 'queries' on a connection of its own
+
+    Args:
+        query: ORM query, only its statement is used
+
+    returns:
+        list of rows
+    """
+    async with read_session() as session:
+        result = await session.execute(query.statement)
+        return result.all()
+
+
+async def fetch_first(query):
+    async with read_session() as session:
+        result = await session.execute(query.limit(1).statement)
+        return result.first()
+
+
+async def fetch_page(query, keys):
+    """
+    function for fetching the page of a query asked for by the request, as
+    'paginate_request' does
+
+    returns:
+        'Page' object, aborts with 400 on a malformed cursor
+    """
+    args = page_args()
+    try:
+        query = seek(query, keys, after=args["after"], before=args["before"])
+    except ValueError:
+        abort(400)
+    rows = await fetch_all(query.limit(args["limit"] + 1))
+    return make_page(rows, keys, args["limit"], after=args["after"], before=args["before"])
+
+
+async def get(model, entity_id):
+    async with read_session() as session:
+        return await session.get(model, entity_id)
+
+
+DETAILS = {
+    Venue: (venue_shows_query, venue_dict),
+    Artist: (artist_shows_query, artist_dict),
+}
+
+
+async def detail(model, entity_id):
+    """
+    function for building the data of a venue or artist page, as 'venue_detail'
+    and 'artist_detail' do, fetching the row and its past and upcoming shows
+    concurrently
+
+    returns:
+        dict of the page data, None if there is no such row
+    """
+    shows_query, layout = DETAILS[model]
+    past, upcoming = split_queries(shows_query(entity_id))
+    result, past_shows, upcoming_shows = await asyncio.gather(
+        get(model, entity_id), fetch_all(past), fetch_all(upcoming)
+    )
+    if result is None:
+        return None
+    return layout(result, [s._asdict() for s in past_shows],
+                  [s._asdict() for s in upcoming_shows])
+
+
+async def entity_etag(model, entity_id):
+    """
+    function for computing the ETag of a venue or artist, as the API's 'entity_etag' does
+    """
+    row = await fetch_first(entity_version_query(model, entity_id))
+    return version_etag(model, entity_id, version_tuple(row))
+
+
+# ----------------------------------------------------------------------------#
+# Views.
+# ----------------------------------------------------------------------------#
+
+# endpoint of the Flask view -> coroutine serving it
+VIEWS = {}
+
+
+def route(endpoint):
+    """
+    decorator for serving a Flask endpoint with a coroutine; URLs are matched
+    by the Flask app's own rules
+    """
+
+    def decorator(view):
+        VIEWS[endpoint] = view
+        return view
+
+    return decorator
+
+
+def cached(name):
+    """
+    decorator for caching the responses of a coroutine in the Flask app's response cache
+    """
+
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(**kwargs):
+            if not cache.cacheable():
+                return await view(**kwargs)
+
+            key = cache.key(name(**kwargs) if callable(name) else name)
+            response = cache.get(key)
+            if response is None:
+                response = cache.set(key, make_response(await view(**kwargs)))
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+@route("venues")
+@cached("venues")
+async def venues():
+    page = await fetch_page(venues_query(request.args.get("genre")), VENUES_KEY)
+    return render_template("pages/venues.html", areas=venue_areas(page), page=page)
+
+
+@route("search_venues")
+async def search_venues():
+    search_term = request.values.get("search_term", "")
+    page = await fetch_page(*search_query(Venue, search_term))
+    return render_template("pages/search_venues.html", results=search_results(page),
+                           search_term=search_term, page=page)
+
+
+@route("show_venue")
+@cached(lambda venue_id: "venue:%s" % venue_id)
+async def show_venue(venue_id):
+    data = await detail(Venue, venue_id)
+    if data is None:
+        abort(404)
+    return render_template("pages/show_venue.html", venue=data)
+
+
+@route("artists")
+@cached("artists")
+async def artists():
+    page = await fetch_page(artists_query(request.args.get("genre")), ARTISTS_KEY)
+    data = [{"id": a.id, "name": a.name} for a in page]
+    return render_template("pages/artists.html", artists=data, page=page)
+
+
+@route("search_artists")
+async def search_artists():
+    search_term = request.values.get("search_term", "")
+    page = await fetch_page(*search_query(Artist, search_term))
+    return render_template("pages/search_artists.html", results=search_results(page),
+                           search_term=search_term, page=page)
+
+
+@route("show_artist")
+@cached(lambda artist_id: "artist:%s" % artist_id)
+async def show_artist(artist_id):
+    data = await detail(Artist, artist_id)
+    if data is None:
+        abort(404)
+    return render_template("pages/show_artist.html", artist=data)
+
+
+@route("shows")
+@cached("shows")
+async def shows():
+    page = await fetch_page(shows_query(**show_filters()), SHOWS_KEY)
+    data = [show._asdict() for show in page]
+    return render_template("pages/shows.html", shows=data, page=page)
+
+
+@route("api.venues")
+async def api_venues():
+    page = await fetch_page(venues_query(request.args.get("genre")), VENUES_KEY)
+    return json_response(page_payload(page))
+
+
+@route("api.venue")
+async def api_venue(venue_id):
+    etag = await entity_etag(Venue, venue_id)
+    if request.if_none_match.contains(etag):
+        return not_modified(etag)
+    return json_response(select_fields(await detail(Venue, venue_id)), etag)
+
+
+@route("api.artists")
+async def api_artists():
+    page = await fetch_page(artists_query(request.args.get("genre")), ARTISTS_KEY)
+    return json_response(page_payload(page))
+
+
+@route("api.artist")
+async def api_artist(artist_id):
+    etag = await entity_etag(Artist, artist_id)
+    if request.if_none_match.contains(etag):
+        return not_modified(etag)
+    return json_response(select_fields(await detail(Artist, artist_id)), etag)
+
+
+@route("api.shows")
+async def api_shows():
+    page = await fetch_page(shows_query(**show_filters()), SHOWS_KEY)
+    return json_response(page_payload(page))
+
+
+# ----------------------------------------------------------------------------#
+# ASGI.
+# ----------------------------------------------------------------------------#
+
+wsgi = WsgiToAsgi(flask_app)
+urls = flask_app.url_map.bind("localhost")
+
+
+async def read_body(receive):
+    body = []
+    while True:
+        message = await receive()
+        body.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(body)
+
+
+def request_context(scope, body):
+    """
+    function for building the Flask request context of an ASGI request
+    """
+    headers = [(k.decode("latin-1"), v.decode("latin-1")) for k, v in scope["headers"]]
+    host = next((v for k, v in headers if k.lower() == "host"), None)
+    if host is None:
+        host = "%s:%d" % tuple(scope.get("server") or ("localhost", 80))
+    client = scope.get("client") or ("", 0)
+
+    return flask_app.test_request_context(
+        scope["path"],
+        base_url="%s://%s" % (scope.get("scheme", "http"), host),
+        query_string=scope["query_string"].decode("latin-1"),
+        method=scope["method"],
+        headers=headers,
+        data=body,
+        environ_overrides={
+            "REMOTE_ADDR": client[0],
+            "REMOTE_PORT": client[1],
+            "SERVER_PROTOCOL": "HTTP/%s" % scope.get("http_version", "1.1"),
+        },
+    )
+
+
+async def dispatch(view):
+    """
+    function for running a coroutine view the way Flask runs a view: request
+    hooks, error handlers and response processing included
+    """
+    try:
+        rv = flask_app.preprocess_request()
+        if rv is None:
+            replicas = flask_app.extensions.get("replicas")
+            if replicas is not None:
+                # may run a blocking health check
+                index = await asyncio.to_thread(replicas.for_request)
+                # recorded for 'read_replica', so the response cache knows the page's source
+                g.db_replica = replicas.engines[index] if index is not None else None
+                if index is not None:
+                    g.read_session = replica_sessions[index]
+            rv = await view(**request.view_args)
+    except Exception as e:
+        rv = flask_app.handle_user_exception(e)
+    return flask_app.finalize_request(rv)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await engine.dispose()
+            for replica in replica_engines:
+                await replica.dispose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    """
+    ASGI application: the read endpoints in 'VIEWS' run as coroutines, anything
+    else goes to the Flask app
+    """
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+
+    view = None
+    if scope["type"] == "http":
+        try:
+            endpoint, _ = urls.match(scope["path"], method=scope["method"])
+            view = VIEWS.get(endpoint)
+        except HTTPException:
+            # redirects, 404s and 405s are answered by the Flask app
+            pass
+    if view is None:
+        return await wsgi(scope, receive, send)
+
+    body = await read_body(receive) if scope["method"] == "POST" else b""
+    with request_context(scope, body):
+        try:
+            response = await dispatch(view)
+        except Exception as e:
+            response = flask_app.handle_exception(e)
+
+        try:
+            await send({
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": [(k.lower().encode("latin-1"), v.encode("latin-1"))
+                            for k, v in response.headers.items()],
+            })
+            await send({
+                "type": "http.response.body",
+                "body": b"" if scope["method"] == "HEAD" else response.get_data(),
+            })
+        finally:
+            response.close()
@@ -0,0 +1,321 @@
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+
+import click
+from flask import Blueprint, current_app, request, send_from_directory, url_for, abort
+from flask.cli import with_appcontext
+
+# ----------------------------------------------------------------------------#
+# Asset pipeline.
+# ----------------------------------------------------------------------------#
+# 'flask build-assets' concatenates and minifies the bundles below, copies every
+# other static file, names each output after a hash of its content and writes
+# gzip/brotli siblings and WebP/AVIF image variants next to them in static/dist,
+# with a manifest mapping the source names to the built files. Built files never
+# change under the same name, so they are served with an immutable Cache-Control.
+# Without a build (development) the templates link the source files as before.
+
+DIST = "dist"
+MANIFEST = "manifest.json"
+
+BUNDLES = {
+    "main.css": ["css/bootstrap.min.css", "css/layout.main.css", "css/main.css",
+                 "css/main.responsive.css", "css/main.quickfix.css"],
+    "form.css": ["css/bootstrap.min.css", "css/bootstrap-theme.min.css", "css/layout.main.css",
+                 "css/main.css", "css/main.responsive.css", "css/main.quickfix.css"],
+    "head.js": ["js/libs/modernizr-2.8.2.min.js", "js/libs/moment.min.js"],
+    "main.js": ["js/libs/bootstrap-3.1.1.min.js", "js/plugins.js", "js/script.js"],
+}
+
+COMPRESSIBLE = (".css", ".js", ".svg", ".json", ".ttf", ".otf", ".eot", ".map")
+IMAGES = (".jpg", ".jpeg", ".png")
+# widths of the responsive image variants; narrower images get one variant at their own size
+IMAGE_WIDTHS = (480, 960, 1600)
+IMAGE_FORMATS = (("avif", "AVIF", {"quality": 50}), ("webp", "WEBP", {"quality": 75}))
+
+MAX_AGE = 365 * 24 * 3600
+
+CSS_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+CSS_SPACE = re.compile(r"\s*([{};,>])\s*")
+CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+
+def fingerprint(name, data):
+    root, ext = posixpath.splitext(name)
+    return "%s.%s%s" % (root, hashlib.sha256(data).hexdigest()[:12], ext)
+
+
+def minify_css(text):
+    """
+    function for stripping comments and insignificant whitespace from a stylesheet
+    """
+    text = CSS_COMMENT.sub("", text)
+    text = CSS_SPACE.sub(r"\1", text)
+    return re.sub(r"\s+", " ", text).replace(";}", "}").strip()
+
+
+def minify_js(text):
+    try:
+        import rjsmin
+    except ImportError:
+        return text
+    return rjsmin.jsmin(text)
+
+
+class Builder(object):
+    """
+    writer of one build of static/dist
+    """
+
+    def __init__(self, static_folder):
+        self.static_folder = static_folder
+        self.dist = os.path.join(static_folder, DIST)
+        self.manifest = {"files": {}, "bundles": {}, "images": {}}
+        self.written = 0
+
+    def write(self, name, data):
+        """
+        function for writing a built file under its fingerprinted name, with its
+        compressed siblings
+
+        returns:
+            fingerprinted name, relative to static/dist
+        """
+        hashed = fingerprint(name, data)
+        path = os.path.join(self.dist, hashed)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        self.written += len(data)
+
+        if name.endswith(COMPRESSIBLE):
+            with open(path + ".gz", "wb") as f:
+                f.write(gzip.compress(data, 9, mtime=0))
+            try:
+                import brotli
+            except ImportError:
+                pass
+            else:
+                with open(path + ".br", "wb") as f:
+                    f.write(brotli.compress(data, quality=11))
+        return hashed
+
+    def read(self, name):
+        with open(os.path.join(self.static_folder, name), "rb") as f:
+            return f.read()
+
+    def rewrite_urls(self, css, source):
+        """
+        function for pointing the url()s of a stylesheet at the fingerprinted files
+        """
+
+        def replace(match):
+            url = match.group(2)
+            if url.startswith(("data:", "http:", "https:", "//", "/")):
+                return match.group(0)
+            path = re.split(r"[?#]", url, 1)[0]
+            name = posixpath.normpath(posixpath.join(posixpath.dirname(source), path))
+            hashed = self.manifest["files"].get(name)
+            if hashed is None:
+                return match.group(0)
+            # bundles sit at the top of dist/, next to the copied directories
+            return 'url("%s%s")' % (hashed, url[len(path):])
+
+        return CSS_URL.sub(replace, css)
+
+    def copy_files(self):
+        for root, dirs, files in os.walk(self.static_folder):
+            dirs[:] = [d for d in dirs if os.path.join(root, d) != self.dist]
+            for filename in sorted(files):
+                if filename.startswith("."):
+                    continue
+                name = os.path.relpath(os.path.join(root, filename), self.static_folder)
+                name = name.replace(os.sep, "/")
+                self.manifest["files"][name] = self.write(name, self.read(name))
+                if name.lower().endswith(IMAGES):
+                    self.image_variants(name)
+
+    def image_variants(self, name):
+        """
+        function for writing resized AVIF and WebP copies of an image, for the
+        formats the installed Pillow can encode
+        """
+        try:
+            from PIL import Image
+        except ImportError:
+            return
+
+        variants = {}
+        with Image.open(os.path.join(self.static_folder, name)) as image:
+            image = image.convert("RGB")
+            widths = [w for w in IMAGE_WIDTHS if w < image.width] or [image.width]
+            for ext, format, options in IMAGE_FORMATS:
+                for width in widths:
+                    height = round(image.height * width / float(image.width))
+                    resized = image if width == image.width else image.resize((width, height))
+                    try:
+                        data = self.encode(resized, format, options)
+                    except (KeyError, OSError):
+                        # this Pillow build has no encoder for the format
+                        break
+                    root = posixpath.splitext(name)[0]
+                    hashed = self.write("%s-%d.%s" % (root, width, ext), data)
+                    variants.setdefault(ext, []).append([width, hashed])
+        if variants:
+            self.manifest["images"][name] = variants
+
+    def encode(self, image, format, options):
+        buffer = io.BytesIO()
+        image.save(buffer, format, **options)
+        return buffer.getvalue()
+
+    def build_bundles(self):
+        for bundle, sources in sorted(BUNDLES.items()):
+            parts = []
+            for source in sources:
+                text = self.read(source).decode("utf-8")
+                if bundle.endswith(".css"):
+                    parts.append(self.rewrite_urls(minify_css(text), source))
+                else:
+                    parts.append(minify_js(text).rstrip().rstrip(";") + ";")
+            data = "\n".join(parts).encode("utf-8")
+            self.manifest["bundles"][bundle] = self.write(bundle, data)
+
+    def build(self):
+        if os.path.isdir(self.dist):
+            shutil.rmtree(self.dist)
+        self.copy_files()
+        self.build_bundles()
+        with open(os.path.join(self.dist, MANIFEST), "w") as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+        return self.manifest
+
+
+@click.command("build-assets")
+@with_appcontext
+def build_assets():
+    """
+    Bundle, minify, fingerprint and precompress the static files into static/dist.
+    """
+    builder = Builder(current_app.static_folder)
+    manifest = builder.build()
+    click.echo("%d bundles, %d files, %d images with variants, %.1f MB written to %s"
+               % (len(manifest["bundles"]), len(manifest["files"]), len(manifest["images"]),
+                  builder.written / 1e6, builder.dist))
+
+
+# ----------------------------------------------------------------------------#
+# Serving.
+# ----------------------------------------------------------------------------#
+
+assets = Blueprint("assets", __name__)
+
+
+def load_manifest(app):
+    """
+    function for reading the manifest of the last build, None when there is none
+    """
+    path = os.path.join(app.static_folder, DIST, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def manifest():
+    state = current_app.extensions["assets"]
+    # re-read in debug mode, so a rebuild shows up without a restart
+    if state["manifest"] is None or current_app.debug:
+        state["manifest"] = load_manifest(current_app) or {}
+    return state["manifest"]
+
+
+def asset_url(name):
+    """
+    function for linking a static file, through its fingerprinted copy once built
+
+    Args:
+        name: path of the file under static/, e.g. 'img/front-splash.jpg'
+    """
+    hashed = manifest().get("files", {}).get(name)
+    if hashed is None:
+        return url_for("static", filename=name)
+    return url_for("assets.built", filename=hashed)
+
+
+def bundle_urls(bundle):
+    """
+    function for linking a bundle: the built file, or its sources without a build
+
+    Args:
+        bundle: name of an entry of 'BUNDLES', e.g. 'main.css'
+    """
+    hashed = manifest().get("bundles", {}).get(bundle)
+    if hashed is None:
+        return [url_for("static", filename=source) for source in BUNDLES[bundle]]
+    return [url_for("assets.built", filename=hashed)]
+
+
+def image_srcsets(name):
+    """
+    function for listing the responsive variants of an image
+
+    returns:
+        list of (mime type, srcset) pairs, best format first, empty without a build
+    """
+    variants = manifest().get("images", {}).get(name, {})
+    return [
+        ("image/" + ext, ", ".join("%s %dw" % (url_for("assets.built", filename=hashed), width)
+                                   for width, hashed in variants[ext]))
+        for ext, format, options in IMAGE_FORMATS if ext in variants
+    ]
+
+
+@assets.route("/assets/<path:filename>")
+def built(filename):
+    """
+    function for serving a built file, precompressed when the client accepts it
+    """
+    if filename == MANIFEST:
+        abort(404)
+    directory = os.path.join(current_app.static_folder, DIST)
+    served, encoding = filename, None
+    if filename.endswith(COMPRESSIBLE):
+        for candidate, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if candidate in request.accept_encodings and os.path.exists(
+                    os.path.join(directory, filename + suffix)):
+                served, encoding = filename + suffix, candidate
+                break
+
+    response = send_from_directory(directory, served, max_age=MAX_AGE, conditional=True)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+        response.mimetype = mimetype(filename)
+    if filename.endswith(COMPRESSIBLE):
+        response.vary.add("Accept-Encoding")
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def mimetype(filename):
+    return mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+
+def init_assets(app):
+    """
+    function for registering the asset routes, template helpers and build command
+    """
+    app.extensions["assets"] = {"manifest": None}
+    app.register_blueprint(assets)
+    app.jinja_env.globals.update(
+        asset_url=asset_url, bundle_urls=bundle_urls, image_srcsets=image_srcsets
+    )
+    app.cli.add_command(build_assets)
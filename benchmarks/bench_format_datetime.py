@@ -0,0 +1,53 @@
+"""
+Microbenchmark of the 'datetime' jinja filter, per show tile.
+
+Compares the original parse-then-format path with the filter on a cold cache
+(every tile a new time) and on a warm cache (re-rendering the same page).
+
+    python benchmarks/bench_format_datetime.py [number_of_tiles]
+"""
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from app import DATETIME_FORMATS, format_datetime, format_datetime_cached  # noqa: E402
+
+
+def original(value, format="medium"):
+    date = dateutil.parser.parse(value)
+    return babel.dates.format_datetime(date, DATETIME_FORMATS[format])
+
+
+def main():
+    tiles = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    start = datetime(2030, 1, 1, 20, 0)
+    times = [start + timedelta(hours=i) for i in range(tiles)]
+    strings = [str(t) for t in times]
+
+    def run_original():
+        for value in strings:
+            original(value, "full")
+
+    def run_cold():
+        format_datetime_cached.cache_clear()
+        for value in times:
+            format_datetime(value, "full")
+
+    def run_warm():
+        for value in times:
+            format_datetime(value, "full")
+
+    run_warm()
+    for name, fn in (("original", run_original), ("cold cache", run_cold), ("warm cache", run_warm)):
+        best = min(timeit.repeat(fn, number=1, repeat=5))
+        print("%-12s %8.2f us/tile" % (name, best / tiles * 1e6))
+
+
+if __name__ == "__main__":
+    main()
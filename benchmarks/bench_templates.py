@@ -0,0 +1,67 @@
+"""
+Microbenchmark of rendering the venue page, per show tile.
+
+Renders pages/show_venue.html for a synthetic venue with the fragment cache
+off, cold (every tile rendered and stored) and warm (re-rendering the same
+page), without touching the database.
+
+    python benchmarks/bench_templates.py [number_of_shows]
+"""
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from app import app  # noqa: E402
+from flask import render_template  # noqa: E402
+
+
+def venue(shows):
+    start = datetime(2030, 1, 1, 20, 0)
+    tiles = [{
+        "artist_id": i % 500 + 1,
+        "artist_name": "Artist %d" % (i % 500 + 1),
+        "artist_image_link": "https://img.example.com/artists/%d.jpg" % (i % 500 + 1),
+        "artist_version": 1,
+        "start_time": start + timedelta(hours=i),
+    } for i in range(shows)]
+    return {
+        "id": 1, "name": "The Musical Hop", "genres": ["Jazz", "Reggae"], "address": "1015 Folsom",
+        "city": "San Francisco", "state": "CA", "phone": "123-123-1234",
+        "website": "https://www.themusicalhop.com", "facebook_link": None,
+        "seeking_talent": True, "seeking_description": "We are looking for local artists",
+        "image_link": "https://img.example.com/venues/1.jpg", "version": 1,
+        "past_shows": [], "upcoming_shows": tiles,
+        "past_shows_count": 0, "upcoming_shows_count": shows,
+    }
+
+
+def main():
+    shows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    data = venue(shows)
+    env = app.jinja_env
+    backend = env.fragment_cache
+
+    with app.test_request_context("/venues/1"):
+        def render():
+            render_template("pages/show_venue.html", venue=data)
+
+        def run_off():
+            env.fragment_cache = None
+            render()
+            env.fragment_cache = backend
+
+        def run_cold():
+            backend.clear()
+            render()
+
+        render()
+        for name, fn in (("no cache", run_off), ("cold cache", run_cold), ("warm cache", render)):
+            best = min(timeit.repeat(fn, number=1, repeat=5))
+            print("%-12s %8.2f ms/page %8.2f us/tile" % (name, best * 1e3, best / shows * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Flag performance regressions in a load benchmark result.
+
+Checks a benchmarks/load.py result against absolute limits per route
+(thresholds.json) and, when a baseline result is given, against that run:
+a route regresses when its p95 latency grows by more than --tolerance or it
+issues more SQL statements per request than before. A route without a value
+for one of its limits, e.g. a statement count load.py could not read, fails.
+
+    python benchmarks/compare.py results.json --baseline baseline.json
+
+Exits with status 1 when any route regresses, so it can gate a deploy.
+"""
+import argparse
+import json
+import os
+import sys
+
+THRESHOLDS = os.path.join(os.path.dirname(__file__), "thresholds.json")
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def check_thresholds(routes, thresholds):
+    """
+    function for checking each route against its absolute limits
+
+    Args:
+        routes: 'routes' of a result
+        thresholds: dict of route name to limits ('p95_ms', 'p99_ms', 'queries_max',
+            'errors'), the '*' entry applying to routes without their own
+
+    returns:
+        list of problem descriptions
+    """
+    problems = []
+    for name, result in sorted(routes.items()):
+        limits = dict(thresholds.get("*", {}), **thresholds.get(name, {}))
+        for metric, limit in sorted(limits.items()):
+            value = result.get(metric)
+            if value is None:
+                problems.append("%s: no %s to check against the limit of %s" % (name, metric, limit))
+            elif value > limit:
+                problems.append("%s: %s %s over the limit of %s" % (name, metric, value, limit))
+    return problems
+
+
+def check_baseline(routes, baseline, tolerance):
+    """
+    function for comparing each route with the same route of a baseline run
+
+    returns:
+        list of problem descriptions
+    """
+    problems = []
+    for name, result in sorted(routes.items()):
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if result["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            problems.append("%s: p95 %.1fms, was %.1fms (+%.0f%%)" % (
+                name, result["p95_ms"], before["p95_ms"],
+                (result["p95_ms"] / before["p95_ms"] - 1) * 100))
+        if (result.get("queries_max") or 0) > (before.get("queries_max") or 0):
+            problems.append("%s: up to %s queries per request, was %s" % (
+                name, result["queries_max"], before["queries_max"]))
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("result")
+    parser.add_argument("--baseline", help="earlier result to compare with")
+    parser.add_argument("--thresholds", default=THRESHOLDS)
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed p95 growth over the baseline, 0.2 = 20%%")
+    args = parser.parse_args()
+
+    routes = load(args.result)["routes"]
+    problems = check_thresholds(routes, load(args.thresholds))
+    if args.baseline and os.path.exists(args.baseline):
+        problems += check_baseline(routes, load(args.baseline)["routes"], args.tolerance)
+
+    for problem in problems:
+        print(problem)
+    if problems:
+        sys.exit(1)
+    print("%d routes within thresholds" % len(routes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""
+Concurrent HTTP load benchmark of the app's routes.
+
+Drives every read route (and, with --writes, the create and edit forms) of a
+running server with a pool of keep-alive clients, one route at a time, and
+reports p50/p95/p99 latency, throughput and SQL statements per request. The
+statement count comes from the Server-Timing header the app sets on every
+response. Streamed responses send that header before their rows are fetched:
+the list pages carry their count in a Server-Timing comment at the end of the
+page instead, and for the other streamed routes (exports) it is read from the
+/metrics counters around a few extra requests sent one at a time, which
+needs a single-process server. A route whose count cannot be read gets none,
+and compare.py fails it.
+
+    flask run --with-threads &
+    python benchmarks/load.py --url http://localhost:5000 --output results.json
+
+Compare runs with benchmarks/compare.py. The delete routes are never driven,
+they would eat into the seeded dataset.
+"""
+import argparse
+import http.client
+import json
+import math
+import random
+import re
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from time import perf_counter
+from urllib.parse import urlencode, urlsplit
+
+QUERIES = re.compile(r'desc="(\d+) queries"')
+# the Server-Timing comment ending a streamed page
+TRAILER = re.compile(rb'<!-- Server-Timing: [^>]*desc="(\d+) queries" -->\s*$')
+METRIC_SAMPLE = re.compile(
+    r'^fyyur_sql_queries_per_request_(sum|count)\{endpoint="([^"]*)"\} (\S+)$', re.M)
+
+# name, method, path; {venue} and {artist} are replaced by ids of the dataset
+READ_ROUTES = [
+    ("index", "GET", "/"),
+    ("venues", "GET", "/venues"),
+    ("venues_genre", "GET", "/venues?genre=Jazz"),
+    ("search_venues", "GET", "/venues/search?search_term={term}"),
+    ("show_venue", "GET", "/venues/{venue}"),
+    ("edit_venue", "GET", "/venues/{venue}/edit"),
+    ("create_venue_form", "GET", "/venues/create"),
+    ("artists", "GET", "/artists"),
+    ("search_artists", "GET", "/artists/search?search_term={term}"),
+    ("show_artist", "GET", "/artists/{artist}"),
+    ("edit_artist", "GET", "/artists/{artist}/edit"),
+    ("create_artist_form", "GET", "/artists/create"),
+    ("shows", "GET", "/shows"),
+    ("create_shows", "GET", "/shows/create"),
+    ("export_venues", "GET", "/export/venues?format=ndjson"),
+    ("api_venues", "GET", "/api/v1/venues"),
+    ("api_venue", "GET", "/api/v1/venues/{venue}"),
+    ("api_artists", "GET", "/api/v1/artists"),
+    ("api_artist", "GET", "/api/v1/artists/{artist}"),
+    ("api_shows", "GET", "/api/v1/shows"),
+    ("cache_stats", "GET", "/cache/stats"),
+    ("pool_stats", "GET", "/pool/stats"),
+    ("metrics", "GET", "/metrics"),
+]
+
+WRITE_ROUTES = [
+    ("create_venue", "POST", "/venues/create"),
+    ("create_artist", "POST", "/artists/create"),
+    ("create_show", "POST", "/shows/create"),
+    ("edit_venue_submission", "POST", "/venues/{venue}/edit"),
+    ("edit_artist_submission", "POST", "/artists/{artist}/edit"),
+]
+
+SEARCH_TERMS = ["ka", "ven", "lux", "the", "rin", "tor hall", "zen", "mo"]
+
+
+class Client(object):
+    """
+    keep-alive HTTP connection of one load generator thread
+    """
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.connection = None
+
+    def request(self, method, path, body=None):
+        headers = {}
+        if body is not None:
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        for attempt in (1, 2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            try:
+                start = perf_counter()
+                self.connection.request(method, path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                data = response.read()
+                elapsed = perf_counter() - start
+                if response.getheader("Connection", "").lower() == "close":
+                    self.close()
+                return response.status, elapsed, response.getheader("Server-Timing", ""), data
+            except (http.client.HTTPException, OSError):
+                # the server dropped the idle connection, retry once on a new one
+                self.close()
+                if attempt == 2:
+                    raise
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def percentile(values, p):
+    """
+    function for reading the p-th percentile of a list of values, nearest rank
+    """
+    values = sorted(values)
+    if not values:
+        return None
+    return values[max(0, int(math.ceil(p / 100.0 * len(values))) - 1)]
+
+
+def query_count(timing, data):
+    """
+    function for reading the statement count of a response from its Server-Timing
+    header, or from the comment ending a streamed page
+
+    returns:
+        number of statements, None when the response carries neither
+    """
+    match = QUERIES.search(timing) or TRAILER.search(data[-200:])
+    return int(match.group(1)) if match else None
+
+
+def query_totals(client):
+    """
+    function for reading the statement counters of each endpoint from /metrics
+
+    returns:
+        dict of endpoint -> (statements, requests)
+    """
+    status, elapsed, timing, data = client.request("GET", "/metrics")
+    totals = {}
+    for kind, endpoint, value in METRIC_SAMPLE.findall(data.decode("utf-8")):
+        queries, requests = totals.get(endpoint, (0, 0))
+        if kind == "sum":
+            totals[endpoint] = (queries + float(value), requests)
+        else:
+            totals[endpoint] = (queries, requests + float(value))
+    return totals
+
+
+def probe_query_count(client, method, path, body):
+    """
+    function for counting the statements of one request from the /metrics
+    counters read before and after it, for streamed responses without a count
+
+    returns:
+        number of statements, None unless exactly one request was recorded in
+        between (another worker answered, or it was never recorded)
+    """
+    before = query_totals(client)
+    client.request(method, path, body)
+    after = query_totals(client)
+    changed = [(queries - before.get(endpoint, (0, 0))[0])
+               for endpoint, (queries, requests) in after.items()
+               if endpoint != "prometheus_metrics"
+               and requests - before.get(endpoint, (0, 0))[1] == 1]
+    return int(changed[0]) if len(changed) == 1 else None
+
+
+def dataset_ids(client, path):
+    status, elapsed, timing, data = client.request("GET", path)
+    if status != 200:
+        sys.exit("GET %s answered %d" % (path, status))
+    return [row["id"] for row in json.loads(data)["data"]]
+
+
+def form_body(name, rng, venue_ids, artist_ids):
+    if name == "create_show":
+        start_time = datetime.now() + timedelta(hours=rng.randint(1, 24 * 365))
+        fields = {"artist_id": rng.choice(artist_ids), "venue_id": rng.choice(venue_ids),
+                  "start_time": start_time.strftime("%Y-%m-%d %H:%M:%S")}
+    else:
+        fields = {"name": "Bench %d" % rng.randint(0, 10 ** 9), "city": "Austin", "state": "TX",
+                  "address": "1 Bench St", "phone": "512-555-0100", "genres": "Jazz",
+                  "website": "https://bench.example.com",
+                  "facebook_link": "https://www.facebook.com/bench",
+                  "image_link": "https://img.example.com/bench.jpg"}
+    return urlencode(fields)
+
+
+def run_route(url, route, requests, concurrency, venue_ids, artist_ids, seed, probes=3):
+    """
+    function for sending 'requests' requests to one route from 'concurrency' threads
+
+    returns:
+        dict of the route's latency percentiles (milliseconds), throughput and queries
+    """
+    name, method, template = route
+    rng = random.Random("%s:%s" % (seed, name))
+    calls = []
+    for _ in range(requests):
+        path = template.format(venue=rng.choice(venue_ids), artist=rng.choice(artist_ids),
+                               term=rng.choice(SEARCH_TERMS).replace(" ", "+"))
+        body = form_body(name, rng, venue_ids, artist_ids) if method == "POST" else None
+        calls.append((path, body))
+
+    local = threading.local()
+    clients = []
+    lock = threading.Lock()
+
+    def call(args):
+        if not hasattr(local, "client"):
+            local.client = Client(url)
+            with lock:
+                clients.append(local.client)
+        path, body = args
+        return local.client.request(method, path, body)
+
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(call, calls))
+    wall = perf_counter() - start
+    for client in clients:
+        client.close()
+
+    latencies = [result[1] * 1000 for result in results]
+    queries = [query_count(result[2], result[3]) for result in results]
+    if None in queries:
+        client = Client(url)
+        queries = [probe_query_count(client, method, path, body) for path, body in calls[:probes]]
+        client.close()
+    if None in queries:
+        queries = []
+    errors = sum(1 for result in results if result[0] >= 400)
+
+    return {
+        "method": method,
+        "path": template,
+        "requests": len(results),
+        "errors": errors,
+        "throughput": round(len(results) / wall, 2),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(max(latencies), 2),
+        "queries_mean": round(sum(queries) / float(len(queries)), 2) if queries else None,
+        "queries_max": max(queries) if queries else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--requests", type=int, default=200, help="requests per route")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=10, help="untimed requests per route")
+    parser.add_argument("--route", action="append", help="only run these routes (repeatable)")
+    parser.add_argument("--writes", action="store_true", help="also drive the create/edit forms")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", "-o", help="file to write the JSON results to")
+    args = parser.parse_args()
+
+    probe = Client(args.url)
+    venue_ids = dataset_ids(probe, "/api/v1/venues?limit=200&fields=id")
+    artist_ids = dataset_ids(probe, "/api/v1/artists?limit=200&fields=id")
+    probe.close()
+    if not venue_ids or not artist_ids:
+        sys.exit("no venues or artists to benchmark, seed with benchmarks/seed.py first")
+
+    routes = READ_ROUTES + (WRITE_ROUTES if args.writes else [])
+    if args.route:
+        routes = [r for r in routes if r[0] in args.route]
+
+    results = {}
+    for route in routes:
+        if args.warmup:
+            run_route(args.url, route, args.warmup, args.concurrency, venue_ids, artist_ids,
+                      args.seed)
+        result = run_route(args.url, route, args.requests, args.concurrency, venue_ids,
+                           artist_ids, args.seed)
+        results[route[0]] = result
+        print("%-24s %7.1f req/s  p50 %8.1fms  p95 %8.1fms  p99 %8.1fms  queries %s  errors %d"
+              % (route[0], result["throughput"], result["p50_ms"], result["p95_ms"],
+                 result["p99_ms"], result["queries_mean"], result["errors"]))
+
+    report = {
+        "meta": {
+            "url": args.url,
+            "commit": git_commit(),
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+        },
+        "routes": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
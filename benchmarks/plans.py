@@ -0,0 +1,174 @@
+"""
+Query plan regression check.
+
+Requests every read route in-process against a seeded PostgreSQL database,
+captures the SELECT statements each view emits and runs EXPLAIN on them with
+their bound parameters. A plan fails when it sequentially scans Shows, Artist
+or Venue while that table holds more than --min-rows rows: the detail-page
+show lookups, the searches and the keyset pagination must stay index backed.
+
+    python benchmarks/seed.py --reset
+    python benchmarks/plans.py [--min-rows 10000] [--verbose]
+
+Exits with status 1 when a plan regresses or a route fails.
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+# every request must reach the database
+os.environ["CACHE_BACKEND"] = "null"
+
+from app import app, db  # noqa: E402
+from sqlalchemy import event, text  # noqa: E402
+
+TABLES = ("Shows", "Artist", "Venue")
+
+# name, path; {venue}, {artist}, {venues_after}, {artists_after} and
+# {shows_after} are filled in from the dataset, {saturday} and {sunday} with
+# the coming weekend
+ROUTES = [
+    ("venues", "/venues"),
+    ("venues_page", "/venues?after={venues_after}"),
+    ("venues_genre", "/venues?genre=Jazz"),
+    ("search_venues", "/venues/search?search_term=ven"),
+    ("search_venues_typo", "/venues/search?search_term=Hal"),
+    ("show_venue", "/venues/{venue}"),
+    ("edit_venue", "/venues/{venue}/edit"),
+    ("artists", "/artists"),
+    ("artists_page", "/artists?after={artists_after}"),
+    ("artists_genre", "/artists?genre=Jazz"),
+    ("search_artists", "/artists/search?search_term=ka"),
+    ("show_artist", "/artists/{artist}"),
+    ("edit_artist", "/artists/{artist}/edit"),
+    ("shows", "/shows"),
+    ("shows_page", "/shows?after={shows_after}"),
+    ("shows_weekend", "/shows?from={saturday}&to={sunday}&city=Austin&state=TX"),
+    ("api_venue", "/api/v1/venues/{venue}"),
+    ("api_artist", "/api/v1/artists/{artist}"),
+]
+
+
+def capture(client, path):
+    """
+    function for requesting a path and collecting the SELECT statements it runs
+
+    returns:
+        tuple of (status code, list of (statement, parameters))
+    """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        response = client.get(path)
+        # streamed pages run their queries while the body is read
+        response.get_data()
+        status = response.status_code
+    except Exception as e:
+        # the app runs in debug mode, so view errors propagate instead of a 500
+        print("%s: %s" % (path, str(getattr(e, "orig", e)).strip()))
+        db.session.rollback()
+        status = 500
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+    return status, statements
+
+
+def scans(plan):
+    """
+    function for walking an EXPLAIN (FORMAT JSON) plan tree
+
+    returns:
+        generator of (node type, relation name) of every node scanning a relation
+    """
+    if "Relation Name" in plan:
+        yield plan["Node Type"], plan["Relation Name"]
+    for child in plan.get("Plans", []):
+        for scan in scans(child):
+            yield scan
+
+
+def explain(connection, statement, parameters):
+    row = connection.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+    plan = row if isinstance(row, list) else json.loads(row)
+    return plan[0]["Plan"]
+
+
+def table_rows(connection):
+    return dict(connection.execute(text(
+        "SELECT relname, reltuples::bigint FROM pg_class WHERE relname = ANY(:names)"
+    ), {"names": list(TABLES)}).all())
+
+
+def first_cursor(client, path):
+    response = client.get(path)
+    return response.get_json()["next"] or ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--min-rows", type=int, default=10000,
+                        help="tables smaller than this may be scanned sequentially")
+    parser.add_argument("--route", action="append", help="only check these routes (repeatable)")
+    parser.add_argument("--verbose", "-v", action="store_true", help="print every plan")
+    args = parser.parse_args()
+
+    client = app.test_client()
+    problems = []
+
+    saturday = date.today() + timedelta(days=(5 - date.today().weekday()) % 7)
+    with app.app_context():
+        venues = client.get("/api/v1/venues?limit=1&fields=id").get_json()["data"]
+        artists = client.get("/api/v1/artists?limit=1&fields=id").get_json()["data"]
+        if not venues or not artists:
+            sys.exit("no venues or artists to check, seed with benchmarks/seed.py first")
+        values = {
+            "venue": venues[0]["id"],
+            "artist": artists[0]["id"],
+            "venues_after": first_cursor(client, "/api/v1/venues?fields=id"),
+            "artists_after": first_cursor(client, "/api/v1/artists?fields=id"),
+            "shows_after": first_cursor(client, "/api/v1/shows?fields=id"),
+            "saturday": saturday.isoformat(),
+            "sunday": (saturday + timedelta(days=1)).isoformat(),
+        }
+
+        with db.engine.connect() as connection:
+            rows = table_rows(connection)
+            large = set(t for t in TABLES if rows.get(t, 0) >= args.min_rows)
+            print("tables checked: %s" % (", ".join(sorted(large)) or "none, dataset too small"))
+
+            for name, template in ROUTES:
+                if args.route and name not in args.route:
+                    continue
+                status, statements = capture(client, template.format(**values))
+                if status != 200:
+                    problems.append("%s: answered %d" % (name, status))
+                    continue
+
+                for statement, parameters in statements:
+                    plan = explain(connection, statement, parameters)
+                    seq_scans = sorted(set(relation for node, relation in scans(plan)
+                                           if node == "Seq Scan" and relation in large))
+                    if args.verbose or seq_scans:
+                        print("%s: %s\n  %s" % (name, " ".join(statement.split()),
+                                                ", ".join("%s on %s" % s for s in scans(plan))))
+                    for relation in seq_scans:
+                        problems.append("%s: sequential scan on %s (%d rows)"
+                                        % (name, relation, rows[relation]))
+                print("%-20s %d statements" % (name, len(statements)))
+
+    for problem in problems:
+        print(problem)
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Seed a synthetic benchmark dataset.
+
+Generates venues, artists and shows from a fixed random seed, so two runs with
+the same arguments produce the same rows, and loads them with PostgreSQL COPY.
+
+    python benchmarks/seed.py --venues 10000 --artists 50000 --shows 1000000 --reset
+
+Runs against DATABASE_URL, like the app. --reset empties the three tables
+first; without it the rows are appended after the existing ids.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from app import app, db  # noqa: E402
+from forms import VenueForm  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+
+GENRES = [value for value, label in VenueForm.genres.kwargs["choices"]]
+
+CITIES = [
+    ("San Francisco", "CA"), ("Los Angeles", "CA"), ("San Diego", "CA"), ("Seattle", "WA"),
+    ("Portland", "OR"), ("Austin", "TX"), ("Houston", "TX"), ("Dallas", "TX"),
+    ("Denver", "CO"), ("Chicago", "IL"), ("Detroit", "MI"), ("Minneapolis", "MN"),
+    ("Nashville", "TN"), ("Memphis", "TN"), ("New Orleans", "LA"), ("Atlanta", "GA"),
+    ("Miami", "FL"), ("New York", "NY"), ("Brooklyn", "NY"), ("Boston", "MA"),
+    ("Philadelphia", "PA"), ("Pittsburgh", "PA"), ("Baltimore", "MD"), ("Phoenix", "AZ"),
+]
+
+SYLLABLES = ["ka", "lo", "mi", "ra", "ven", "tor", "sil", "ban", "dre", "qui", "zen", "mo",
+             "lux", "fa", "nor", "pel", "shi", "ta", "vo", "rin"]
+
+# rows sent per COPY
+CHUNK = 50000
+
+
+def word(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).title()
+
+
+def copy_rows(cursor, table, columns, rows):
+    """
+    function for loading rows into a table with COPY, 'CHUNK' rows at a time
+    """
+    column_list = ", ".join('"%s"' % c for c in columns)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    count = 0
+
+    def flush():
+        buffer.seek(0)
+        cursor.copy_expert('COPY "%s" (%s) FROM STDIN WITH (FORMAT csv)' % (table, column_list),
+                           buffer)
+        buffer.seek(0)
+        buffer.truncate()
+
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count % CHUNK == 0:
+            flush()
+    flush()
+    return count
+
+
+def venue_rows(rng, first_id, count):
+    for venue_id in range(first_id, first_id + count):
+        city, state = rng.choice(CITIES)
+        yield (
+            venue_id, "The %s %s" % (word(rng), rng.choice(["Hall", "Room", "Club", "Lounge"])),
+            city, state, "%d %s St" % (rng.randint(1, 9999), word(rng)),
+            "%03d-%03d-%04d" % (rng.randint(200, 999), rng.randint(100, 999), rng.randint(0, 9999)),
+            json.dumps(rng.sample(GENRES, rng.randint(1, 3))),
+            "https://venue%d.example.com" % venue_id, rng.choice(["Yes", "No"]), "",
+            "https://img.example.com/venues/%d.jpg" % venue_id,
+            "https://www.facebook.com/venue%d" % venue_id,
+        )
+
+
+def artist_rows(rng, first_id, count):
+    for artist_id in range(first_id, first_id + count):
+        city, state = rng.choice(CITIES)
+        yield (
+            artist_id, "%s %s" % (word(rng), word(rng)), city, state,
+            "%03d-%03d-%04d" % (rng.randint(200, 999), rng.randint(100, 999), rng.randint(0, 9999)),
+            json.dumps(rng.sample(GENRES, rng.randint(1, 3))),
+            "https://artist%d.example.com" % artist_id, rng.choice(["Yes", "No"]), "",
+            "https://img.example.com/artists/%d.jpg" % artist_id,
+            "https://www.facebook.com/artist%d" % artist_id,
+        )
+
+
+def show_rows(rng, count, venue_ids, artist_ids, days):
+    # shows spread over the past and the coming 'days' days, on the hour
+    origin = datetime.now().replace(minute=0, second=0, microsecond=0)
+    for _ in range(count):
+        start_time = origin + timedelta(hours=rng.randint(-24 * days, 24 * days))
+        yield rng.randint(*artist_ids), rng.randint(*venue_ids), start_time.isoformat()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--venues", type=int, default=10000)
+    parser.add_argument("--artists", type=int, default=50000)
+    parser.add_argument("--shows", type=int, default=1000000)
+    parser.add_argument("--days", type=int, default=365, help="shows span +/- this many days")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="empty the tables first")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    start = perf_counter()
+
+    with app.app_context():
+        connection = db.session.connection()
+        if args.reset:
+            connection.execute(text('TRUNCATE "Shows", "Artist", "Venue" RESTART IDENTITY'))
+
+        first_venue = connection.execute(text('SELECT coalesce(max(id), 0) + 1 FROM "Venue"')).scalar()
+        first_artist = connection.execute(text('SELECT coalesce(max(id), 0) + 1 FROM "Artist"')).scalar()
+        cursor = connection.connection.dbapi_connection.cursor()
+
+        copy_rows(cursor, "Venue", ["id", "name", "city", "state", "address", "phone", "genres",
+                                    "website", "seeking_talent", "seeking_description",
+                                    "image_link", "facebook_link"],
+                  venue_rows(rng, first_venue, args.venues))
+        copy_rows(cursor, "Artist", ["id", "name", "city", "state", "phone", "genres", "website",
+                                     "seeking_venue", "seeking_description", "image_link",
+                                     "facebook_link"],
+                  artist_rows(rng, first_artist, args.artists))
+        copy_rows(cursor, "Shows", ["artist_id", "venue_id", "start_time"],
+                  show_rows(rng, args.shows,
+                            (first_venue, first_venue + args.venues - 1),
+                            (first_artist, first_artist + args.artists - 1), args.days))
+
+        for table in ("Venue", "Artist"):
+            connection.execute(text(
+                "SELECT setval(pg_get_serial_sequence('\"%s\"', 'id'), "
+                "(SELECT max(id) FROM \"%s\"))" % (table, table)
+            ))
+        db.session.commit()
+
+        # fresh statistics, so the plans match a long-lived database
+        with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text('ANALYZE "Venue", "Artist", "Shows"'))
+
+    print("seeded %d venues, %d artists, %d shows in %.1fs"
+          % (args.venues, args.artists, args.shows, perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
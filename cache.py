@@ -0,0 +1,409 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from functools import wraps
+from time import monotonic
+from flask import request, session, make_response
+from replicas import read_replica, sticky
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+# ----------------------------------------------------------------------------#
+# Backends.
+# ----------------------------------------------------------------------------#
+
+
+class LRUCache(object):
+    """
+    in-process cache with per-entry TTL and least recently used eviction once
+    'max_entries' is reached
+    """
+
+    # each process has its own: another process cannot invalidate its entries
+    shared = False
+
+    def __init__(self, max_entries=1024, default_ttl=60, clock=monotonic):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires <= self.clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        expires = self.clock() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def counter(self, key):
+        return self.get(key) or 0
+
+    def incr(self, key):
+        with self._lock:
+            value = self._entries.get(key, (0, None))[0] + 1
+            self._entries[key] = (value, None)
+            self._entries.move_to_end(key)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SharedCache(object):
+    """
+    cache shared by every worker, stored in a redis style server
+
+    'client' only needs the get, set (with 'ex'), delete and incr commands, so a
+    local stand-in can replace the server in tests
+    """
+
+    shared = True
+
+    def __init__(self, client, prefix="fyyur:", default_ttl=60):
+        self.client = client
+        self.prefix = prefix
+        self.default_ttl = default_ttl
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return None if value is None else pickle.loads(value)
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=ttl or None)
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+    def counter(self, key):
+        return int(self.client.get(self.prefix + key) or 0)
+
+    def incr(self, key):
+        return self.client.incr(self.prefix + key)
+
+
+class NullCache(object):
+    """
+    backend that never stores anything, for turning caching off
+    """
+
+    # no process holds a page to invalidate
+    shared = True
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+    def counter(self, key):
+        return 0
+
+    def incr(self, key):
+        return 0
+
+
+# ----------------------------------------------------------------------------#
+# Response cache.
+# ----------------------------------------------------------------------------#
+
+
+class ResponseCache(object):
+    """
+    read-through cache of rendered pages
+
+    Every page is cached under a name, e.g. 'venues' or 'venue:1'. Variants of the
+    same page (query strings) are stored under the current generation of that
+    name, so invalidating a name is a single counter increment that drops all of
+    its variants at once.
+
+    With read replicas, pages rendered from a replica are not stored: it may not
+    have replayed the write that invalidated the page yet, and the stale page
+    would be cached under the new generation. A client that just wrote skips the
+    cache, so it reads its own writes from the primary.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _generation(self, name):
+        return self.backend.counter("gen:" + name)
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def cached(self, name, ttl=None):
+        """
+        decorator for caching the 200 responses of a view; streamed responses are
+        cached once they have been sent in full
+
+        Args:
+            name: cache name of the page, or a function building it from the view arguments
+            ttl: seconds to keep the page, defaults to the backend's TTL
+        """
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.cacheable():
+                    return view(*args, **kwargs)
+
+                key = self.key(name(**kwargs) if callable(name) else name)
+                response = self.get(key)
+                if response is None:
+                    response = self.set(key, make_response(view(*args, **kwargs)), ttl)
+                return response
+
+            return wrapper
+
+        return decorator
+
+    def cacheable(self):
+        # pages carrying flashed messages are specific to one visitor
+        return request.method == "GET" and not session.get("_flashes") and not sticky()
+
+    def key(self, page):
+        """
+        function for building the cache key of the current request's variant of a page
+        """
+        return "page:%s:%s:%s" % (page, self._generation(page), request.full_path)
+
+    def get(self, key):
+        """
+        function for looking up a cached page
+
+        returns:
+            'Response' object, None on a miss
+        """
+        cached = self.backend.get(key)
+        self._count(cached is not None)
+        if cached is None:
+            return None
+        body, content_type = cached
+        response = make_response(body)
+        response.content_type = content_type
+        return response
+
+    def set(self, key, response, ttl=None):
+        """
+        function for caching a response if it is a 200 not read from a replica;
+        streamed responses are cached once they have been sent in full
+
+        returns:
+            the response, to send on
+        """
+        # picks the replica of a streamed page, whose queries have not run yet
+        if response.status_code == 200 and read_replica() is None:
+            if response.is_streamed:
+                response.response = self._store_when_sent(
+                    response.response, response.content_type, key, ttl)
+            else:
+                self.backend.set(key, (response.get_data(), response.content_type), ttl)
+        return response
+
+    def _store_when_sent(self, chunks, content_type, key, ttl):
+        """
+        generator for passing a streamed body through to the client and caching it
+        once the last chunk is sent; bodies that fail or whose client goes away
+        before the end are not cached
+        """
+        body = []
+        try:
+            for chunk in chunks:
+                body.append(chunk if isinstance(chunk, bytes) else chunk.encode("utf-8"))
+                yield chunk
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+        self.backend.set(key, (b"".join(body), content_type), ttl)
+
+    def invalidate(self, *names):
+        """
+        function for dropping every cached variant of the given page names
+        """
+        for page in set(names):
+            self.backend.incr("gen:" + page)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def make_backend(app, max_entries, ttl, prefix="fyyur:"):
+    """
+    function for building a cache backend of the kind set by 'CACHE_BACKEND'
+
+    Args:
+        max_entries: size of an in-process cache
+        ttl: default seconds to keep entries
+        prefix: namespace of the keys in a shared cache
+    """
+    kind = app.config.get("CACHE_BACKEND", "lru")
+
+    if kind == "lru":
+        return LRUCache(max_entries=max_entries, default_ttl=ttl)
+    elif kind == "redis":
+        import redis
+
+        client = redis.Redis.from_url(app.config["CACHE_REDIS_URL"])
+        return SharedCache(client, prefix=prefix, default_ttl=ttl)
+    elif kind == "null":
+        return NullCache()
+    raise ValueError("unknown CACHE_BACKEND %r" % kind)
+
+
+def init_cache(app):
+    """
+    function for building the response cache from the 'CACHE_*' settings
+
+    returns:
+        'ResponseCache' object
+    """
+    backend = make_backend(app, app.config.get("CACHE_MAX_ENTRIES", 1024),
+                           app.config.get("CACHE_DEFAULT_TTL", 60))
+
+    response_cache = ResponseCache(backend)
+    app.extensions["response_cache"] = response_cache
+    init_template_cache(app)
+    return response_cache
+
+
+def command_cache(app):
+    """
+    function for getting the response cache a CLI command invalidates the pages
+    it changed in
+
+    A command runs in a process of its own, so it only reaches the web workers'
+    pages through a cache they share ('CACHE_BACKEND=redis'). With the
+    per-process LRU cache it warns that they keep serving the cached pages until
+    'CACHE_DEFAULT_TTL' expires them.
+
+    returns:
+        'ResponseCache' object, None when the command cannot invalidate the workers' pages
+    """
+    response_cache = app.extensions.get("response_cache")
+    if response_cache is None:
+        return None
+    if not response_cache.backend.shared:
+        app.logger.warning(
+            "CACHE_BACKEND=%s is per process, this command cannot invalidate the pages "
+            "the web workers cached; they refresh within CACHE_DEFAULT_TTL (%ss)",
+            app.config.get("CACHE_BACKEND", "lru"), app.config.get("CACHE_DEFAULT_TTL", 60))
+        return None
+    return response_cache
+
+
+# ----------------------------------------------------------------------------#
+# Template caches.
+# ----------------------------------------------------------------------------#
+
+
+class FragmentCacheExtension(Extension):
+    """
+    '{% cache name, key... %}...{% endcache %}' tag, caching the rendered body
+
+    The key should hold the ids and versions of everything the fragment shows,
+    e.g. '{% cache "artist-tile", show.artist_id, show.artist_version %}', so an
+    edit changes the key instead of requiring an invalidation.
+    """
+
+    tags = {"cache"}
+
+    def __init__(self, environment):
+        super(FragmentCacheExtension, self).__init__(environment)
+        environment.extend(fragment_cache=None, fragment_cache_ttl=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(["name:endcache"], drop_needle=True)
+        call = self.call_method("_render", [nodes.List(parts)])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render(self, parts, caller):
+        backend = self.environment.fragment_cache
+        if backend is None:
+            return caller()
+
+        key = "fragment:" + ":".join(str(part) for part in parts)
+        body = backend.get(key)
+        if body is None:
+            body = str(caller())
+            backend.set(key, body, self.environment.fragment_cache_ttl)
+        return Markup(body)
+
+
+def fingerprint(rows, *fields):
+    """
+    function for summarizing what a list of rows shows, as part of a fragment key
+
+    Args:
+        rows: list of dicts, e.g. the upcoming shows of a venue
+        fields: keys that identify the content of a row, e.g. its ids and versions
+
+    returns:
+        hex digest, changing whenever a row is added, removed or changes version
+    """
+    digest = hashlib.sha1()
+    for row in rows:
+        digest.update(("|".join([str(row[field]) for field in fields]) + "\n").encode("utf-8"))
+    return digest.hexdigest()
+
+
+def init_template_cache(app):
+    """
+    function for setting up the Jinja bytecode cache and the '{% cache %}' fragment cache
+    from the 'JINJA_BYTECODE_CACHE_DIR' and 'FRAGMENT_CACHE_*' settings
+    """
+    directory = app.config.get("JINJA_BYTECODE_CACHE_DIR")
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        # compiled templates are keyed by the checksum of their source, so an
+        # edited template is recompiled
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.filters["fingerprint"] = fingerprint
+    app.jinja_env.fragment_cache = make_backend(
+        app, app.config.get("FRAGMENT_CACHE_MAX_ENTRIES", 50000),
+        app.config.get("FRAGMENT_CACHE_TTL", 3600), prefix="fyyur:fragment:")
+    app.jinja_env.fragment_cache_ttl = app.config.get("FRAGMENT_CACHE_TTL", 3600)
@@ -0,0 +1,182 @@
+import sys
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import text
+
+from cache import command_cache
+from models import db
+
+# ----------------------------------------------------------------------------#
+# Show counters.
+# ----------------------------------------------------------------------------#
+# Venue and Artist carry upcoming_shows_count and past_shows_count. Triggers on
+# "Shows" keep them in step with every insert, update and delete, in the same
+# transaction. A show counts as upcoming when it starts after the time held by
+# the "ShowCounters" row, which 'flask counters rollover' moves forward,
+# shifting the shows that started meanwhile from upcoming to past:
+#
+#     */5 * * * *  flask counters rollover
+#     0 4 * * *    flask counters check --repair
+
+COUNTED = (("Venue", "venue_id"), ("Artist", "artist_id"))
+
+# the cached listing and detail pages of each counted table
+PAGES = {"Venue": ("venues", "venue"), "Artist": ("artists", "artist")}
+
+ROLLOVER = '''
+    UPDATE "{table}" t
+    SET upcoming_shows_count = t.upcoming_shows_count - d.started,
+        past_shows_count = t.past_shows_count + d.started
+    FROM (
+        SELECT {column}, count(*) AS started
+        FROM "Shows"
+        WHERE start_time > :as_of AND start_time <= :now
+        GROUP BY {column}
+    ) d
+    WHERE t.id = d.{column}
+    RETURNING t.id
+'''
+
+EXPECTED = '''
+    SELECT t.id,
+           t.upcoming_shows_count, t.past_shows_count,
+           coalesce(d.upcoming, 0) AS upcoming, coalesce(d.past, 0) AS past
+    FROM "{table}" t
+    LEFT JOIN (
+        SELECT {column},
+               count(*) FILTER (WHERE start_time > :as_of) AS upcoming,
+               count(*) FILTER (WHERE start_time <= :as_of) AS past
+        FROM "Shows"
+        GROUP BY {column}
+    ) d ON d.{column} = t.id
+    WHERE t.upcoming_shows_count <> coalesce(d.upcoming, 0)
+       OR t.past_shows_count <> coalesce(d.past, 0)
+'''
+
+REPAIR = '''
+    UPDATE "{table}" t
+    SET upcoming_shows_count = e.upcoming, past_shows_count = e.past
+    FROM ({expected}) e
+    WHERE t.id = e.id
+'''
+
+
+def lock_as_of(connection):
+    """
+    function for locking the counters' watermark, waiting for the transactions
+    writing shows against it
+
+    returns:
+        the 'as_of' time
+    """
+    return connection.execute(
+        text('SELECT as_of FROM "ShowCounters" WHERE id = 1 FOR UPDATE')
+    ).scalar()
+
+
+def counter_pages(table, ids):
+    """
+    function for listing the cached pages showing the counters of rows of 'table'
+
+    returns:
+        list of cache names: the listing and the page of each row, none without rows
+    """
+    listing, page = PAGES[table]
+    return [listing] + ["%s:%s" % (page, entity_id) for entity_id in ids] if ids else []
+
+
+def rollover(now=None):
+    """
+    function for moving the counters forward to 'now': the shows that started
+    since the last roll-over go from upcoming to past
+
+    returns:
+        tuple of (previous as_of, new as_of, list of the cached pages showing
+        the counters that moved)
+    """
+    now = now or datetime.now()
+    connection = db.session.connection()
+    as_of = lock_as_of(connection)
+    pages = []
+    if now > as_of:
+        for table, column in COUNTED:
+            moved = connection.execute(text(ROLLOVER.format(table=table, column=column)),
+                                       {"as_of": as_of, "now": now}).scalars().all()
+            pages += counter_pages(table, moved)
+        connection.execute(text('UPDATE "ShowCounters" SET as_of = :now WHERE id = 1'),
+                           {"now": now})
+    db.session.commit()
+    return as_of, max(as_of, now), pages
+
+
+def check(repair=False):
+    """
+    function for comparing the counters with a recount of the shows
+
+    Args:
+        repair: overwrite the counters that drifted with the recount
+
+    returns:
+        dict of table -> list of (id, upcoming count, past count, recounted upcoming,
+        recounted past) of the rows that drifted
+    """
+    connection = db.session.connection()
+    # locked even when only checking, so no writer moves a counter mid-count
+    as_of = lock_as_of(connection)
+
+    drift = {}
+    for table, column in COUNTED:
+        expected = EXPECTED.format(table=table, column=column)
+        drift[table] = [tuple(row) for row in connection.execute(text(expected), {"as_of": as_of})]
+        if repair and drift[table]:
+            connection.execute(text(REPAIR.format(table=table, expected=expected)),
+                               {"as_of": as_of})
+    db.session.commit()
+    return drift
+
+
+def invalidate(pages):
+    """
+    function for invalidating the pages whose counters a command changed, when
+    the web workers' cache can be reached from here, see 'command_cache'
+    """
+    if pages:
+        response_cache = command_cache(current_app)
+        if response_cache is not None:
+            response_cache.invalidate(*pages)
+
+
+counters = AppGroup("counters", help="Maintain the upcoming/past show counters.")
+
+
+@counters.command("rollover")
+def rollover_command():
+    """
+    Move the shows that started since the last run from upcoming to past.
+    """
+    previous, as_of, pages = rollover()
+    click.echo("counters rolled over from %s to %s" % (previous, as_of))
+    invalidate(pages)
+
+
+@counters.command("check")
+@click.option("--repair", is_flag=True, help="overwrite the counters that drifted")
+def check_command(repair):
+    """
+    Recount the shows of every venue and artist and report the counters that drifted.
+    """
+    drift = check(repair=repair)
+    for table, rows in sorted(drift.items()):
+        for entity_id, upcoming_count, past_count, upcoming, past in rows:
+            click.echo("%s %d: upcoming %d (recounted %d), past %d (recounted %d)"
+                       % (table, entity_id, upcoming_count, upcoming, past_count, past))
+        click.echo("%s: %d drifted%s" % (table, len(rows), ", repaired" if repair and rows else ""))
+
+    if repair:
+        invalidate([page for table, rows in drift.items()
+                    for page in counter_pages(table, [row[0] for row in rows])])
+    if any(drift.values()) and not repair:
+        sys.exit(1)
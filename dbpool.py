@@ -0,0 +1,135 @@
+import threading
+from time import perf_counter
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool, QueuePool
+
+# ----------------------------------------------------------------------------#
+# Connection pool.
+# ----------------------------------------------------------------------------#
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool that records how long requests wait to check out a connection
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(TimedQueuePool, self).__init__(*args, **kwargs)
+        self._wait_lock = threading.Lock()
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _do_get(self):
+        start = perf_counter()
+        try:
+            return super(TimedQueuePool, self)._do_get()
+        finally:
+            waited = perf_counter() - start
+            with self._wait_lock:
+                self.waits += 1
+                self.wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+
+def engine_options(config):
+    """
+    function for building the SQLAlchemy engine options from the 'DB_*' settings
+
+    With 'DB_PGBOUNCER' set, PgBouncer (transaction pooling) owns the pool, so
+    connections are not pooled here and no startup parameters are sent.
+
+    returns:
+        dict suitable for 'SQLALCHEMY_ENGINE_OPTIONS'
+    """
+    if config.get("DB_PGBOUNCER"):
+        return {"poolclass": NullPool}
+
+    options = {
+        "poolclass": TimedQueuePool,
+        "pool_size": config.get("DB_POOL_SIZE", 5),
+        "max_overflow": config.get("DB_MAX_OVERFLOW", 10),
+        "pool_timeout": config.get("DB_POOL_TIMEOUT", 30),
+        "pool_recycle": config.get("DB_POOL_RECYCLE", 1800),
+        "pool_pre_ping": config.get("DB_POOL_PRE_PING", True),
+    }
+    if config.get("DB_STATEMENT_TIMEOUT"):
+        options["connect_args"] = {
+            "options": "-c statement_timeout=%d" % config["DB_STATEMENT_TIMEOUT"]
+        }
+    return options
+
+
+def async_database_url(uri):
+    """
+    function for pointing a PostgreSQL database URI at the asyncpg driver
+    """
+    return make_url(uri).set(drivername="postgresql+asyncpg")
+
+
+def async_engine_options(config):
+    """
+    function for building the options of the async mode's engine from the 'DB_*'
+    settings, as 'engine_options' does for the synchronous one
+
+    asyncpg caches prepared statements per connection, which PgBouncer transaction
+    pooling breaks, so the cache is turned off behind it.
+    """
+    if config.get("DB_PGBOUNCER"):
+        return {"poolclass": NullPool, "connect_args": {"statement_cache_size": 0}}
+
+    options = {
+        "pool_size": config.get("DB_POOL_SIZE", 5),
+        "max_overflow": config.get("DB_MAX_OVERFLOW", 10),
+        "pool_timeout": config.get("DB_POOL_TIMEOUT", 30),
+        "pool_recycle": config.get("DB_POOL_RECYCLE", 1800),
+        "pool_pre_ping": config.get("DB_POOL_PRE_PING", True),
+    }
+    if config.get("DB_STATEMENT_TIMEOUT"):
+        options["connect_args"] = {
+            "server_settings": {"statement_timeout": str(config["DB_STATEMENT_TIMEOUT"])}
+        }
+    return options
+
+
+def install_statement_timeout(engine, timeout):
+    """
+    function for applying the statement timeout per transaction, for PgBouncer
+    transaction pooling where session settings do not stick to a client
+
+    Args:
+        engine: SQLAlchemy engine
+        timeout: statement timeout in milliseconds
+    """
+
+    @event.listens_for(engine, "begin")
+    def set_statement_timeout(conn):
+        conn.exec_driver_sql("SET LOCAL statement_timeout = %d" % timeout)
+
+
+def pool_stats(engine):
+    """
+    function for reading the live statistics of an engine's connection pool
+
+    returns:
+        dict with the pool size, checked out / idle connections, overflow and checkout waits
+    """
+    pool = engine.pool
+    stats = {"pool": type(pool).__name__}
+
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": pool._max_overflow,
+        })
+    if isinstance(pool, TimedQueuePool):
+        stats.update({
+            "waits": pool.waits,
+            "wait_seconds_total": round(pool.wait_seconds, 6),
+            "wait_seconds_max": round(pool.max_wait_seconds, 6),
+        })
+    return stats
@@ -0,0 +1,119 @@
+import csv
+import io
+import json
+import sys
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+
+from models import db, Venue, Artist, Shows
+
+# ----------------------------------------------------------------------------#
+# Streaming export.
+# ----------------------------------------------------------------------------#
+
+# rows fetched from the server-side cursor at a time
+BATCH_SIZE = 1000
+
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def export_query(kind):
+    """
+    function for building the query of an export, in primary key order
+
+    Args:
+        kind: 'artists', 'venues' or 'shows'
+    """
+    if kind == "shows":
+        columns = [Shows.id, Shows.artist_id, Shows.venue_id, Shows.start_time, Shows.end_time]
+    elif kind == "artists":
+        columns = [Artist.id, Artist.name, Artist.city, Artist.state, Artist.phone, Artist.genres,
+                   Artist.website, Artist.image_link, Artist.facebook_link, Artist.seeking_venue,
+                   Artist.seeking_description]
+    elif kind == "venues":
+        columns = [Venue.id, Venue.name, Venue.city, Venue.state, Venue.address, Venue.phone,
+                   Venue.genres, Venue.website, Venue.image_link, Venue.facebook_link,
+                   Venue.seeking_talent, Venue.seeking_description]
+    else:
+        raise ValueError("unknown export %r" % kind)
+    return db.session.query(*columns).order_by(columns[0])
+
+
+def iter_rows(kind):
+    """
+    function for streaming the rows of an export through a server-side cursor, so
+    only 'BATCH_SIZE' rows are held in memory at any time
+    """
+    return export_query(kind).yield_per(BATCH_SIZE)
+
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError("%r is not JSON serializable" % (value,))
+
+
+def iter_csv(kind):
+    """
+    function for streaming an export as CSV, the header line first. Genres are
+    written ';' separated, as 'flask import-data' reads them.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    writer.writerow([c["name"] for c in export_query(kind).column_descriptions])
+    yield flush()
+
+    for count, row in enumerate(iter_rows(kind), 1):
+        writer.writerow([";".join(v) if isinstance(v, list) else v for v in row])
+        if count % BATCH_SIZE == 0:
+            yield flush()
+    yield flush()
+
+
+def iter_ndjson(kind):
+    """
+    function for streaming an export as newline delimited JSON, one object per row
+    """
+    lines = []
+    for row in iter_rows(kind):
+        lines.append(json.dumps(row._asdict(), default=_json_value))
+        if len(lines) == BATCH_SIZE:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def iter_export(kind, format):
+    return iter_csv(kind) if format == "csv" else iter_ndjson(kind)
+
+
+@click.command("export-data")
+@click.argument("kind", type=click.Choice(["artists", "shows", "venues"]))
+@click.option("--format", "format", type=click.Choice(sorted(FORMATS)), default="csv",
+              show_default=True)
+@click.option("--output", "-o", default="-", help="file to write, stdout by default")
+@with_appcontext
+def export_data(kind, format, output):
+    """
+    Stream all artists, venues or shows as CSV or NDJSON.
+    """
+    f = sys.stdout if output == "-" else open(output, "w", newline="", encoding="utf-8")
+    try:
+        for chunk in iter_export(kind, format):
+            f.write(chunk)
+    finally:
+        if f is not sys.stdout:
+            f.close()
@@ -4,12 +4,20 @@ from fabric.contrib.console import confirm
 # prepare for deployment
 
 
+def bench(url="http://localhost:5000", output="benchmarks/results.json",
+          baseline="benchmarks/baseline.json"):
+    local("python benchmarks/load.py --url {} --output {}".format(url, output))
+    local("python benchmarks/compare.py {} --baseline {}".format(output, baseline))
+
+
+def plans():
+    local("python benchmarks/plans.py")
+
+
 def test():
     with settings(warn_only=True):
-        result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
-        )
-    if result.failed and not confirm("Tests failed. Continue?"):
+        result = local("python -m compileall -q . && fab plans && fab bench", capture=True)
+    if result.failed and not confirm("Benchmarks regressed. Continue?"):
         abort("Aborted at user request.")
 
 
@@ -39,9 +47,7 @@ def heroku():
 
 
 def heroku_test():
-    local(
-        "heroku run python test_tasks.py -v && heroku run python test_users.py -v"
-    )
+    local("heroku run python -m compileall -q .")
 
 
 def deploy():
@@ -10,6 +10,7 @@ class ShowForm(Form):
     start_time = DateTimeField(
         "start_time", validators=[DataRequired()], default=datetime.today()
     )
+    end_time = DateTimeField("end_time")
 
 
 class VenueForm(Form):
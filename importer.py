@@ -0,0 +1,303 @@
+import csv
+import io
+import json
+import os
+import sys
+from datetime import datetime
+from itertools import islice
+from time import perf_counter
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import text
+
+from cache import command_cache
+from models import db, Venue, Artist, Shows
+from queries import default_end_time
+
+# ----------------------------------------------------------------------------#
+# Bulk import.
+# ----------------------------------------------------------------------------#
+
+# table, imported columns, natural key of each kind of record, the key columns
+# a record must have, and the columns of a written row naming the artist and
+# venue pages it shows on
+KINDS = {
+    "artists": {
+        "table": Artist.__table__,
+        "columns": ["name", "city", "state", "phone", "genres", "website", "image_link",
+                    "facebook_link", "seeking_venue", "seeking_description"],
+        "key": ["name", "city", "state"],
+        "required": ["name"],
+        "pages": {"artist": "id"},
+    },
+    "venues": {
+        "table": Venue.__table__,
+        "columns": ["name", "city", "state", "address", "phone", "genres", "website", "image_link",
+                    "facebook_link", "seeking_talent", "seeking_description"],
+        "key": ["name", "city", "state"],
+        "required": ["name", "city", "state"],
+        "pages": {"venue": "id"},
+    },
+    "shows": {
+        "table": Shows.__table__,
+        "columns": ["artist_id", "venue_id", "start_time", "end_time"],
+        "key": ["artist_id", "venue_id", "start_time"],
+        "required": ["artist_id", "venue_id", "start_time"],
+        "pages": {"artist": "artist_id", "venue": "venue_id"},
+    },
+}
+
+# the listings showing each kind of record: the shows listing shows artist and
+# venue names, the artist and venue listings count shows
+LISTINGS = {
+    "artists": ["artists", "shows"],
+    "venues": ["venues", "shows"],
+    "shows": ["venues", "artists", "shows"],
+}
+
+
+def read_records(path, format):
+    """
+    function for streaming the records of a CSV or JSONL file, one dict at a time
+
+    Args:
+        path: file to read, '-' for stdin
+        format: 'csv' or 'jsonl'
+    """
+    f = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+    try:
+        if format == "csv":
+            for record in csv.DictReader(f):
+                yield record
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def normalize(record, columns, required=()):
+    """
+    function for turning a raw record into the column values of a row
+
+    genres may be a list (JSONL), a JSON array or a ';' separated string (CSV).
+    A show without an end time ends 'SHOW_DEFAULT_HOURS' after its start, like
+    the shows booked through the site. Raises ValueError when a 'required'
+    column is missing.
+    """
+    row = {}
+    for column in columns:
+        value = record.get(column)
+        if value == "":
+            value = None
+        if column == "genres":
+            if isinstance(value, str):
+                value = json.loads(value) if value.startswith("[") else value.split(";")
+            value = json.dumps(value or [])
+        elif column in ("start_time", "end_time") and isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        elif column in ("artist_id", "venue_id") and value is not None:
+            value = int(value)
+        if value is None and column in required:
+            raise ValueError("record without %s" % column)
+        row[column] = value
+    if "end_time" in row and row["end_time"] is None:
+        # a NULL end time would leave the show out of the double booking constraints
+        row["end_time"] = default_end_time(row["start_time"])
+    return row
+
+
+def quote(name):
+    return '"%s"' % name
+
+
+def key_matches(spec):
+    """
+    function for building the condition matching a staged row 's' to a row 't'
+    of the target table with the same natural key
+
+    Required key columns are compared with '=', which the natural key indexes
+    serve; IS NOT DISTINCT FROM would turn the match into a scan of the whole
+    table per staged row. Only the optional ones also match when both are NULL.
+    """
+    matches = []
+    for c in spec["key"]:
+        match = "t.%s = s.%s" % (quote(c), quote(c))
+        if c not in spec["required"]:
+            match = "(%s OR (t.%s IS NULL AND s.%s IS NULL))" % (match, quote(c), quote(c))
+        matches.append(match)
+    return " AND ".join(matches)
+
+
+def load_staging(connection, columns, rows):
+    """
+    function for loading a batch into the 'import_staging' table, with COPY when
+    the driver supports it and a single executemany otherwise
+    """
+    cursor = connection.connection.dbapi_connection.cursor()
+    column_list = ", ".join(quote(c) for c in columns)
+
+    if hasattr(cursor, "copy_expert"):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([row[c] for c in columns])
+        buffer.seek(0)
+        cursor.copy_expert(
+            "COPY import_staging (%s) FROM STDIN WITH (FORMAT csv)" % column_list, buffer
+        )
+    else:
+        connection.execute(
+            text("INSERT INTO import_staging (%s) VALUES (%s)"
+                 % (column_list, ", ".join(":" + c for c in columns))),
+            rows,
+        )
+
+
+def batch_pages(connection, kind, written):
+    """
+    function for listing the cached pages showing the rows a batch wrote: the
+    listings, their artist and venue pages, and the pages of the venues the
+    written artists play at and of the artists playing at the written venues
+
+    Args:
+        written: rows returned by the batch's statements, with the 'pages' columns
+
+    returns:
+        set of cache names
+    """
+    ids = {page: {row._mapping[column] for row in written}
+           for page, column in KINDS[kind]["pages"].items()}
+    if kind == "artists":
+        ids["venue"] = set(connection.execute(text(
+            'SELECT DISTINCT venue_id FROM "Shows" WHERE artist_id = ANY(:ids)'
+        ), {"ids": list(ids["artist"])}).scalars())
+    elif kind == "venues":
+        ids["artist"] = set(connection.execute(text(
+            'SELECT DISTINCT artist_id FROM "Shows" WHERE venue_id = ANY(:ids)'
+        ), {"ids": list(ids["venue"])}).scalars())
+
+    pages = set(LISTINGS[kind]) if written else set()
+    for page, page_ids in ids.items():
+        pages.update("%s:%s" % (page, page_id) for page_id in page_ids)
+    return pages
+
+
+def import_batch(kind, rows, upsert):
+    """
+    function for writing one batch of rows in a single transaction
+
+    The batch is staged in a temporary table, then merged into the target table
+    with set based statements: matching natural keys are updated when upserting,
+    the rest inserted once per key.
+
+    returns:
+        tuple of (number of rows written, set of the cached pages showing them)
+    """
+    spec = KINDS[kind]
+    table, columns, key = quote(spec["table"].name), spec["columns"], spec["key"]
+    column_list = ", ".join(quote(c) for c in columns)
+    matches = key_matches(spec)
+    returning = sorted(set(spec["pages"].values()))
+
+    connection = db.session.connection()
+    connection.execute(text(
+        "CREATE TEMP TABLE import_staging ON COMMIT DROP AS "
+        "SELECT %s FROM %s WITH NO DATA" % (column_list, table)
+    ))
+    load_staging(connection, columns, rows)
+
+    written = []
+    if upsert:
+        updates = ", ".join("%s = s.%s" % (quote(c), quote(c)) for c in columns if c not in key)
+        if updates and "version" in spec["table"].c:
+            updates += ', "version" = t."version" + 1'
+        if updates:
+            written += connection.execute(text(
+                "UPDATE %s t SET %s FROM import_staging s WHERE %s RETURNING %s"
+                % (table, updates, matches, ", ".join("t." + quote(c) for c in returning))
+            )).all()
+        duplicate = "WHERE NOT EXISTS (SELECT 1 FROM %s t WHERE %s)" % (table, matches)
+    else:
+        duplicate = ""
+
+    written += connection.execute(text(
+        "INSERT INTO %s (%s) SELECT DISTINCT ON (%s) %s FROM import_staging s %s RETURNING %s"
+        % (table, column_list, ", ".join("s." + quote(c) for c in key), column_list, duplicate,
+           ", ".join(quote(c) for c in returning))
+    )).all()
+    pages = batch_pages(connection, kind, written)
+    db.session.commit()
+    return len(written), pages
+
+
+def read_checkpoint(path):
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f).get("records", 0)
+    return 0
+
+
+def write_checkpoint(path, records):
+    if path:
+        with open(path + ".tmp", "w") as f:
+            json.dump({"records": records}, f)
+        os.replace(path + ".tmp", path)
+
+
+@click.command("import-data")
+@click.argument("kind", type=click.Choice(sorted(KINDS)))
+@click.argument("path")
+@click.option("--format", "format", type=click.Choice(["csv", "jsonl"]), default=None,
+              help="input format, guessed from the file extension by default")
+@click.option("--batch-size", default=5000, show_default=True, help="records per transaction")
+@click.option("--checkpoint", default=None,
+              help="file recording progress; an interrupted import resumes from it")
+@click.option("--upsert/--no-upsert", default=True, show_default=True,
+              help="update records whose natural key already exists instead of adding them again")
+@click.option("--stop-on-error", is_flag=True, help="abort at the first failing batch")
+@with_appcontext
+def import_data(kind, path, format, batch_size, checkpoint, upsert, stop_on_error):
+    """
+    Bulk load artists, venues or shows from a CSV or JSONL file.
+    """
+    format = format or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+    columns = KINDS[kind]["columns"]
+    done = read_checkpoint(checkpoint)
+    records = islice(read_records(path, format), done, None)
+
+    if done:
+        click.echo("resuming after record %d" % done)
+    response_cache = command_cache(current_app)
+
+    written = failed = 0
+    start = perf_counter()
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            break
+        first, last = done + 1, done + len(batch)
+
+        try:
+            rows = [normalize(r, columns, KINDS[kind]["required"]) for r in batch]
+            batch_written, pages = import_batch(kind, rows, upsert)
+            written += batch_written
+            if response_cache is not None:
+                response_cache.invalidate(*pages)
+        except Exception as e:
+            db.session.rollback()
+            failed += len(batch)
+            click.echo("records %d-%d failed: %s" % (first, last, getattr(e, "orig", e)), err=True)
+            if stop_on_error:
+                raise click.Abort()
+
+        done = last
+        write_checkpoint(checkpoint, done)
+
+    elapsed = perf_counter() - start
+    click.echo("%s: %d records read, %d rows written, %d failed in %.1fs"
+               % (kind, done, written, failed, elapsed))
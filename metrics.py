@@ -0,0 +1,272 @@
+import logging
+import threading
+from time import perf_counter
+from flask import g, request, has_request_context
+from sqlalchemy import event
+
+# ----------------------------------------------------------------------------#
+# Instruments.
+# ----------------------------------------------------------------------------#
+# Values live in the worker process, like the cache and pool statistics: each
+# worker exposes its own /metrics and Prometheus aggregates them per instance.
+
+
+class Counter(object):
+    """
+    monotonically increasing value per label set
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_values=(), amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            yield self.name, dict(zip(self.labels, label_values)), value
+
+
+class Histogram(object):
+    """
+    cumulative bucket counts, count and sum of the observed values per label set
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, label_values=()):
+        with self._lock:
+            counts, count, total = self._values.get(label_values, ([0] * len(self.buckets), 0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[label_values] = (counts, count + 1, total + value)
+
+    def samples(self):
+        with self._lock:
+            values = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._values.items())
+        for label_values, (counts, count, total) in values:
+            labels = dict(zip(self.labels, label_values))
+            for bound, bucket_count in zip(self.buckets, counts):
+                yield self.name + "_bucket", dict(labels, le=str(bound)), bucket_count
+            yield self.name + "_bucket", dict(labels, le="+Inf"), count
+            yield self.name + "_count", labels, count
+            yield self.name + "_sum", labels, total
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render(instruments):
+    """
+    function for writing instruments in the Prometheus text exposition format
+
+    Args:
+        instruments: list of 'Counter' and 'Histogram' objects
+
+    returns:
+        text of the /metrics page
+    """
+    lines = []
+    for instrument in instruments:
+        lines.append("# HELP %s %s" % (instrument.name, instrument.help))
+        lines.append("# TYPE %s %s" % (instrument.name, instrument.kind))
+        for name, labels, value in instrument.samples():
+            if labels:
+                label_text = ",".join('%s="%s"' % (k, _escape(v)) for k, v in labels.items())
+                name = "%s{%s}" % (name, label_text)
+            lines.append("%s %s" % (name, value))
+    return "\n".join(lines) + "\n"
+
+
+# ----------------------------------------------------------------------------#
+# Request instrumentation.
+# ----------------------------------------------------------------------------#
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+ROW_COUNT_BUCKETS = (0, 1, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+# longest parameter text written to the slow-query log, executemany batches
+# of the importer would otherwise flood it
+MAX_PARAMETERS_LENGTH = 2000
+
+
+class RequestMetrics(object):
+    """
+    per-request SQL and latency instrumentation
+
+    SQL statements are timed through the engine's cursor events. Inside a request
+    they add up to the request's statement count and SQL time, and the rows its
+    pages read are added up by 'count_rows'; all three are recorded per endpoint
+    once the response is sent. Any statement
+    slower than 'SLOW_QUERY_MS' goes to the 'fyyur.slow_query' logger with its
+    bound parameters.
+    """
+
+    def __init__(self, app, engines):
+        self.slow_query_seconds = app.config.get("SLOW_QUERY_MS", 200) / 1000.0
+        self.logger = logging.getLogger("fyyur.slow_query")
+        self.request_logger = logging.getLogger("fyyur.request")
+
+        endpoint = ("endpoint",)
+        self.requests = Counter(
+            "fyyur_http_requests_total", "HTTP requests served.",
+            ("endpoint", "method", "status"))
+        self.latency = Histogram(
+            "fyyur_http_request_duration_seconds", "Time spent handling a request.",
+            LATENCY_BUCKETS, endpoint)
+        self.queries = Histogram(
+            "fyyur_sql_queries_per_request", "SQL statements executed by a request.",
+            QUERY_COUNT_BUCKETS, endpoint)
+        self.sql_time = Histogram(
+            "fyyur_sql_duration_seconds", "Time spent in SQL statements by a request.",
+            LATENCY_BUCKETS, endpoint)
+        self.rows = Histogram(
+            "fyyur_sql_rows_per_request", "Rows read from the database by a request's pages.",
+            ROW_COUNT_BUCKETS, endpoint)
+        self.slow_queries = Counter(
+            "fyyur_sql_slow_queries_total", "SQL statements slower than SLOW_QUERY_MS.")
+        self.instruments = [self.requests, self.latency, self.queries, self.sql_time,
+                            self.rows, self.slow_queries]
+
+        if app.config.get("SLOW_QUERY_LOG"):
+            handler = logging.FileHandler(app.config["SLOW_QUERY_LOG"])
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.WARNING)
+
+        for engine in engines:
+            self.instrument(engine)
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+
+    def instrument(self, engine):
+        """
+        function for timing the statements of an engine, e.g. the async mode's
+        ('AsyncEngine.sync_engine')
+        """
+        event.listen(engine, "before_cursor_execute", self.before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self.after_cursor_execute)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = perf_counter() - conn.info["query_start"].pop()
+
+        if has_request_context() and "sql" in g:
+            stats = g.sql
+            stats["count"] += 1
+            stats["seconds"] += elapsed
+
+        if elapsed >= self.slow_query_seconds:
+            self.slow_queries.inc()
+            parameters = repr(parameters)
+            if len(parameters) > MAX_PARAMETERS_LENGTH:
+                parameters = parameters[:MAX_PARAMETERS_LENGTH] + "..."
+            self.logger.warning(
+                "%.1fms %s %s parameters=%s", elapsed * 1000,
+                request.endpoint if has_request_context() else "-", statement, parameters)
+
+    def before_request(self):
+        g.request_start = perf_counter()
+        g.sql = {"count": 0, "seconds": 0.0, "rows": 0}
+
+    def after_request(self, response):
+        if "sql" not in g:
+            return response
+        start = g.request_start
+        elapsed = perf_counter() - start
+        endpoint = request.endpoint or "unmatched"
+        method = request.method
+        stats = g.sql
+
+        if response.is_streamed:
+            # the header goes out before a streamed body runs its queries, so it
+            # only covers the time to the first byte and leaves the count out
+            response.headers["Server-Timing"] = "app;dur=%.1f, db;dur=%.1f" % (
+                elapsed * 1000, stats["seconds"] * 1000)
+            if response.mimetype == "text/html":
+                response.response = self._time_when_sent(response.response, stats)
+            response.call_on_close(
+                lambda: self.record(endpoint, method, response.status_code, start, stats))
+        else:
+            response.headers["Server-Timing"] = 'app;dur=%.1f, db;dur=%.1f;desc="%d queries"' % (
+                elapsed * 1000, stats["seconds"] * 1000, stats["count"])
+            self.record(endpoint, method, response.status_code, start, stats)
+        return response
+
+    def _time_when_sent(self, chunks, stats):
+        """
+        generator for passing a streamed page through to the client, ending it with
+        a comment carrying the Server-Timing of the whole request, its statement
+        count included
+        """
+        try:
+            for chunk in chunks:
+                yield chunk
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+        yield '\n<!-- Server-Timing: db;dur=%.1f;desc="%d queries" -->\n' % (
+            stats["seconds"] * 1000, stats["count"])
+
+    def record(self, endpoint, method, status, start, stats):
+        """
+        function for recording a finished request, once its body has been sent
+        """
+        elapsed = perf_counter() - start
+        self.requests.inc((endpoint, method, str(status)))
+        self.latency.observe(elapsed, (endpoint,))
+        self.queries.observe(stats["count"], (endpoint,))
+        self.sql_time.observe(stats["seconds"], (endpoint,))
+        self.rows.observe(stats["rows"], (endpoint,))
+
+        self.request_logger.info(
+            "%s %s %s %.1fms sql=%d sql_time=%.1fms rows=%d", method, endpoint, status,
+            elapsed * 1000, stats["count"], stats["seconds"] * 1000, stats["rows"])
+
+    def render(self):
+        return render(self.instruments)
+
+
+def count_rows(amount=1):
+    """
+    function for adding rows read from the database to the current request's row count
+
+    Called as the rows are consumed, so the rows of a streamed page count once
+    the template has iterated them. Outside of a request it does nothing.
+    """
+    if has_request_context() and "sql" in g:
+        g.sql["rows"] += amount
+
+
+def init_metrics(app, *engines):
+    """
+    function for instrumenting the app and its engines from the 'SLOW_QUERY_*' settings
+
+    returns:
+        'RequestMetrics' object
+    """
+    request_metrics = RequestMetrics(app, engines)
+    app.extensions["request_metrics"] = request_metrics
+    return request_metrics
@@ -0,0 +1,46 @@
+"""NOT NULL start time of the shows, the shows without one set aside
+
+Revision ID: 2e6a9f1c7b38
+Revises: 8b3e5d0c91f4
+Create Date: 2026-10-19 14:27:03.118640
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2e6a9f1c7b38'
+down_revision = '8b3e5d0c91f4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The conversion to a timestamp (7d2b94e0c5a1) turned empty start times into
+    # NULLs. Such shows sort out of the (start_time, id) keyset of the listing
+    # and no page reaches them; they are moved to "UnscheduledShows" to be
+    # rescheduled by hand. They were counted neither upcoming nor past, so the
+    # counters are unchanged.
+    op.create_table('UnscheduledShows',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('artist_id', sa.Integer(), nullable=True),
+        sa.Column('venue_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.execute('''
+        WITH moved AS (DELETE FROM "Shows" WHERE start_time IS NULL RETURNING id, artist_id, venue_id)
+        INSERT INTO "UnscheduledShows" (id, artist_id, venue_id) SELECT * FROM moved
+    ''')
+    op.alter_column('Shows', 'start_time', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade():
+    op.alter_column('Shows', 'start_time', existing_type=sa.DateTime(), nullable=True)
+    op.execute('''
+        INSERT INTO "Shows" (id, artist_id, venue_id)
+        SELECT id, artist_id, venue_id FROM "UnscheduledShows"
+    ''')
+    op.drop_table('UnscheduledShows')
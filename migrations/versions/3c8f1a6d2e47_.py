@@ -0,0 +1,35 @@
+"""index Shows by venue/artist and start_time
+
+Revision ID: 3c8f1a6d2e47
+Revises: 541a09bf22be
+Create Date: 2026-10-18 09:12:40.511203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c8f1a6d2e47'
+down_revision = '541a09bf22be'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # built concurrently so the Shows table stays writable while indexing
+    with op.get_context().autocommit_block():
+        op.create_index('ix_Shows_venue_id_start_time', 'Shows',
+                        ['venue_id', 'start_time'], unique=False,
+                        postgresql_concurrently=True)
+        op.create_index('ix_Shows_artist_id_start_time', 'Shows',
+                        ['artist_id', 'start_time'], unique=False,
+                        postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_Shows_artist_id_start_time', table_name='Shows',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_Shows_venue_id_start_time', table_name='Shows',
+                      postgresql_concurrently=True)
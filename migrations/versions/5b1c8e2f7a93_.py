@@ -0,0 +1,27 @@
+"""row versions on Artist and Venue
+
+Revision ID: 5b1c8e2f7a93
+Revises: e93a0b7c4d16
+Create Date: 2026-10-18 13:41:27.558301
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1c8e2f7a93'
+down_revision = 'e93a0b7c4d16'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # a constant default is stored in the catalog, so no table rewrite
+    op.add_column('Artist', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('Venue', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    op.drop_column('Venue', 'version')
+    op.drop_column('Artist', 'version')
@@ -0,0 +1,76 @@
+"""convert Shows.start_time to a native timestamp
+
+Revision ID: 7d2b94e0c5a1
+Revises: 3c8f1a6d2e47
+Create Date: 2026-10-18 10:03:11.284519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d2b94e0c5a1'
+down_revision = '3c8f1a6d2e47'
+branch_labels = None
+depends_on = None
+
+# rows converted per transaction while backfilling
+BATCH_SIZE = 10000
+
+
+def upgrade():
+    # The new column is filled next to the old one so the table is never
+    # rewritten under an exclusive lock. A trigger keeps rows written while
+    # the backfill runs in step; the final swap is a pair of renames.
+    op.add_column('Shows', sa.Column('start_at', sa.DateTime(), nullable=True))
+    op.execute('''
+        CREATE FUNCTION shows_sync_start_at() RETURNS trigger AS $$
+        BEGIN
+            NEW.start_at := NULLIF(NEW.start_time, '')::timestamp;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    ''')
+    op.execute('''
+        CREATE TRIGGER shows_sync_start_at
+        BEFORE INSERT OR UPDATE OF start_time ON "Shows"
+        FOR EACH ROW EXECUTE PROCEDURE shows_sync_start_at()
+    ''')
+
+    conn = op.get_bind()
+    with op.get_context().autocommit_block():
+        low, high = conn.execute(sa.text('SELECT min(id), max(id) FROM "Shows"')).first()
+        if low is not None:
+            for start in range(low, high + 1, BATCH_SIZE):
+                conn.execute(
+                    sa.text('''
+                        UPDATE "Shows"
+                        SET start_at = NULLIF(start_time, '')::timestamp
+                        WHERE id >= :start AND id < :stop AND start_at IS NULL
+                    '''),
+                    {'start': start, 'stop': start + BATCH_SIZE},
+                )
+
+        op.create_index('ix_Shows_venue_id_start_at', 'Shows',
+                        ['venue_id', 'start_at'], unique=False,
+                        postgresql_concurrently=True)
+        op.create_index('ix_Shows_artist_id_start_at', 'Shows',
+                        ['artist_id', 'start_at'], unique=False,
+                        postgresql_concurrently=True)
+
+    op.execute('DROP TRIGGER shows_sync_start_at ON "Shows"')
+    op.execute('DROP FUNCTION shows_sync_start_at()')
+    op.drop_index('ix_Shows_venue_id_start_time', table_name='Shows')
+    op.drop_index('ix_Shows_artist_id_start_time', table_name='Shows')
+    op.drop_column('Shows', 'start_time')
+    op.alter_column('Shows', 'start_at', new_column_name='start_time')
+    op.execute('ALTER INDEX "ix_Shows_venue_id_start_at" RENAME TO "ix_Shows_venue_id_start_time"')
+    op.execute('ALTER INDEX "ix_Shows_artist_id_start_at" RENAME TO "ix_Shows_artist_id_start_time"')
+
+
+def downgrade():
+    op.alter_column('Shows', 'start_time',
+                    existing_type=sa.DateTime(),
+                    type_=sa.String(length=25),
+                    postgresql_using="to_char(start_time, 'YYYY-MM-DD HH24:MI:SS')")
@@ -0,0 +1,37 @@
+"""NOT NULL keyset columns of the venue and artist listings
+
+Revision ID: 8b3e5d0c91f4
+Revises: f18c3b6a4d27
+Create Date: 2026-10-19 09:12:40.551902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b3e5d0c91f4'
+down_revision = 'f18c3b6a4d27'
+branch_labels = None
+depends_on = None
+
+# the sort keys of the keyset pagination: a NULL makes the row comparison
+# against a cursor NULL, and the row would never be listed
+KEYS = {
+    'Venue': (('name', sa.String()), ('city', sa.String(120)), ('state', sa.String(120))),
+    'Artist': (('name', sa.String()),),
+}
+
+
+def upgrade():
+    for table, columns in KEYS.items():
+        for column, type_ in columns:
+            op.execute('UPDATE "{table}" SET {column} = \'\' WHERE {column} IS NULL'
+                       .format(table=table, column=column))
+            op.alter_column(table, column, existing_type=type_, nullable=False)
+
+
+def downgrade():
+    for table, columns in KEYS.items():
+        for column, type_ in columns:
+            op.alter_column(table, column, existing_type=type_, nullable=True)
@@ -0,0 +1,37 @@
+"""trigram indexes for artist and venue name search
+
+Revision ID: a41e07c9b3f8
+Revises: 7d2b94e0c5a1
+Create Date: 2026-10-18 10:47:52.930177
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41e07c9b3f8'
+down_revision = '7d2b94e0c5a1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    with op.get_context().autocommit_block():
+        op.create_index('ix_Artist_name_trgm', 'Artist', ['name'], unique=False,
+                        postgresql_using='gin',
+                        postgresql_ops={'name': 'gin_trgm_ops'},
+                        postgresql_concurrently=True)
+        op.create_index('ix_Venue_name_trgm', 'Venue', ['name'], unique=False,
+                        postgresql_using='gin',
+                        postgresql_ops={'name': 'gin_trgm_ops'},
+                        postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_Venue_name_trgm', table_name='Venue',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_Artist_name_trgm', table_name='Artist',
+                      postgresql_concurrently=True)
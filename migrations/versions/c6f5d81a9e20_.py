@@ -0,0 +1,37 @@
+"""sort-key indexes for keyset pagination
+
+Revision ID: c6f5d81a9e20
+Revises: a41e07c9b3f8
+Create Date: 2026-10-18 11:35:06.617842
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6f5d81a9e20'
+down_revision = 'a41e07c9b3f8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_Artist_name_id', 'Artist', ['name', 'id'],
+                        unique=False, postgresql_concurrently=True)
+        op.create_index('ix_Venue_state_city_name_id', 'Venue',
+                        ['state', 'city', 'name', 'id'],
+                        unique=False, postgresql_concurrently=True)
+        op.create_index('ix_Shows_start_time_id', 'Shows', ['start_time', 'id'],
+                        unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_Shows_start_time_id', table_name='Shows',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_Venue_state_city_name_id', table_name='Venue',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_Artist_name_id', table_name='Artist',
+                      postgresql_concurrently=True)
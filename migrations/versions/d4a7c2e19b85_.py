@@ -0,0 +1,117 @@
+"""upcoming and past show counters on Artist and Venue
+
+Revision ID: d4a7c2e19b85
+Revises: 5b1c8e2f7a93
+Create Date: 2026-10-18 18:22:09.417356
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4a7c2e19b85'
+down_revision = '5b1c8e2f7a93'
+branch_labels = None
+depends_on = None
+
+COUNTED = ('Venue', 'venue_id'), ('Artist', 'artist_id')
+
+
+def apply_counts(table, column, shows, sign):
+    # one UPDATE per statement on "Shows", grouped by venue or artist; rows
+    # starting after the "ShowCounters" watermark count as upcoming
+    return '''
+        UPDATE "{table}" t
+        SET upcoming_shows_count = t.upcoming_shows_count {sign} d.upcoming,
+            past_shows_count = t.past_shows_count {sign} d.past
+        FROM (
+            SELECT {column},
+                   count(*) FILTER (WHERE start_time > as_of) AS upcoming,
+                   count(*) FILTER (WHERE start_time <= as_of) AS past
+            FROM {shows}
+            GROUP BY {column}
+        ) d
+        WHERE t.id = d.{column};
+    '''.format(table=table, column=column, shows=shows, sign=sign)
+
+
+def upgrade():
+    for table, column in COUNTED:
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(),
+                                       server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(),
+                                       server_default='0', nullable=False))
+
+    op.create_table('ShowCounters',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('as_of', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.execute('INSERT INTO "ShowCounters" (id, as_of) VALUES (1, LOCALTIMESTAMP)')
+
+    # statement level triggers, so bulk writes (the importer, COPY) update each
+    # venue and artist once per statement. The watermark row is share locked,
+    # a roll-over waits for the writers counting against it and vice versa.
+    op.execute('''
+        CREATE FUNCTION shows_count() RETURNS trigger AS $$
+        DECLARE
+            as_of timestamp;
+        BEGIN
+            SELECT c.as_of INTO as_of FROM "ShowCounters" c WHERE c.id = 1 FOR SHARE;
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                {remove}
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                {add}
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    '''.format(
+        remove=''.join(apply_counts(t, c, 'old_shows', '-') for t, c in COUNTED),
+        add=''.join(apply_counts(t, c, 'new_shows', '+') for t, c in COUNTED),
+    ))
+    op.execute('''
+        CREATE TRIGGER shows_count_insert AFTER INSERT ON "Shows"
+        REFERENCING NEW TABLE AS new_shows
+        FOR EACH STATEMENT EXECUTE PROCEDURE shows_count()
+    ''')
+    op.execute('''
+        CREATE TRIGGER shows_count_update AFTER UPDATE ON "Shows"
+        REFERENCING OLD TABLE AS old_shows NEW TABLE AS new_shows
+        FOR EACH STATEMENT EXECUTE PROCEDURE shows_count()
+    ''')
+    op.execute('''
+        CREATE TRIGGER shows_count_delete AFTER DELETE ON "Shows"
+        REFERENCING OLD TABLE AS old_shows
+        FOR EACH STATEMENT EXECUTE PROCEDURE shows_count()
+    ''')
+
+    # backfill, with the watermark locked so shows written meanwhile wait
+    op.execute('SELECT as_of FROM "ShowCounters" WHERE id = 1 FOR UPDATE')
+    for table, column in COUNTED:
+        op.execute('''
+            UPDATE "{table}" t
+            SET upcoming_shows_count = d.upcoming, past_shows_count = d.past
+            FROM (
+                SELECT s.{column},
+                       count(*) FILTER (WHERE s.start_time > c.as_of) AS upcoming,
+                       count(*) FILTER (WHERE s.start_time <= c.as_of) AS past
+                FROM "Shows" s, "ShowCounters" c
+                WHERE c.id = 1
+                GROUP BY s.{column}
+            ) d
+            WHERE t.id = d.{column}
+        '''.format(table=table, column=column))
+
+
+def downgrade():
+    op.execute('DROP TRIGGER shows_count_delete ON "Shows"')
+    op.execute('DROP TRIGGER shows_count_update ON "Shows"')
+    op.execute('DROP TRIGGER shows_count_insert ON "Shows"')
+    op.execute('DROP FUNCTION shows_count()')
+    op.drop_table('ShowCounters')
+    for table, column in COUNTED:
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
@@ -0,0 +1,55 @@
+"""store genres as jsonb with GIN indexes
+
+Revision ID: e93a0b7c4d16
+Revises: c6f5d81a9e20
+Create Date: 2026-10-18 12:20:44.102958
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e93a0b7c4d16'
+down_revision = 'c6f5d81a9e20'
+branch_labels = None
+depends_on = None
+
+# genres were written as JSON text ('["Jazz", "Folk"]'); early rows hold
+# postgres array literals ('{Jazz,Folk}')
+GENRES_TO_JSONB = '''
+    CASE
+        WHEN genres IS NULL OR genres = '' THEN '[]'::jsonb
+        WHEN left(genres, 1) = '{' THEN to_jsonb(genres::text[])
+        ELSE genres::jsonb
+    END
+'''
+
+
+def upgrade():
+    for table in ('Artist', 'Venue'):
+        op.alter_column(table, 'genres',
+                        existing_type=sa.String(length=120),
+                        type_=postgresql.JSONB(astext_type=sa.Text()),
+                        postgresql_using=GENRES_TO_JSONB)
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_Artist_genres', 'Artist', ['genres'], unique=False,
+                        postgresql_using='gin',
+                        postgresql_ops={'genres': 'jsonb_path_ops'},
+                        postgresql_concurrently=True)
+        op.create_index('ix_Venue_genres', 'Venue', ['genres'], unique=False,
+                        postgresql_using='gin',
+                        postgresql_ops={'genres': 'jsonb_path_ops'},
+                        postgresql_concurrently=True)
+
+
+def downgrade():
+    op.drop_index('ix_Venue_genres', table_name='Venue')
+    op.drop_index('ix_Artist_genres', table_name='Artist')
+    for table in ('Venue', 'Artist'):
+        op.alter_column(table, 'genres',
+                        existing_type=postgresql.JSONB(astext_type=sa.Text()),
+                        type_=sa.String(length=120),
+                        postgresql_using='genres::text')
@@ -0,0 +1,65 @@
+"""show end times and double-booking exclusion constraints
+
+Revision ID: f18c3b6a4d27
+Revises: d4a7c2e19b85
+Create Date: 2026-10-18 19:04:51.208113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f18c3b6a4d27'
+down_revision = 'd4a7c2e19b85'
+branch_labels = None
+depends_on = None
+
+# length given to the existing shows, which had no end time
+LEGACY_DURATION = "interval '3 hours'"
+
+
+def upgrade():
+    op.add_column('Shows', sa.Column('end_time', sa.DateTime(), nullable=True))
+
+    # backfill only the shows that overlap no other show of their venue or
+    # artist: with one length for all, it is enough to look at the previous and
+    # next show. The double-booked ones keep a NULL end time, are left out of
+    # the constraints and need to be sorted out by hand.
+    op.execute('''
+        UPDATE "Shows" s
+        SET end_time = s.start_time + {duration}
+        FROM (
+            SELECT id,
+                   lag(start_time) OVER v AS venue_prev, lead(start_time) OVER v AS venue_next,
+                   lag(start_time) OVER a AS artist_prev, lead(start_time) OVER a AS artist_next
+            FROM "Shows"
+            WINDOW v AS (PARTITION BY venue_id ORDER BY start_time),
+                   a AS (PARTITION BY artist_id ORDER BY start_time)
+        ) n
+        WHERE s.id = n.id AND s.start_time IS NOT NULL
+          AND coalesce(n.venue_prev + {duration} <= s.start_time, true)
+          AND coalesce(n.venue_next >= s.start_time + {duration}, true)
+          AND coalesce(n.artist_prev + {duration} <= s.start_time, true)
+          AND coalesce(n.artist_next >= s.start_time + {duration}, true)
+    '''.format(duration=LEGACY_DURATION))
+
+    op.create_check_constraint('ck_Shows_end_after_start', 'Shows', 'end_time > start_time')
+    # int4range(id, id, '[]') compares ids with the range operator class GiST
+    # has built in, so no btree_gist extension is needed. The constraints'
+    # indexes serve the conflict checks, see 'queries.booking_conflicts'.
+    for column in ('venue_id', 'artist_id'):
+        op.execute('''
+            ALTER TABLE "Shows" ADD CONSTRAINT "ex_Shows_{column}_during"
+            EXCLUDE USING gist (
+                int4range({column}, {column}, '[]') WITH =,
+                tsrange(start_time, end_time) WITH &&
+            ) WHERE (end_time IS NOT NULL)
+        '''.format(column=column))
+
+
+def downgrade():
+    op.drop_constraint('ex_Shows_artist_id_during', 'Shows')
+    op.drop_constraint('ex_Shows_venue_id_during', 'Shows')
+    op.drop_constraint('ck_Shows_end_after_start', 'Shows')
+    op.drop_column('Shows', 'end_time')
@@ -1,17 +1,27 @@
 from sqlalchemy.testing.config import db
-from sqlalchemy.dialects.mysql import JSON
+from sqlalchemy.dialects.postgresql import JSONB, ExcludeConstraint
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
-db = SQLAlchemy()
+from dbpool import engine_options, install_statement_timeout
+from replicas import RoutingSession, init_replicas, replica_binds
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 # ----------------------------------------------------------------------------#
 # App Config.
 # ----------------------------------------------------------------------------#
 def setup(app):
     app.config.from_object("config")
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", engine_options(app.config))
+    app.config.setdefault("SQLALCHEMY_BINDS", {}).update(replica_binds(app.config))
     db.app = app
     db.init_app(app)
     migrate = Migrate(app, db)
+    init_replicas(app, db)
+
+    if app.config.get("DB_PGBOUNCER") and app.config.get("DB_STATEMENT_TIMEOUT"):
+        with app.app_context():
+            for engine in db.engines.values():
+                install_statement_timeout(engine, app.config["DB_STATEMENT_TIMEOUT"])
     return db
 
 # ----------------------------------------------------------------------------#
@@ -23,45 +33,113 @@ def setup(app):
 
 class Venue(db.Model):
     __tablename__ = "Venue"
+    __table_args__ = (
+        db.Index("ix_Venue_name_trgm", "name", postgresql_using="gin",
+                 postgresql_ops={"name": "gin_trgm_ops"}),
+        db.Index("ix_Venue_genres", "genres", postgresql_using="gin",
+                 postgresql_ops={"genres": "jsonb_path_ops"}),
+        db.Index("ix_Venue_state_city_name_id", "state", "city", "name", "id"),
+    )
 
     id                  = db.Column(db.Integer, primary_key=True)
-    name                = db.Column(db.String)
-    city                = db.Column(db.String(120))
-    state               = db.Column(db.String(120))
+    name                = db.Column(db.String, nullable=False)
+    city                = db.Column(db.String(120), nullable=False)
+    state               = db.Column(db.String(120), nullable=False)
     address             = db.Column(db.String(120))
     phone               = db.Column(db.String(120))
-    genres              = db.Column(JSON)
+    genres              = db.Column(JSONB)
     website             = db.Column(db.String(120))
     seeking_talent      = db.Column(db.String())
     seeking_description = db.Column(db.String())
     image_link          = db.Column(db.String(500))
     facebook_link       = db.Column(db.String(120))
+    version             = db.Column(db.Integer, nullable=False, server_default="1")
+    # maintained by triggers on "Shows", see 'counters'
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, server_default="0")
+    past_shows_count     = db.Column(db.Integer, nullable=False, server_default="0")
     shows = db.relationship("Shows", backref="Venue", cascade="all,delete", lazy=True)
 
+    # bumped on every UPDATE; the API derives its ETags from it
+    __mapper_args__ = {"version_id_col": version}
+
 
 # TODO: implement any missing fields, as a database migration using Flask-Migrate  (DONE)
 class Artist(db.Model):
     __tablename__ = "Artist"
+    __table_args__ = (
+        db.Index("ix_Artist_name_trgm", "name", postgresql_using="gin",
+                 postgresql_ops={"name": "gin_trgm_ops"}),
+        db.Index("ix_Artist_genres", "genres", postgresql_using="gin",
+                 postgresql_ops={"genres": "jsonb_path_ops"}),
+        db.Index("ix_Artist_name_id", "name", "id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    name        = db.Column(db.String)
+    name        = db.Column(db.String, nullable=False)
     city        = db.Column(db.String(120))
     state       = db.Column(db.String(120))
     phone       = db.Column(db.String(120))
-    genres      = db.Column(JSON)
+    genres      = db.Column(JSONB)
     website     = db.Column(db.String(120))
     seeking_venue       = db.Column(db.String())
     seeking_description = db.Column(db.String())
     image_link          = db.Column(db.String(500))
     facebook_link       = db.Column(db.String(120))
+    version             = db.Column(db.Integer, nullable=False, server_default="1")
+    # maintained by triggers on "Shows", see 'counters'
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, server_default="0")
+    past_shows_count     = db.Column(db.Integer, nullable=False, server_default="0")
     shows               = db.relationship("Shows", backref="Artist", cascade="all,delete", lazy=True)
 
+    __mapper_args__ = {"version_id_col": version}
+
 # TODO: implement any missing fields, as a database migration using Flask-Migrate (DONE)
 class Shows(db.Model):
     __tablename__ = "Shows"
+    __table_args__ = (
+        db.Index("ix_Shows_venue_id_start_time", "venue_id", "start_time"),
+        db.Index("ix_Shows_artist_id_start_time", "artist_id", "start_time"),
+        db.Index("ix_Shows_start_time_id", "start_time", "id"),
+        db.CheckConstraint("end_time > start_time", name="ck_Shows_end_after_start"),
+        # no two shows of a venue, or of an artist, at the same time; shows
+        # without an end time (double-booked before end times existed) are exempt
+        ExcludeConstraint(
+            (db.text("int4range(venue_id, venue_id, '[]')"), "="),
+            (db.text("tsrange(start_time, end_time)"), "&&"),
+            name="ex_Shows_venue_id_during", using="gist", where="end_time IS NOT NULL",
+        ),
+        ExcludeConstraint(
+            (db.text("int4range(artist_id, artist_id, '[]')"), "="),
+            (db.text("tsrange(start_time, end_time)"), "&&"),
+            name="ex_Shows_artist_id_during", using="gist", where="end_time IS NOT NULL",
+        ),
+    )
 
     id          = db.Column(db.Integer, primary_key=True)
     artist_id   = db.Column(db.Integer, db.ForeignKey("Artist.id"))
     venue_id    = db.Column(db.Integer, db.ForeignKey("Venue.id"))
-    start_time  = db.Column(db.DateTime)
+    start_time  = db.Column(db.DateTime, nullable=False)
+    end_time    = db.Column(db.DateTime)
+
+
+class UnscheduledShows(db.Model):
+    """
+    shows that had no start time when it became required; the listing could not
+    reach them, so they are kept here until they are rescheduled by hand
+    """
+    __tablename__ = "UnscheduledShows"
+
+    id          = db.Column(db.Integer, primary_key=True)
+    artist_id   = db.Column(db.Integer, db.ForeignKey("Artist.id", ondelete="CASCADE"))
+    venue_id    = db.Column(db.Integer, db.ForeignKey("Venue.id", ondelete="CASCADE"))
+
+
+class ShowCounters(db.Model):
+    """
+    single row holding the time the show counters of Venue and Artist are as of:
+    shows starting after 'as_of' are counted as upcoming, the others as past
+    """
+    __tablename__ = "ShowCounters"
 
+    id    = db.Column(db.Integer, primary_key=True)
+    as_of = db.Column(db.DateTime, nullable=False)
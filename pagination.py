@@ -0,0 +1,204 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import tuple_
+from metrics import count_rows
+
+# ----------------------------------------------------------------------------#
+# Keyset pagination.
+# ----------------------------------------------------------------------------#
+
+
+class Page(object):
+    """
+    one page of rows, plus the cursors pointing at the pages around it
+    """
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class StreamedPage(object):
+    """
+    one page of rows fetched while it is iterated, for streamed templates
+
+    The rows are read from the cursor in batches of 'batch' instead of being
+    loaded up front, so a template can send the first rows before the last are
+    fetched. It can be iterated once, and the next/prev cursors are known once
+    it has been iterated to the end.
+    """
+
+    def __init__(self, query, keys, limit, after=None, batch=50):
+        self.query = query
+        self.keys = keys
+        self.limit = limit
+        self.after = after
+        self.batch = batch
+        self.next_cursor = None
+        self.prev_cursor = None
+        self._consumed = False
+
+    def _cursor(self, row):
+        return encode_cursor([getattr(row, key.key) for key in self.keys])
+
+    def __iter__(self):
+        if self._consumed:
+            raise RuntimeError("a streamed page can only be iterated once")
+        self._consumed = True
+
+        first = last = None
+        count = 0
+        rows = iter(self.query.limit(self.limit + 1).yield_per(self.batch))
+        try:
+            for row in rows:
+                count += 1
+                count_rows()
+                if count > self.limit:
+                    break
+                if first is None:
+                    first = row
+                last = row
+                yield row
+        finally:
+            rows.close()
+
+        if first is not None:
+            if count > self.limit:
+                self.next_cursor = self._cursor(last)
+            if self.after is not None:
+                self.prev_cursor = self._cursor(first)
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"$dt": value.isoformat()}
+    raise TypeError("%r is not a cursor value" % (value,))
+
+
+def _decode_value(obj):
+    if "$dt" in obj:
+        return datetime.fromisoformat(obj["$dt"])
+    return obj
+
+
+def encode_cursor(values):
+    """
+    function for turning the key values of a row into an opaque, url safe cursor
+
+    Args:
+        values: list of the key column values of the row
+    """
+    raw = json.dumps(list(values), default=_encode_value, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, size):
+    """
+    function for reading back the key values stored in a cursor
+
+    Args:
+        cursor: value produced by 'encode_cursor'
+        size: number of key columns the cursor must hold
+
+    returns:
+        list of key values, raises ValueError when the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw.decode("utf-8"), object_hook=_decode_value)
+    except (TypeError, ValueError) as e:
+        raise ValueError("invalid cursor: %s" % e)
+
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("invalid cursor")
+    return values
+
+
+def seek(query, keys, after=None, before=None):
+    """
+    function for ordering a query by its keyset and filtering it past a cursor
+
+    Args:
+        query: query or select() statement selecting every column in 'keys', without an order_by
+        keys: column expressions forming a unique, indexed sort key, e.g. (name, id)
+        after: cursor of the row the page starts after
+        before: cursor of the row the page ends before; the query is then reversed
+
+    returns:
+        the filtered and ordered query, raises ValueError when a cursor is malformed
+    """
+    if before is not None:
+        query = query.filter(tuple_(*keys) < tuple_(*decode_cursor(before, len(keys))))
+        return query.order_by(*[key.desc() for key in keys])
+    if after is not None:
+        query = query.filter(tuple_(*keys) > tuple_(*decode_cursor(after, len(keys))))
+    return query.order_by(*keys)
+
+
+def make_page(rows, keys, limit, after=None, before=None):
+    """
+    function for turning the up to 'limit' + 1 rows fetched for a page into a 'Page'
+
+    Args:
+        rows: list of the rows of the query returned by 'seek', limited to 'limit' + 1
+        keys, limit, after, before: as passed to 'paginate'
+    """
+    count_rows(len(rows))
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    if before is not None:
+        rows.reverse()
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, after is not None
+
+    if not rows:
+        return Page(rows)
+
+    def cursor(row):
+        return encode_cursor([getattr(row, key.key) for key in keys])
+
+    return Page(
+        rows,
+        next_cursor=cursor(rows[-1]) if has_next else None,
+        prev_cursor=cursor(rows[0]) if has_prev else None,
+    )
+
+
+def paginate(query, keys, after=None, before=None, limit=50, stream=False):
+    """
+    function for fetching one page of a query with keyset (seek) pagination
+
+    The query is ordered by 'keys' and filtered with a row comparison against the
+    cursor, so every page is an index range scan of at most 'limit' + 1 rows no
+    matter how deep it is. OFFSET is never used.
+
+    Args:
+        query: query selecting every column in 'keys', without an order_by
+        keys: column expressions forming a unique, indexed sort key, e.g. (name, id).
+            Each row must expose the key values under the column's 'key' name
+        after: cursor of the row the page starts after
+        before: cursor of the row the page ends before
+        limit: maximum number of rows on the page
+        stream: return a 'StreamedPage' fetching the rows as they are iterated.
+            Pages read backwards ('before') are still loaded up front, their rows
+            come out of the database in reverse order
+
+    returns:
+        'Page' object with the rows and the next/prev cursors
+    """
+    query = seek(query, keys, after=after, before=before)
+    if stream and before is None:
+        return StreamedPage(query, keys, limit, after=after)
+
+    rows = query.limit(limit + 1).all()
+    return make_page(rows, keys, limit, after=after, before=before)
@@ -0,0 +1,498 @@
+from datetime import date, datetime, timedelta
+from flask import current_app, request, abort
+from sqlalchemy import (DateTime, Float, Integer, and_, cast, column, false, func, literal, literal_column,
+                        or_, values)
+from models import db, Venue, Artist, Shows
+from pagination import paginate
+
+# ----------------------------------------------------------------------------#
+# Queries.
+# ----------------------------------------------------------------------------#
+# Shared by the HTML views and the JSON API, so both return the same data.
+
+
+def split_queries(query):
+    """
+    function for splitting a shows query into a past and an upcoming shows query
+
+    Args:
+        query: query over 'Shows' already filtered down to a single venue or artist
+
+    returns:
+        tuple of (past, upcoming) queries, latest past show and soonest upcoming show first
+    """
+    now = datetime.now()
+    return (
+        query.filter(Shows.start_time <= now).order_by(Shows.start_time.desc()),
+        query.filter(Shows.start_time > now).order_by(Shows.start_time),
+    )
+
+
+def split_shows(query):
+    """
+    function for splitting a shows query into past and upcoming shows in the database
+
+    Args:
+        query: query over 'Shows' already filtered down to a single venue or artist
+
+    returns:
+        tuple of (past_shows, upcoming_shows) lists of dicts
+    """
+    past, upcoming = split_queries(query)
+    return [s._asdict() for s in past.all()], [s._asdict() for s in upcoming.all()]
+
+
+def venue_shows_query(venue_id):
+    """
+    function for building the query of the shows played at a venue, using the
+    (venue_id, start_time) index, with the artist columns the tiles need, including
+    the artist version the tiles are cached by
+
+    Args:
+        venue_id: represent the number of id of the venue row on Venues table
+    """
+    return (
+        db.session.query(
+            Shows.artist_id,
+            Artist.name.label("artist_name"),
+            Artist.image_link.label("artist_image_link"),
+            Artist.version.label("artist_version"),
+            Shows.start_time,
+        )
+        .join(Artist, Artist.id == Shows.artist_id)
+        .filter(Shows.venue_id == venue_id)
+    )
+
+
+def artist_shows_query(artist_id):
+    """
+    function for building the query of the shows played by an artist, using the
+    (artist_id, start_time) index, with the venue columns the tiles need, including
+    the venue version the tiles are cached by
+
+    Args:
+        artist_id: represent the number of id of the artist row on Artist table
+    """
+    return (
+        db.session.query(
+            Shows.venue_id,
+            Venue.name.label("venue_name"),
+            Venue.image_link.label("venue_image_link"),
+            Venue.version.label("venue_version"),
+            Shows.start_time,
+        )
+        .join(Venue, Venue.id == Shows.venue_id)
+        .filter(Shows.artist_id == artist_id)
+    )
+
+
+def venue_detail(venue_id):
+    """
+    function for building the data of a venue page
+
+    Args:
+        venue_id: represent the number of id of the venue row on Venues table
+
+    returns:
+        dict with the venue fields and its past/upcoming shows, None if there is no such venue
+    """
+    result = db.session.get(Venue, venue_id)
+    if result is None:
+        return None
+
+    past_shows, upcoming_shows = split_shows(venue_shows_query(result.id))
+    return venue_dict(result, past_shows, upcoming_shows)
+
+
+def venue_dict(result, past_shows, upcoming_shows):
+    """
+    function for laying out a 'Venue' row and its shows as the data of a venue page
+    """
+    return {
+        "id": result.id,
+        "name": result.name,
+        "genres": result.genres or [],
+        "address": result.address,
+        "city": result.city,
+        "state": result.state,
+        "phone": result.phone,
+        "website": result.website,
+        "facebook_link": result.facebook_link,
+        "seeking_talent": result.seeking_talent,
+        "seeking_description": result.seeking_description,
+        "image_link": result.image_link,
+        "version": result.version,
+        "past_shows": past_shows,
+        "upcoming_shows": upcoming_shows,
+        "past_shows_count": len(past_shows),
+        "upcoming_shows_count": len(upcoming_shows),
+    }
+
+
+def artist_detail(artist_id):
+    """
+    function for building the data of an artist page
+
+    Args:
+        artist_id: represent the number of id of the artist row on Artist table
+
+    returns:
+        dict with the artist fields and its past/upcoming shows, None if there is no such artist
+    """
+    result = db.session.get(Artist, artist_id)
+    if result is None:
+        return None
+
+    past_shows, upcoming_shows = split_shows(artist_shows_query(result.id))
+    return artist_dict(result, past_shows, upcoming_shows)
+
+
+def artist_dict(result, past_shows, upcoming_shows):
+    """
+    function for laying out an 'Artist' row and its shows as the data of an artist page
+    """
+    return {
+        "id": result.id,
+        "name": result.name,
+        "genres": result.genres or [],
+        "city": result.city,
+        "state": result.state,
+        "phone": result.phone,
+        "website": result.website,
+        "facebook_link": result.facebook_link,
+        "seeking_venue": result.seeking_venue,
+        "seeking_description": result.seeking_description,
+        "image_link": result.image_link,
+        "version": result.version,
+        "past_shows": past_shows,
+        "upcoming_shows": upcoming_shows,
+        "past_shows_count": len(past_shows),
+        "upcoming_shows_count": len(upcoming_shows),
+    }
+
+
+def entity_version(model, entity_id):
+    """
+    function for reading what a venue or artist page depends on, without building it:
+    the row version, the count, newest id and upcoming count of its shows and the
+    summed version of the artists (or venues) of its shows
+
+    Args:
+        model: 'Venue' or 'Artist'
+        entity_id: id of the venue or artist row
+
+    returns:
+        tuple of version values, None if there is no such row
+    """
+    return version_tuple(entity_version_query(model, entity_id).first())
+
+
+def entity_version_query(model, entity_id):
+    """
+    function for building the single row query read by 'entity_version'
+
+    The sum of the versions of the artists (or venues) the shows embed changes
+    whenever one of them is edited, versions only go up.
+    """
+    column, other, other_column = ((Shows.venue_id, Artist, Shows.artist_id) if model is Venue
+                                   else (Shows.artist_id, Venue, Shows.venue_id))
+    version = db.session.query(model.version).filter(model.id == entity_id).scalar_subquery()
+
+    return (
+        db.session.query(
+            version,
+            func.count(Shows.id),
+            func.max(Shows.id),
+            func.count(Shows.id).filter(Shows.start_time > datetime.now()),
+            func.sum(other.version),
+        )
+        .outerjoin(other, other.id == other_column)
+        .filter(column == entity_id)
+    )
+
+
+def version_tuple(row):
+    return None if row[0] is None else tuple(row)
+
+
+def venues_query(genre=None):
+    """
+    function for building the venue listing: venue columns and the number of upcoming
+    shows of each venue, read from its maintained counter (as of the last
+    'flask counters rollover') instead of counting shows
+
+    Args:
+        genre: only keep the venues playing this genre
+    """
+    query = db.session.query(
+        Venue.city,
+        Venue.state,
+        Venue.id,
+        Venue.name,
+        Venue.upcoming_shows_count.label("num_upcoming_shows"),
+    )
+    if genre:
+        query = query.filter(Venue.genres.contains([genre]))
+    return query
+
+
+VENUES_KEY = (Venue.state, Venue.city, Venue.name, Venue.id)
+
+
+def artists_query(genre=None):
+    """
+    function for building the artist listing
+
+    Args:
+        genre: only keep the artists playing this genre
+    """
+    query = db.session.query(Artist.id, Artist.name)
+    if genre:
+        query = query.filter(Artist.genres.contains([genre]))
+    return query
+
+
+ARTISTS_KEY = (Artist.name, Artist.id)
+
+
+def shows_query(start=None, end=None, city=None, state=None):
+    """
+    function for building the show listing: one join selecting only the columns the tiles need
+
+    The time range is a range scan of the (start_time, id) index, the listing's own
+    order; the location filters are checked on the joined venue, or, for a wide
+    range, start from the venues of the city through their (state, city) index.
+
+    Args:
+        start: only keep the shows starting at or after this time
+        end: only keep the shows starting before this time
+        city: only keep the shows at a venue of this city
+        state: only keep the shows at a venue of this state
+    """
+    query = (
+        db.session.query(
+            Shows.id,
+            Shows.venue_id,
+            Venue.name.label("venue_name"),
+            Venue.version.label("venue_version"),
+            Shows.artist_id,
+            Artist.name.label("artist_name"),
+            Artist.image_link.label("artist_image_link"),
+            Artist.version.label("artist_version"),
+            Shows.start_time,
+            Shows.end_time,
+        )
+        .join(Venue, Venue.id == Shows.venue_id)
+        .join(Artist, Artist.id == Shows.artist_id)
+    )
+    if start is not None:
+        query = query.filter(Shows.start_time >= start)
+    if end is not None:
+        query = query.filter(Shows.start_time < end)
+    if city:
+        query = query.filter(Venue.city == city)
+    if state:
+        query = query.filter(Venue.state == state)
+    return query
+
+
+def show_filters():
+    """
+    function for reading the 'from', 'to', 'city' and 'state' arguments of the
+    request, as 'shows_query' arguments
+
+    'from' and 'to' are ISO dates or date-times; a date 'to' includes that whole
+    day, so '?from=2030-06-14&to=2030-06-16' is a weekend.
+
+    returns:
+        dict of 'shows_query' arguments, aborts with 400 on a malformed date
+    """
+    try:
+        start = parse_time(request.args.get("from"))
+        end = parse_time(request.args.get("to"), end_of_day=True)
+    except ValueError:
+        abort(400, "'from' and 'to' must be ISO dates, e.g. 2030-06-14")
+    return {
+        "start": start,
+        "end": end,
+        "city": request.args.get("city"),
+        "state": request.args.get("state"),
+    }
+
+
+def parse_time(value, end_of_day=False):
+    if not value:
+        return None
+    if "T" not in value and " " not in value:
+        day = date.fromisoformat(value)
+        return datetime.combine(day + timedelta(days=1) if end_of_day else day, datetime.min.time())
+    return datetime.fromisoformat(value)
+
+
+SHOWS_KEY = (Shows.start_time, Shows.id)
+
+
+def default_end_time(start_time):
+    """
+    function for the end time of a show booked without one, 'SHOW_DEFAULT_HOURS' after its start
+    """
+    return start_time + timedelta(hours=current_app.config["SHOW_DEFAULT_HOURS"])
+
+
+def booking_conflicts(bookings):
+    """
+    function for finding the shows that proposed bookings would double-book, in
+    a single query for the whole batch
+
+    Each booking probes the GiST indexes of the exclusion constraints on "Shows"
+    with the same expressions, so the cost grows with the batch and the shows it
+    overlaps, not with the table. Shows without an end time are not checked,
+    the constraints do not cover them either.
+
+    Args:
+        bookings: list of dicts with 'venue_id', 'artist_id', 'start_time' and 'end_time'
+
+    returns:
+        list of (booking, conflict, id, venue_id, artist_id, start_time, end_time)
+        rows: the index of the booking in 'bookings', 'venue' or 'artist', and the
+        show it overlaps
+    """
+    if not bookings:
+        return []
+    proposed = values(
+        column("booking", Integer),
+        column("venue_id", Integer),
+        column("artist_id", Integer),
+        column("start_time", DateTime),
+        column("end_time", DateTime),
+        name="proposed",
+    ).data([(i, b["venue_id"], b["artist_id"], b["start_time"], b["end_time"])
+            for i, b in enumerate(bookings)])
+
+    # the constraints' index expressions, see the "Shows" model
+    def same(left, right):
+        closed = literal_column("'[]'")
+        return func.int4range(left, left, closed) == func.int4range(right, right, closed)
+
+    overlaps = func.tsrange(Shows.start_time, Shows.end_time).op("&&")(
+        func.tsrange(proposed.c.start_time, proposed.c.end_time)
+    )
+    queries = [
+        db.session.query(
+            proposed.c.booking,
+            literal(conflict).label("conflict"),
+            Shows.id,
+            Shows.venue_id,
+            Shows.artist_id,
+            Shows.start_time,
+            Shows.end_time,
+        ).join(Shows, and_(same(shows_column, proposed.c[name]), overlaps,
+                           Shows.end_time.isnot(None)))
+        for conflict, name, shows_column in (("venue", "venue_id", Shows.venue_id),
+                                             ("artist", "artist_id", Shows.artist_id))
+    ]
+    return queries[0].union_all(queries[1]).order_by(proposed.c.booking, Shows.start_time).all()
+
+
+def venue_pages(venue_id):
+    """
+    function for listing the cached pages that show data of a venue
+
+    Args:
+        venue_id: represent the number of id of the venue row on Venues table
+
+    returns:
+        list of cache names: the venue page, the listings and the pages of artists playing there
+    """
+    artist_ids = db.session.query(Shows.artist_id).filter(Shows.venue_id == venue_id).distinct()
+    return ["venue:%s" % venue_id, "venues", "shows"] + ["artist:%s" % a for (a,) in artist_ids]
+
+
+def artist_pages(artist_id):
+    """
+    function for listing the cached pages that show data of an artist
+
+    Args:
+        artist_id: represent the number of id of the artist row on Artist table
+
+    returns:
+        list of cache names: the artist page, the listings and the pages of venues it plays at
+    """
+    venue_ids = db.session.query(Shows.venue_id).filter(Shows.artist_id == artist_id).distinct()
+    return ["artist:%s" % artist_id, "artists", "shows"] + ["venue:%s" % v for (v,) in venue_ids]
+
+
+def paginate_request(query, keys, stream=False):
+    """
+    function for paginating a query with the 'after', 'before' and 'limit' arguments of the request
+
+    Args:
+        query: query selecting every column in 'keys'
+        keys: unique, indexed sort key of the listing, e.g. (name, id)
+        stream: fetch the rows while the page is iterated, see 'paginate'
+
+    returns:
+        'Page' object, aborts with 400 on a malformed cursor
+    """
+    try:
+        return paginate(query, keys, stream=stream, **page_args())
+    except ValueError:
+        abort(400)
+
+
+def page_args():
+    """
+    function for reading the 'after', 'before' and 'limit' arguments of the request,
+    with the limit clamped to 'MAX_PAGE_SIZE'
+    """
+    limit = request.args.get("limit", current_app.config["PAGE_SIZE"], type=int)
+    return {
+        "after": request.args.get("after"),
+        "before": request.args.get("before"),
+        "limit": max(1, min(limit, current_app.config["MAX_PAGE_SIZE"])),
+    }
+
+
+# shortest search term holding a trigram: the pg_trgm index cannot serve a
+# shorter substring, which would match and rank most of the table
+MIN_SEARCH_LENGTH = 3
+
+
+def search_by_name(model, search_term):
+    """
+    function for searching a model by name through its pg_trgm index, most relevant first
+
+    Args:
+        model: 'Venue' or 'Artist'
+        search_term: text typed by the user, matched as a case-insensitive substring
+            or as a close (typo-tolerant) trigram match. Terms shorter than
+            'MIN_SEARCH_LENGTH' find nothing
+
+    returns:
+        'Page' of (id, name, rank) rows
+    """
+    return paginate_request(*search_query(model, search_term))
+
+
+def search_query(model, search_term):
+    """
+    function for building the query of 'search_by_name'
+
+    returns:
+        tuple of (query, keys)
+    """
+    search_term = search_term.strip()
+    if len(search_term) < MIN_SEARCH_LENGTH:
+        rank = literal(0.0, Float).label("rank")
+        return db.session.query(model.id, model.name, rank).filter(false()), (rank, model.name, model.id)
+
+    pattern = "%" + search_term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    # similarity() is a real; as a float8 the rank survives the cursor round trip
+    # exactly, so rows tied with the cursor row do not compare greater than it
+    rank = (-cast(func.similarity(model.name, search_term), Float)).label("rank")
+
+    query = (
+        db.session.query(model.id, model.name, rank)
+        .filter(or_(model.name.ilike(pattern, escape="\\"), model.name.op("%")(search_term)))
+    )
+    return query, (rank, model.name, model.id)
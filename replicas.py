@@ -0,0 +1,215 @@
+import itertools
+import logging
+import threading
+from time import monotonic, time
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+
+# ----------------------------------------------------------------------------#
+# Read replicas.
+# ----------------------------------------------------------------------------#
+# With 'SQLALCHEMY_REPLICA_URIS' set, the SELECTs of GET and HEAD requests go to
+# one of the replicas, picked round-robin per request among the healthy ones.
+# Everything else goes to the primary: writes and flushes, requests of any other
+# method, the CLI commands, and the requests of a client that wrote in the last
+# 'REPLICA_STICKY_SECONDS', so it reads its own writes despite replication lag.
+# That window is kept in a cookie of its own rather than in the session, which
+# another worker cannot read when each one signs it with a random SECRET_KEY.
+
+logger = logging.getLogger("fyyur.replicas")
+
+READ_METHODS = ("GET", "HEAD")
+STICKY_COOKIE = "fyyur_primary_until"
+
+LAG_QUERY = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() "
+    "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+def bind_name(index):
+    return "replica%d" % index
+
+
+class ReplicaSet(object):
+    """
+    round-robin over replica engines, skipping the ones failing their health check
+
+    A replica is healthy when it answers the lag query and is less than 'max_lag'
+    seconds behind. Each replica's health is checked again 'check_interval'
+    seconds after its last check, by the request that finds it stale; until
+    their first check, replicas are unhealthy.
+    """
+
+    def __init__(self, engines, check_interval=5, max_lag=10):
+        self.engines = engines
+        self.check_interval = check_interval
+        self.max_lag = max_lag
+        self._health = [(False, float("-inf"))] * len(engines)
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+
+    def check(self, index):
+        """
+        function for running the health check of a replica
+
+        returns:
+            True if it is healthy
+        """
+        try:
+            with self.engines[index].connect() as connection:
+                lag = connection.execute(LAG_QUERY).scalar()
+        except Exception as e:
+            logger.warning("replica %d failed its health check: %s", index, e)
+            return False
+        if lag is not None and lag > self.max_lag:
+            logger.warning("replica %d is %.1fs behind", index, lag)
+            return False
+        return True
+
+    def healthy(self, index):
+        healthy, checked = self._health[index]
+        if monotonic() - checked < self.check_interval:
+            return healthy
+
+        with self._lock:
+            # claim the check, so concurrent requests keep the previous state meanwhile
+            if self._health[index][1] != checked:
+                return self._health[index][0]
+            self._health[index] = (healthy, monotonic())
+        healthy = self.check(index)
+        self._health[index] = (healthy, monotonic())
+        return healthy
+
+    def choose(self):
+        """
+        function for picking the next healthy replica
+
+        returns:
+            index of the replica, None when none is healthy
+        """
+        start = next(self._next)
+        for offset in range(len(self.engines)):
+            index = (start + offset) % len(self.engines)
+            if self.healthy(index):
+                return index
+        return None
+
+    def for_request(self):
+        """
+        function for picking the replica the current request reads from
+
+        returns:
+            index of the replica, None when the request must use the primary
+        """
+        if request.method not in READ_METHODS or sticky():
+            return None
+        return self.choose()
+
+    def stats(self):
+        return [{"bind": bind_name(index), "healthy": healthy}
+                for index, (healthy, checked) in enumerate(self._health)]
+
+
+def sticky():
+    """
+    function for telling whether the client wrote in the last 'REPLICA_STICKY_SECONDS',
+    and must read from the primary
+    """
+    try:
+        until = float(request.cookies.get(STICKY_COOKIE, 0))
+    except ValueError:
+        return False
+    # the cookie is not signed: a client can only pin itself, and no further than one window
+    now = time()
+    return now < until <= now + current_app.config.get("REPLICA_STICKY_SECONDS", 10)
+
+
+def read_only(view):
+    """
+    decorator for a view that reads only despite its method, e.g. a POST taking
+    its query as a JSON body, so its client is not pinned to the primary
+    """
+    view.read_only = True
+    return view
+
+
+def read_replica():
+    """
+    function for getting the replica engine the current request reads from,
+    chosen on its first query
+
+    returns:
+        'Engine', None outside of a request, without replicas or when the primary is used
+    """
+    if not has_request_context():
+        return None
+    if "db_replica" not in g:
+        replicas = current_app.extensions.get("replicas")
+        index = replicas.for_request() if replicas is not None else None
+        g.db_replica = replicas.engines[index] if index is not None else None
+    return g.db_replica
+
+
+class RoutingSession(Session):
+    """
+    Flask-SQLAlchemy session sending the SELECTs of read requests to a replica
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and getattr(clause, "is_select", False)
+                and getattr(clause, "_for_update_arg", None) is None):
+            replica = read_replica()
+            if replica is not None:
+                return replica
+        return super(RoutingSession, self).get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+
+def stick_to_primary(response):
+    """
+    after request hook pinning a client that wrote to the primary for 'REPLICA_STICKY_SECONDS'
+    """
+    view = current_app.view_functions.get(request.endpoint)
+    if (request.method not in READ_METHODS and response.status_code < 400
+            and not getattr(view, "read_only", False)):
+        seconds = current_app.config.get("REPLICA_STICKY_SECONDS", 10)
+        response.set_cookie(STICKY_COOKIE, "%.3f" % (time() + seconds), max_age=seconds,
+                            httponly=True, samesite="Lax")
+    return response
+
+
+def replica_binds(config):
+    """
+    function for listing the 'SQLALCHEMY_BINDS' entries of the replicas, with the
+    primary's 'SQLALCHEMY_ENGINE_OPTIONS' (Flask-SQLAlchemy only applies them to
+    the default bind)
+
+    returns:
+        dict of bind name -> engine options
+    """
+    options = config.get("SQLALCHEMY_ENGINE_OPTIONS", {})
+    return {bind_name(index): dict(options, url=uri)
+            for index, uri in enumerate(config.get("SQLALCHEMY_REPLICA_URIS") or ())}
+
+
+def init_replicas(app, db):
+    """
+    function for routing the reads to the replica binds set up by 'replica_binds'
+
+    returns:
+        'ReplicaSet' object, None without replicas
+    """
+    binds = replica_binds(app.config)
+    if not binds:
+        return None
+
+    with app.app_context():
+        engines = [db.engines[bind_name(index)] for index in range(len(binds))]
+    replicas = ReplicaSet(engines, app.config.get("REPLICA_CHECK_INTERVAL", 5),
+                          app.config.get("REPLICA_MAX_LAG", 10))
+    app.extensions["replicas"] = replicas
+    app.after_request(stick_to_primary)
+    return replicas
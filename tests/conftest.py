@@ -0,0 +1,79 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+# The database tests run against TEST_DATABASE_URL, a migrated database they
+# may write to ('flask db upgrade' first). Without it they are skipped.
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+if TEST_DATABASE_URL:
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+
+
+@pytest.fixture(scope="session")
+def app():
+    if not TEST_DATABASE_URL:
+        pytest.skip("set TEST_DATABASE_URL to a migrated database the tests may write to")
+    from app import app
+
+    app.config.update(TESTING=True)
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def db(app):
+    from models import db
+
+    with app.app_context():
+        yield db
+        db.session.remove()
+
+
+@pytest.fixture
+def booked_venue(db):
+    """
+    a venue of the 'Bookedtest' genre with one upcoming show, of an artist of its own
+
+    returns:
+        tuple of (venue id, artist id)
+    """
+    venue_id = db.session.execute(text(
+        "INSERT INTO \"Venue\" (name, city, state, genres) "
+        "VALUES ('Bookedtest Hall', 'Bookedtown', 'ZZ', '[\"Bookedtest\"]') RETURNING id"
+    )).scalar()
+    artist_id = db.session.execute(text(
+        "INSERT INTO \"Artist\" (name, genres) VALUES ('Bookedtest Band', '[]') RETURNING id"
+    )).scalar()
+    db.session.execute(text(
+        "INSERT INTO \"Shows\" (venue_id, artist_id, start_time) VALUES (:v, :a, :t)"
+    ), {"v": venue_id, "a": artist_id, "t": datetime.now() + timedelta(days=30)})
+    db.session.commit()
+    yield venue_id, artist_id
+    db.session.rollback()
+    db.session.execute(text('DELETE FROM "Shows" WHERE venue_id = :v OR artist_id = :a'),
+                       {"v": venue_id, "a": artist_id})
+    db.session.execute(text('DELETE FROM "Artist" WHERE id = :a'), {"a": artist_id})
+    db.session.execute(text('DELETE FROM "Venue" WHERE id = :v'), {"v": venue_id})
+    db.session.commit()
+
+
+@pytest.fixture
+def shared_cache(app, monkeypatch):
+    """
+    a response cache the CLI commands may invalidate, over a stand-in redis client
+    """
+    from cache import ResponseCache, SharedCache
+    from test_cache import FakeRedis
+
+    response_cache = ResponseCache(SharedCache(FakeRedis()))
+    monkeypatch.setitem(app.extensions, "response_cache", response_cache)
+    return response_cache
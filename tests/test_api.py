@@ -0,0 +1,15 @@
+def test_venue_etag_changes_with_its_artists(client, db, booked_venue):
+    from models import Artist
+
+    venue_id, artist_id = booked_venue
+    path = "/api/v1/venues/%d" % venue_id
+    etag = client.get(path).headers["ETag"]
+    assert client.get(path, headers={"If-None-Match": etag}).status_code == 304
+
+    db.session.get(Artist, artist_id).name = "Apitest Renamed"
+    db.session.commit()
+
+    response = client.get(path, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert "Apitest Renamed" in response.get_data(as_text=True)
@@ -0,0 +1,122 @@
+import asyncio
+from collections import namedtuple
+
+import pytest
+
+Reply = namedtuple("Reply", "status headers body")
+
+
+@pytest.fixture
+def asgi(app, monkeypatch):
+    """
+    the 'asgi' module, with the requests it passes to the Flask app recorded in
+    its 'passed' list
+    """
+    pytest.importorskip("asyncpg")
+    pytest.importorskip("asgiref")
+    import asgi
+
+    wsgi, asgi.passed = asgi.wsgi, []
+
+    async def recorded(scope, receive, send):
+        asgi.passed.append(scope["path"])
+        return await wsgi(scope, receive, send)
+
+    monkeypatch.setattr(asgi, "wsgi", recorded)
+    yield asgi
+    del asgi.passed
+
+
+def call(asgi, method, path, query=b"", headers=()):
+    """
+    function for sending one request through the ASGI application, on an event
+    loop of its own
+
+    returns:
+        'Reply' of the status, the headers as a dict and the body
+    """
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query,
+        "root_path": "",
+        "headers": [(b"host", b"testserver")] + [(k.encode(), v.encode()) for k, v in headers],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    async def run():
+        try:
+            await asgi.application(scope, receive, send)
+        finally:
+            # the pooled asyncpg connections belong to this loop
+            for engine in [asgi.engine] + asgi.replica_engines:
+                await engine.dispose()
+
+    asyncio.run(run())
+    start, body = sent[0], sent[1:]
+    assert start["type"] == "http.response.start"
+    return Reply(start["status"],
+                 {k.decode("latin-1"): v.decode("latin-1") for k, v in start["headers"]},
+                 b"".join(message.get("body", b"") for message in body))
+
+
+def test_a_list_page_is_served_by_its_coroutine(asgi, booked_venue):
+    reply = call(asgi, "GET", "/venues", query=b"genre=Bookedtest")
+    assert reply.status == 200
+    assert reply.headers["content-type"].startswith("text/html")
+    assert b"Bookedtest Hall" in reply.body
+    assert asgi.passed == []
+
+
+def test_a_missing_venue_is_a_404(asgi, db):
+    from models import Venue
+
+    missing = (db.session.query(db.func.max(Venue.id)).scalar() or 0) + 1000
+    reply = call(asgi, "GET", "/venues/%d" % missing)
+    assert reply.status == 404
+    assert asgi.passed == []
+
+
+def test_a_head_request_has_the_headers_but_no_body(asgi, booked_venue):
+    venue_id, _ = booked_venue
+    get = call(asgi, "GET", "/venues/%d" % venue_id)
+    head = call(asgi, "HEAD", "/venues/%d" % venue_id)
+    assert get.status == head.status == 200
+    assert b"Bookedtest Hall" in get.body
+    assert head.body == b""
+    assert head.headers["content-length"] == get.headers["content-length"]
+    assert asgi.passed == []
+
+
+def test_an_unchanged_venue_is_not_sent_again(asgi, booked_venue):
+    venue_id, _ = booked_venue
+    path = "/api/v1/venues/%d" % venue_id
+    reply = call(asgi, "GET", path)
+    assert reply.status == 200
+    etag = reply.headers["etag"]
+
+    reply = call(asgi, "GET", path, headers=[("If-None-Match", etag)])
+    assert reply.status == 304
+    assert reply.headers["etag"] == etag
+    assert reply.body == b""
+    assert asgi.passed == []
+
+
+def test_other_routes_are_passed_to_the_flask_app(asgi):
+    reply = call(asgi, "GET", "/venues/create")
+    assert reply.status == 200
+    assert b"<form" in reply.body
+    assert asgi.passed == ["/venues/create"]
@@ -0,0 +1,23 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "benchmarks"))
+
+from compare import check_thresholds  # noqa: E402
+from load import query_count  # noqa: E402
+
+
+def test_query_count_of_a_response():
+    assert query_count('app;dur=3.0, db;dur=1.2;desc="4 queries"', b"{}") == 4
+    page = b'<html></html>\n<!-- Server-Timing: db;dur=2.5;desc="7 queries" -->\n'
+    assert query_count("app;dur=1.0, db;dur=0.1", page) == 7
+    assert query_count("app;dur=1.0, db;dur=0.1", b"id,name\n") is None
+
+
+def test_a_route_without_a_statement_count_fails():
+    routes = {
+        "venues": {"p95_ms": 10, "queries_max": None},
+        "artists": {"p95_ms": 10, "queries_max": 2},
+    }
+    problems = check_thresholds(routes, {"*": {"p95_ms": 250, "queries_max": 5}})
+    assert problems == ["venues: no queries_max to check against the limit of 5"]
@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+
+START = datetime(2041, 3, 1, 20)
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+@pytest.fixture
+def booking(db):
+    """
+    a venue and an artist of their own, booked together from 'START' for two hours,
+    and a second venue and artist with nothing booked
+
+    returns:
+        dict of the venue, artist, free_venue and free_artist ids and the show id
+    """
+    ids = {}
+    for key, name in (("venue", "Bookingtest Hall"), ("free_venue", "Bookingtest Annex")):
+        ids[key] = db.session.execute(text(
+            "INSERT INTO \"Venue\" (name, city, state, genres) "
+            "VALUES (:name, 'Bookingtown', 'ZZ', '[]') RETURNING id"
+        ), {"name": name}).scalar()
+    for key, name in (("artist", "Bookingtest Band"), ("free_artist", "Bookingtest Duo")):
+        ids[key] = db.session.execute(text(
+            "INSERT INTO \"Artist\" (name, genres) VALUES (:name, '[]') RETURNING id"
+        ), {"name": name}).scalar()
+    ids["show"] = db.session.execute(text(
+        "INSERT INTO \"Shows\" (venue_id, artist_id, start_time, end_time) "
+        "VALUES (:v, :a, :s, :e) RETURNING id"
+    ), {"v": ids["venue"], "a": ids["artist"], "s": START, "e": START + timedelta(hours=2)}).scalar()
+    db.session.commit()
+    yield ids
+    db.session.rollback()
+    venues, artists = [ids["venue"], ids["free_venue"]], [ids["artist"], ids["free_artist"]]
+    db.session.execute(text('DELETE FROM "Shows" WHERE venue_id = ANY(:v) OR artist_id = ANY(:a)'),
+                       {"v": venues, "a": artists})
+    db.session.execute(text('DELETE FROM "Artist" WHERE id = ANY(:a)'), {"a": artists})
+    db.session.execute(text('DELETE FROM "Venue" WHERE id = ANY(:v)'), {"v": venues})
+    db.session.commit()
+
+
+def check(client, *shows):
+    response = client.post("/api/v1/shows/check", json={"shows": [
+        dict(show, start_time=show["start_time"].isoformat(),
+             **({"end_time": show["end_time"].isoformat()} if show.get("end_time") else {}))
+        for show in shows
+    ]})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def create(client, venue_id, artist_id, start_time, end_time=None):
+    form = {"venue_id": venue_id, "artist_id": artist_id,
+            "start_time": start_time.strftime(DATE_FORMAT)}
+    if end_time:
+        form["end_time"] = end_time.strftime(DATE_FORMAT)
+    return client.post("/shows/create", data=form).get_data(as_text=True)
+
+
+def shows_of(db, column, id):
+    return db.session.execute(text('SELECT start_time, end_time FROM "Shows" WHERE %s = :id'
+                                   ' ORDER BY start_time' % column), {"id": id}).all()
+
+
+@pytest.mark.parametrize("conflict", ["venue", "artist"])
+def test_a_booked_show_cannot_be_double_booked(client, db, booking, conflict):
+    # the same venue with another artist, or the same artist at another venue
+    other = "artist" if conflict == "venue" else "venue"
+    show = {conflict + "_id": booking[conflict], other + "_id": booking["free_" + other],
+            "start_time": START + timedelta(hours=1), "end_time": START + timedelta(hours=3)}
+
+    result = check(client, show)
+    assert result["ok"] is False
+    [found] = result["data"][0]["conflicts"]
+    assert found["with"] == conflict
+    assert found["show"]["id"] == booking["show"]
+
+    page = create(client, show["venue_id"], show["artist_id"], show["start_time"], show["end_time"])
+    assert "ERROR. The %s is already booked" % conflict in page
+    assert "(show %d)" % booking["show"] in page
+    assert len(shows_of(db, conflict + "_id", booking[conflict])) == 1
+
+    # right after the booked show ends is free
+    later = dict(show, start_time=START + timedelta(hours=2), end_time=START + timedelta(hours=4))
+    assert check(client, later)["ok"] is True
+    assert "Show was successfully listed!" in create(
+        client, later["venue_id"], later["artist_id"], later["start_time"], later["end_time"])
+    assert len(shows_of(db, conflict + "_id", booking[conflict])) == 2
+
+
+@pytest.mark.parametrize("conflict", ["venue", "artist"])
+def test_proposals_that_double_book_each_other_are_reported(client, booking, conflict):
+    other = "artist" if conflict == "venue" else "venue"
+    first = {conflict + "_id": booking["free_" + conflict], other + "_id": booking["free_" + other],
+             "start_time": START + timedelta(days=1), "end_time": START + timedelta(days=1, hours=2)}
+    second = dict(first, start_time=START + timedelta(days=1, hours=1),
+                  end_time=START + timedelta(days=1, hours=3))
+    second[other + "_id"] = booking[other]
+
+    result = check(client, first, second)
+    assert result["ok"] is False
+    assert result["data"][0]["conflicts"] == [{"with": conflict, "booking": 1}]
+    assert result["data"][1]["conflicts"] == [{"with": conflict, "booking": 0}]
+
+
+def test_a_show_without_an_end_time_is_booked_for_the_default_length(app, client, db, booking):
+    hours = app.config["SHOW_DEFAULT_HOURS"]
+    start = START + timedelta(days=2)
+    assert "Show was successfully listed!" in create(client, booking["free_venue"],
+                                                     booking["free_artist"], start)
+    [(start_time, end_time)] = shows_of(db, "venue_id", booking["free_venue"])
+    assert (start_time, end_time) == (start, start + timedelta(hours=hours))
+
+    # a proposal without an end time gets the same default, and overlaps it
+    overlapping = {"venue_id": booking["free_venue"], "artist_id": booking["artist"],
+                   "start_time": start - timedelta(hours=hours / 2)}
+    result = check(client, overlapping)
+    assert result["ok"] is False
+    assert [c["with"] for c in result["data"][0]["conflicts"]] == ["venue"]
+    assert "ERROR. The venue is already booked" in create(
+        client, overlapping["venue_id"], overlapping["artist_id"], overlapping["start_time"])
+
+    after = dict(overlapping, start_time=start + timedelta(hours=hours))
+    assert check(client, after)["ok"] is True
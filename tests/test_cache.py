@@ -0,0 +1,78 @@
+import pytest
+
+
+def test_deleting_an_artist_refreshes_the_venue_counts(app, client, booked_venue):
+    if app.extensions["response_cache"].backend.__class__.__name__ == "NullCache":
+        pytest.skip("the response cache is off")
+    venue_id, artist_id = booked_venue
+
+    assert "1 upcoming show<" in client.get("/venues?genre=Bookedtest").get_data(as_text=True)
+    client.delete("/artists/%d" % artist_id)
+    # another visitor: the deleting one has a flashed message, which skips the cache
+    visitor = app.test_client()
+    assert "0 upcoming shows" in visitor.get("/venues?genre=Bookedtest").get_data(as_text=True)
+
+
+class FakeRedis(object):
+    """
+    stand-in for a redis client: the get, set, delete and incr commands SharedCache uses
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.expiry = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+        self.expiry[key] = ex
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1).encode()
+        return int(self.data[key])
+
+
+def test_shared_cache_commands():
+    from cache import SharedCache
+
+    client = FakeRedis()
+    cache = SharedCache(client, prefix="t:", default_ttl=60)
+
+    assert cache.get("page") is None
+    cache.set("page", (b"<html>", "text/html"))
+    assert cache.get("page") == (b"<html>", "text/html")
+    assert client.expiry["t:page"] == 60
+    cache.set("forever", 1, ttl=0)
+    assert client.expiry["t:forever"] is None
+
+    cache.delete("page", "forever")
+    assert cache.get("page") is None and cache.get("forever") is None
+
+    assert cache.counter("gen:venues") == 0
+    assert cache.incr("gen:venues") == 1
+    assert cache.counter("gen:venues") == 1
+
+
+def test_invalidating_a_page_moves_it_to_a_new_generation():
+    from flask import Flask
+    from cache import ResponseCache, SharedCache
+
+    app = Flask(__name__)
+    app.secret_key = "test"
+    cache = ResponseCache(SharedCache(FakeRedis()))
+
+    with app.test_request_context("/venues?genre=Jazz"):
+        key = cache.key("venues")
+        cache.set(key, app.make_response("cached"))
+        assert cache.get(cache.key("venues")).get_data() == b"cached"
+
+        cache.invalidate("venues")
+        assert cache.key("venues") != key
+        assert cache.get(cache.key("venues")) is None
+        assert cache.stats() == {"hits": 1, "misses": 1}
@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+from sqlalchemy import text
+
+
+def test_rollover_invalidates_the_pages_showing_the_moved_counters(app, db, booked_venue,
+                                                                   shared_cache):
+    from counters import rollover
+
+    venue_id, artist_id = booked_venue
+    previous, as_of, pages = rollover()
+    # the show starts right after the watermark, so the next roll-over moves it to past
+    db.session.execute(text('UPDATE "Shows" SET start_time = :t WHERE venue_id = :v'),
+                       {"t": as_of + timedelta(microseconds=1), "v": venue_id})
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=["counters", "rollover"])
+    assert result.exit_code == 0, result.output
+    for page in ("venue:%d" % venue_id, "artist:%d" % artist_id, "venues", "artists"):
+        assert shared_cache._generation(page) == 1, page
+
+    db.session.expire_all()
+    counts = db.session.execute(text(
+        'SELECT upcoming_shows_count, past_shows_count FROM "Venue" WHERE id = :v'), {"v": venue_id})
+    assert tuple(counts.one()) == (0, 1)
+
+
+def test_repair_invalidates_the_pages_of_the_repaired_counters(app, db, booked_venue, shared_cache):
+    venue_id, artist_id = booked_venue
+    db.session.execute(text('UPDATE "Venue" SET upcoming_shows_count = 5 WHERE id = :v'),
+                       {"v": venue_id})
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=["counters", "check", "--repair"])
+    assert "Venue %d: upcoming 5 (recounted 1)" % venue_id in result.output
+    assert shared_cache._generation("venue:%d" % venue_id) == 1
+    assert shared_cache._generation("venues") == 1
@@ -0,0 +1,78 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+
+from importer import KINDS, normalize
+
+SHOWS = KINDS["shows"]
+
+
+@pytest.fixture
+def config_app():
+    """
+    an application with just the settings 'normalize' reads, no database needed
+    """
+    app = Flask(__name__)
+    app.config["SHOW_DEFAULT_HOURS"] = 2.5
+    return app
+
+
+def test_a_show_without_an_end_time_gets_the_default_length(config_app):
+    with config_app.app_context():
+        row = normalize({"artist_id": "4", "venue_id": "1", "start_time": "2031-06-14T20:00"},
+                        SHOWS["columns"], SHOWS["required"])
+    start = datetime(2031, 6, 14, 20)
+    assert row["start_time"] == start
+    assert row["end_time"] == start + timedelta(hours=2.5)
+
+
+def test_a_given_end_time_is_kept(config_app):
+    with config_app.app_context():
+        row = normalize({"artist_id": 4, "venue_id": 1, "start_time": "2031-06-14T20:00",
+                         "end_time": "2031-06-14T21:30"}, SHOWS["columns"], SHOWS["required"])
+    assert row["end_time"] == datetime(2031, 6, 14, 21, 30)
+
+
+def test_a_show_without_a_start_time_is_refused(config_app):
+    with config_app.app_context(), pytest.raises(ValueError, match="start_time"):
+        normalize({"artist_id": 4, "venue_id": 1}, SHOWS["columns"], SHOWS["required"])
+
+
+def import_records(app, tmp_path, kind, records):
+    path = tmp_path / ("%s.jsonl" % kind)
+    path.write_text("".join(json.dumps(record) + "\n" for record in records))
+    return app.test_cli_runner().invoke(args=["import-data", kind, str(path)])
+
+
+def test_importing_an_artist_invalidates_its_pages(app, tmp_path, booked_venue, shared_cache):
+    venue_id, artist_id = booked_venue
+    result = import_records(app, tmp_path, "artists",
+                            [{"name": "Bookedtest Band", "website": "https://booked.example.com"}])
+    assert "1 rows written" in result.output
+
+    for page in ("artist:%d" % artist_id, "venue:%d" % venue_id, "artists", "shows"):
+        assert shared_cache._generation(page) == 1, page
+    assert shared_cache._generation("venues") == 0
+
+
+def test_importing_a_show_invalidates_its_artist_and_venue(app, tmp_path, booked_venue,
+                                                           shared_cache):
+    venue_id, artist_id = booked_venue
+    result = import_records(app, tmp_path, "shows", [
+        {"artist_id": artist_id, "venue_id": venue_id, "start_time": "2039-01-01T20:00"}])
+    assert "1 rows written" in result.output
+
+    for page in ("artist:%d" % artist_id, "venue:%d" % venue_id, "artists", "venues", "shows"):
+        assert shared_cache._generation(page) == 1, page
+
+
+def test_a_per_process_cache_cannot_be_invalidated_from_the_command(app, tmp_path, caplog,
+                                                                    monkeypatch):
+    from cache import LRUCache, ResponseCache
+
+    monkeypatch.setitem(app.extensions, "response_cache", ResponseCache(LRUCache()))
+    result = import_records(app, tmp_path, "shows", [{"artist_id": 1}])
+    assert "1 failed" in result.output
+    assert "cannot invalidate" in caplog.text
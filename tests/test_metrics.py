@@ -0,0 +1,61 @@
+import re
+
+import pytest
+from sqlalchemy import text
+
+
+@pytest.fixture
+def venues(db):
+    """
+    three venues of a genre of their own
+    """
+    ids = [db.session.execute(text(
+        "INSERT INTO \"Venue\" (name, city, state, genres) "
+        "VALUES (:name, 'Metrictown', 'ZZ', '[\"Metricstest\"]') RETURNING id"
+    ), {"name": "Metricstest Hall %d" % i}).scalar() for i in range(3)]
+    db.session.commit()
+    yield ids
+    db.session.execute(text('DELETE FROM "Venue" WHERE id = ANY(:ids)'), {"ids": ids})
+    db.session.commit()
+
+
+def rows_read(app, endpoint):
+    """
+    sum and count of the rows histogram of an endpoint
+    """
+    samples = {name: value for name, labels, value in app.extensions["request_metrics"].rows.samples()
+               if labels == {"endpoint": endpoint}}
+    return samples.get("fyyur_sql_rows_per_request_sum", 0), samples.get("fyyur_sql_rows_per_request_count", 0)
+
+
+def test_rows_of_a_page_are_counted(app, client, venues):
+    total, count = rows_read(app, "api.venues")
+    response = client.get("/api/v1/venues?genre=Metricstest&limit=2")
+    assert response.status_code == 200
+    # the page and the row telling there is a next one
+    assert rows_read(app, "api.venues") == (total + 3, count + 1)
+
+
+def test_rows_of_a_streamed_page_are_counted_once_sent(app, client, venues):
+    total, count = rows_read(app, "venues")
+    response = client.get("/venues?genre=Metricstest&limit=2")
+    assert "Metricstest Hall 1" in response.get_data(as_text=True)
+    # recorded when the server closes the streamed response
+    response.close()
+    assert rows_read(app, "venues") == (total + 3, count + 1)
+
+
+def test_rows_histogram_is_exported(client):
+    assert "# TYPE fyyur_sql_rows_per_request histogram" in client.get("/metrics").get_data(as_text=True)
+
+
+def test_a_streamed_page_ends_with_its_full_statement_count(app, venues):
+    response = app.test_client().get("/venues?genre=Metricstest&limit=2&timing=1")
+    body = response.get_data(as_text=True)
+    response.close()
+
+    assert "queries" not in response.headers["Server-Timing"]
+    trailer = re.search(r'<!-- Server-Timing: db;dur=[\d.]+;desc="(\d+) queries" -->\s*$', body)
+    assert trailer is not None
+    # the page's own query ran after the header was sent
+    assert int(trailer.group(1)) >= 1
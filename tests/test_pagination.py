@@ -0,0 +1,114 @@
+import re
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from pagination import decode_cursor, encode_cursor
+
+CURSOR = re.compile(r'href="[^"]*[?&]after=([\w-]+)')
+VENUE = re.compile(r'href="/venues/(\d+)"')
+
+
+def test_cursor_round_trip():
+    values = [-0.23529411852359772, "Austin", 7]
+    assert decode_cursor(encode_cursor(values), 3) == values
+
+
+def test_malformed_cursor():
+    with pytest.raises(ValueError):
+        decode_cursor("not a cursor", 2)
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor([1]), 2)
+
+
+@pytest.fixture
+def tied_venues(db):
+    """
+    venues whose names all rank the same against the search term
+    """
+    if not db.session.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first():
+        pytest.skip("pg_trgm is not installed")
+    ids = [db.session.execute(text(
+        "INSERT INTO \"Venue\" (name, city, state, genres) "
+        "VALUES (:name, 'Pagetown', 'ZZ', '[]') RETURNING id"), {"name": "Zyxpage Hall %03d" % i}
+    ).scalar() for i in range(60)]
+    db.session.commit()
+    yield set(ids)
+    db.session.execute(text('DELETE FROM "Venue" WHERE id = ANY(:ids)'), {"ids": ids})
+    db.session.commit()
+
+
+def test_search_pages_through_ties(client, tied_venues):
+    seen = []
+    path = "/venues/search?search_term=Zyxpage&limit=7"
+    for _ in range(len(tied_venues)):
+        html = client.get(path).get_data(as_text=True)
+        seen += [int(v) for v in VENUE.findall(html)]
+        cursor = CURSOR.search(html)
+        if cursor is None:
+            break
+        path = "/venues/search?search_term=Zyxpage&limit=7&after=" + cursor.group(1)
+
+    assert sorted(seen) == sorted(tied_venues)
+
+
+@pytest.fixture
+def scheduled_shows(db):
+    """
+    shows of a venue of their own, several starting at the same time
+    """
+    venue_id = db.session.execute(text(
+        "INSERT INTO \"Venue\" (name, city, state, genres) "
+        "VALUES ('Showpage Hall', 'Showpagetown', 'ZZ', '[]') RETURNING id")).scalar()
+    artist_id = db.session.execute(text(
+        "INSERT INTO \"Artist\" (name, genres) VALUES ('Showpage Band', '[]') RETURNING id")).scalar()
+    start = datetime(2031, 6, 14, 20)
+    ids = [db.session.execute(text(
+        "INSERT INTO \"Shows\" (venue_id, artist_id, start_time) VALUES (:v, :a, :t) RETURNING id"
+    ), {"v": venue_id, "a": artist_id, "t": start + timedelta(days=i // 3)}).scalar() for i in range(7)]
+    db.session.commit()
+    yield venue_id, artist_id, set(ids)
+    db.session.rollback()
+    db.session.execute(text('DELETE FROM "Shows" WHERE venue_id = :v'), {"v": venue_id})
+    db.session.execute(text('DELETE FROM "Artist" WHERE id = :a'), {"a": artist_id})
+    db.session.execute(text('DELETE FROM "Venue" WHERE id = :v'), {"v": venue_id})
+    db.session.commit()
+
+
+def test_show_listing_pages_through_every_show(client, db, scheduled_shows):
+    venue_id, artist_id, ids = scheduled_shows
+    # a show without a start time would sort out of the keyset, so none may exist
+    with pytest.raises(IntegrityError):
+        db.session.execute(text("INSERT INTO \"Shows\" (venue_id, artist_id) VALUES (:v, :a)"),
+                           {"v": venue_id, "a": artist_id})
+        db.session.flush()
+    db.session.rollback()
+
+    seen = []
+    path = "/api/v1/shows?city=Showpagetown&limit=2"
+    for _ in range(len(ids)):
+        payload = client.get(path).get_json()
+        seen += [show["id"] for show in payload["data"]]
+        if payload["next"] is None:
+            break
+        path = "/api/v1/shows?city=Showpagetown&limit=2&after=" + payload["next"]
+
+    assert sorted(seen) == sorted(ids)
+
+
+@pytest.mark.parametrize("path", ["/venues", "/artists", "/shows"])
+def test_a_streamed_page_gives_its_connection_back(app, path):
+    from models import db
+
+    with app.app_context():
+        pool = db.engine.pool
+    client = app.test_client()
+    checked_out = pool.checkedout()
+    for i in range(3):
+        # a query string of its own, so the page is rendered rather than read from the cache
+        response = client.get(path + "?limit=2&leak=%d" % i)
+        response.get_data()
+        response.close()
+    assert pool.checkedout() == checked_out
@@ -0,0 +1,125 @@
+import os
+from time import time
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from config import psycopg2_url
+from replicas import STICKY_COOKIE, ReplicaSet, stick_to_primary
+
+# a second migrated database standing in for a replica; nothing replicates
+# to it, so the tests can tell which database a page was read from
+TEST_REPLICA_DATABASE_URL = os.environ.get("TEST_REPLICA_DATABASE_URL")
+
+
+def route_reads_to(app, monkeypatch, url):
+    engine = create_engine(psycopg2_url(url))
+    monkeypatch.setitem(app.extensions, "replicas", ReplicaSet([engine], check_interval=60))
+    hooks = app.after_request_funcs.get(None, [])
+    if stick_to_primary not in hooks:
+        monkeypatch.setitem(app.after_request_funcs, None, hooks + [stick_to_primary])
+    return engine
+
+
+@pytest.fixture
+def replica(app, monkeypatch):
+    if not TEST_REPLICA_DATABASE_URL:
+        pytest.skip("set TEST_REPLICA_DATABASE_URL to a second migrated database")
+    engine = route_reads_to(app, monkeypatch, TEST_REPLICA_DATABASE_URL)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def primary(app):
+    # no app context is kept open: the requests would share its 'g' and session
+    from models import db
+
+    with app.app_context():
+        return db.engine
+
+
+@pytest.fixture
+def venue(primary, replica):
+    """
+    a venue named differently on the primary and on the replica
+    """
+    insert = text("INSERT INTO \"Venue\" (id, name, city, state, genres) "
+                  "VALUES (:id, :name, 'Replicatown', 'ZZ', '[]')")
+    delete = text('DELETE FROM "Venue" WHERE id = :id')
+    with primary.begin() as connection:
+        venue_id = connection.execute(text("SELECT nextval('\"Venue_id_seq\"')")).scalar() + 1000000
+        connection.execute(insert, {"id": venue_id, "name": "Replicatest Primary"})
+    with replica.begin() as connection:
+        connection.execute(insert, {"id": venue_id, "name": "Replicatest Replica"})
+    yield venue_id
+    for engine in (primary, replica):
+        with engine.begin() as connection:
+            connection.execute(delete, {"id": venue_id})
+
+
+def page(client, venue_id):
+    return client.get("/venues/%d" % venue_id).get_data(as_text=True)
+
+
+def test_reads_go_to_the_replica(client, venue):
+    assert "Replicatest Replica" in page(client, venue)
+
+
+def test_writer_reads_its_writes_and_stale_pages_are_not_cached(app, venue, primary, replica):
+    writer, other = app.test_client(), app.test_client()
+    assert "Replicatest Replica" in page(other, venue)
+
+    response = writer.post("/venues/%d/edit" % venue, data={
+        "name": "Replicatest Edited", "city": "Replicatown", "state": "ZZ",
+    })
+    assert response.status_code == 302
+
+    # the replica has not replayed the edit yet
+    assert "Replicatest Replica" in page(other, venue)
+    # the writer skips the cache and reads from the primary
+    assert "Replicatest Edited" in page(writer, venue)
+
+    # once the replica catches up, nobody gets the stale page from the cache
+    with primary.connect() as connection:
+        version = connection.execute(text('SELECT version FROM "Venue" WHERE id = :id'),
+                                     {"id": venue}).scalar()
+    with replica.begin() as connection:
+        connection.execute(text("UPDATE \"Venue\" SET name = 'Replicatest Edited', version = :version "
+                                "WHERE id = :id"), {"id": venue, "version": version})
+    assert "Replicatest Edited" in page(app.test_client(), venue)
+
+
+def test_an_unreachable_replica_is_skipped(app, client, monkeypatch, primary):
+    engine = route_reads_to(app, monkeypatch, "postgresql://nobody@127.0.0.1:1/none")
+    try:
+        with primary.connect() as connection:
+            venue_id = connection.execute(text('SELECT min(id) FROM "Venue"')).scalar()
+        assert client.get("/venues/%d" % venue_id).status_code == 200
+        assert app.extensions["replicas"].stats() == [{"bind": "replica0", "healthy": False}]
+    finally:
+        engine.dispose()
+
+
+def test_the_writer_stays_on_the_primary_on_another_worker(app, venue, monkeypatch):
+    writer = app.test_client()
+    writer.post("/venues/%d/edit" % venue, data={
+        "name": "Replicatest Edited", "city": "Replicatown", "state": "ZZ",
+    })
+    # another worker, signing sessions with a SECRET_KEY of its own
+    monkeypatch.setitem(app.config, "SECRET_KEY", "another worker's key")
+    assert "Replicatest Edited" in page(writer, venue)
+
+
+def test_a_client_cannot_pin_itself_past_the_window(app, venue):
+    client = app.test_client()
+    client.set_cookie(STICKY_COOKIE, "%.3f" % (time() + 86400))
+    assert "Replicatest Replica" in page(client, venue)
+
+
+def test_checking_bookings_does_not_pin_the_client(app, venue):
+    client = app.test_client()
+    response = client.post("/api/v1/shows/check", json={"shows": []})
+    assert response.status_code == 200
+    assert STICKY_COOKIE not in response.headers.get("Set-Cookie", "")
+    assert "Replicatest Replica" in page(client, venue)
@@ -0,0 +1,30 @@
+import pytest
+from sqlalchemy import text
+
+
+@pytest.fixture
+def short_names(db):
+    """
+    a venue and an artist whose names contain a two letter term
+    """
+    venue_id = db.session.execute(text(
+        "INSERT INTO \"Venue\" (name, city, state, genres) "
+        "VALUES ('Qj Searchtest Hall', 'Searchtown', 'ZZ', '[]') RETURNING id")).scalar()
+    artist_id = db.session.execute(text(
+        "INSERT INTO \"Artist\" (name, genres) VALUES ('Qj Searchtest Band', '[]') RETURNING id")).scalar()
+    db.session.commit()
+    yield
+    db.session.execute(text('DELETE FROM "Venue" WHERE id = :v'), {"v": venue_id})
+    db.session.execute(text('DELETE FROM "Artist" WHERE id = :a'), {"a": artist_id})
+    db.session.commit()
+
+
+@pytest.mark.parametrize("kind", ["venues", "artists"])
+@pytest.mark.parametrize("term", ["", "q", " Qj "])
+def test_a_term_too_short_for_a_trigram_finds_nothing(app, short_names, kind, term):
+    response = app.test_client().post("/%s/search" % kind, data={"search_term": term})
+    html = response.get_data(as_text=True)
+
+    assert response.status_code == 200
+    assert ': 0</h3>' in html
+    assert "Searchtest" not in html
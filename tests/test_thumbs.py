@@ -0,0 +1,135 @@
+import io
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+from flask import Flask, render_template_string
+
+import thumbs
+from thumbs import init_image_proxy, public_address
+
+Image = pytest.importorskip("PIL.Image")
+
+
+class Origin(BaseHTTPRequestHandler):
+    """
+    stand-in image origin: /photo.png is an 800x600 PNG, /page.html is not an image
+    """
+
+    requests = []
+
+    def do_GET(self):
+        Origin.requests.append(self.path)
+        if self.path == "/photo.png":
+            buffer = io.BytesIO()
+            Image.new("RGB", (800, 600), (200, 40, 40)).save(buffer, "PNG")
+            body, content_type = buffer.getvalue(), "image/png"
+        else:
+            body, content_type = b"<html></html>", "text/html"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def origin():
+    server = HTTPServer(("127.0.0.1", 0), Origin)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:%d" % server.server_port
+    server.shutdown()
+
+
+def make_app(tmp_path, **config):
+    app = Flask(__name__)
+    app.config.update(IMAGE_PROXY_KEY="test key", IMAGE_CACHE_DIR=str(tmp_path), **config)
+    init_image_proxy(app)
+    return app
+
+
+def thumb_url(app, link, size="tile"):
+    with app.test_request_context():
+        return render_template_string("{{ link|thumb(size) }}", link=link, size=size)
+
+
+def test_renders_and_caches_a_thumbnail(tmp_path, origin):
+    app = make_app(tmp_path, IMAGE_PROXY_ALLOW_PRIVATE=True)
+    client = app.test_client()
+    url = thumb_url(app, origin + "/photo.png").replace("&amp;", "&")
+    Origin.requests.clear()
+
+    response = client.get(url, headers={"Accept": "image/webp"})
+    assert response.status_code == 200
+    assert response.mimetype == "image/webp"
+    assert Image.open(io.BytesIO(response.get_data())).size == (400, 300)
+
+    response = client.get(url)
+    assert response.mimetype == "image/jpeg"
+    assert client.get(url).status_code == 200
+    # one fetch per format, the rest from the disk cache
+    assert Origin.requests == ["/photo.png", "/photo.png"]
+
+
+def test_rejects_bad_signatures_and_schemes(tmp_path):
+    app = make_app(tmp_path)
+    client = app.test_client()
+    url = thumb_url(app, "https://img.example.com/a.jpg").replace("&amp;", "&")
+
+    assert client.get(url.replace("sig=", "sig=0")).status_code == 404
+    assert client.get(thumb_url(app, "file:///etc/passwd").replace("&amp;", "&")).status_code == 404
+
+
+def test_does_not_fetch_private_addresses(tmp_path, origin):
+    app = make_app(tmp_path)
+    client = app.test_client()
+    url = thumb_url(app, origin + "/photo.png").replace("&amp;", "&")
+    Origin.requests.clear()
+
+    response = client.get(url)
+    assert response.status_code == 302
+    assert Origin.requests == []
+
+
+def test_redirects_when_the_origin_is_not_an_image(tmp_path, origin):
+    app = make_app(tmp_path, IMAGE_PROXY_ALLOW_PRIVATE=True)
+    response = app.test_client().get(thumb_url(app, origin + "/page.html").replace("&amp;", "&"))
+    assert response.status_code == 302
+    assert response.location == origin + "/page.html"
+
+
+def test_links_the_originals_without_a_key(tmp_path):
+    app = Flask(__name__)
+    app.config.update(IMAGE_CACHE_DIR=str(tmp_path))
+    init_image_proxy(app)
+    assert thumb_url(app, "https://img.example.com/a.jpg") == "https://img.example.com/a.jpg"
+
+
+@pytest.mark.parametrize("address, public", [
+    ("93.184.216.34", True),
+    ("2606:2800:220:1::1", True),
+    ("127.0.0.1", False),
+    ("10.1.2.3", False),
+    ("172.16.0.1", False),
+    ("192.168.1.1", False),
+    ("169.254.169.254", False),
+    ("100.64.0.1", False),
+    ("0.0.0.0", False),
+    ("::1", False),
+    ("fe80::1%eth0", False),
+    ("fd00::1", False),
+    ("::ffff:127.0.0.1", False),
+    ("224.0.0.1", False),
+])
+def test_public_address(address, public):
+    assert public_address(address) is public
+
+
+def test_the_opener_ignores_environment_proxies(monkeypatch):
+    monkeypatch.setenv("http_proxy", "http://10.0.0.1:3128")
+    opener = thumbs.build_opener()
+    assert not any(getattr(h, "proxies", None) for h in opener.handlers)
@@ -0,0 +1,340 @@
+import hashlib
+import hmac
+import http.client
+import io
+import ipaddress
+import os
+import socket
+import threading
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from flask import Blueprint, current_app, request, abort, redirect, send_file, url_for
+
+from cache import LRUCache
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# ----------------------------------------------------------------------------#
+# Image proxy.
+# ----------------------------------------------------------------------------#
+# Artist and venue pictures are remote 'image_link' URLs of any size. The proxy
+# fetches each one once, resizes it for its slot and keeps the result in a size
+# bounded disk cache, so pages embed small, long cacheable local thumbnails.
+# Proxy URLs are signed with 'IMAGE_PROXY_KEY', the same on every worker; without
+# it pages link the original images. Image links are user input, so the proxy
+# only connects to public addresses.
+
+# bounding box of each rendition; images keep their aspect ratio and are
+# rendered at twice the CSS size for high density screens
+SIZES = {
+    "tile": (400, 400),
+    "hero": (1000, 1000),
+}
+
+FORMATS = {
+    "webp": ("WEBP", "image/webp", {"quality": 80}),
+    "jpeg": ("JPEG", "image/jpeg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+
+def public_address(address):
+    """
+    function for telling whether an IP address may be fetched from: not private,
+    loopback, link-local, reserved or multicast
+    """
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if getattr(ip, "ipv4_mapped", None) is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def public_connection(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None):
+    """
+    function for connecting like 'socket.create_connection', but only to the
+    public addresses the host resolves to
+
+    The check is made on the address actually connected to, so redirects and
+    DNS answers changing between lookups cannot reach an internal service.
+    """
+    host, port = address
+    error = None
+    for family, type_, proto, _, sockaddr in socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM):
+        if not public_address(sockaddr[0]):
+            error = ValueError("%s resolves to the non public address %s" % (host, sockaddr[0]))
+            continue
+        sock = socket.socket(family, type_, proto)
+        try:
+            if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                sock.settimeout(timeout)
+            if source_address:
+                sock.bind(source_address)
+            sock.connect(sockaddr)
+            return sock
+        except OSError as e:
+            sock.close()
+            error = e
+    raise error or OSError("%s did not resolve" % host)
+
+
+class PublicHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super(PublicHTTPConnection, self).__init__(*args, **kwargs)
+        self._create_connection = public_connection
+
+
+class PublicHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, *args, **kwargs):
+        super(PublicHTTPSConnection, self).__init__(*args, **kwargs)
+        self._create_connection = public_connection
+
+
+class PublicHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(PublicHTTPConnection, req)
+
+
+class PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(PublicHTTPSConnection, req, context=self._context)
+
+
+def build_opener(allow_private=False):
+    """
+    function for building the URL opener of the proxy: no proxies from the
+    environment, and public addresses only unless 'allow_private'
+    """
+    handlers = [urllib.request.ProxyHandler({})]
+    if not allow_private:
+        handlers += [PublicHTTPHandler(), PublicHTTPSHandler()]
+    return urllib.request.build_opener(*handlers)
+
+
+class DiskLRU(object):
+    """
+    directory of files bounded to 'max_bytes', least recently used evicted first
+
+    Recency is kept in memory and mirrored in the files' mtime, so it survives a
+    restart. Workers sharing the directory each enforce the bound on their view
+    of it.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.total = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        files = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.endswith(".tmp"):
+                os.remove(path)
+                continue
+            stat = os.stat(path)
+            files.append((stat.st_mtime, name, stat.st_size))
+        for mtime, name, size in sorted(files):
+            self._entries[name] = size
+            self.total += size
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """
+        function for looking up a cached file
+
+        returns:
+            path of the file, None when it is not cached
+        """
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+        try:
+            os.utime(self.path(key))
+        except OSError:
+            # evicted by another worker
+            with self._lock:
+                self.total -= self._entries.pop(key, 0)
+            return None
+        return self.path(key)
+
+    def set(self, key, data):
+        """
+        function for storing a file, evicting the least recently used ones past 'max_bytes'
+
+        returns:
+            path of the stored file
+        """
+        path = self.path(key)
+        tmp = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+        with self._lock:
+            self.total += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            while self.total > self.max_bytes and len(self._entries) > 1:
+                old, size = self._entries.popitem(last=False)
+                self.total -= size
+                try:
+                    os.remove(self.path(old))
+                except OSError:
+                    pass
+        return path
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ImageProxy(object):
+    """
+    fetches, resizes and caches remote images
+
+    Renditions are produced in a bounded worker pool, and concurrent requests for
+    the same rendition wait on the same job. Origins that fail are not retried
+    for a minute.
+    """
+
+    def __init__(self, app):
+        config = app.config
+        self.key = config["IMAGE_PROXY_KEY"]
+        if isinstance(self.key, str):
+            self.key = self.key.encode("utf-8")
+        self.opener = build_opener(config.get("IMAGE_PROXY_ALLOW_PRIVATE", False))
+        self.timeout = config.get("IMAGE_PROXY_TIMEOUT", 10)
+        self.max_source_bytes = config.get("IMAGE_PROXY_MAX_SOURCE_BYTES", 10 * 1024 * 1024)
+        self.max_age = config.get("IMAGE_PROXY_MAX_AGE", 30 * 24 * 3600)
+        self.cache = DiskLRU(config.get("IMAGE_CACHE_DIR", "image_cache"),
+                             config.get("IMAGE_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+        self.pool = ThreadPoolExecutor(max_workers=config.get("IMAGE_PROXY_WORKERS", 4),
+                                       thread_name_prefix="image-proxy")
+        self.failures = LRUCache(max_entries=1024, default_ttl=60)
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def sign(self, url, size):
+        message = ("%s|%s" % (size, url)).encode("utf-8")
+        return hmac.new(self.key, message, hashlib.sha256).hexdigest()[:32]
+
+    def thumbnail_url(self, image_link, size):
+        """
+        function for turning an image link into the URL of its local rendition
+
+        Args:
+            image_link: remote image URL, returned as is when empty
+            size: key of 'SIZES'
+        """
+        if not image_link:
+            return image_link
+        return url_for("thumbs.thumbnail", size=size, url=image_link,
+                       sig=self.sign(image_link, size))
+
+    def thumbnail(self, url, size, format):
+        """
+        function for getting a rendition from the disk cache, rendering it on a miss
+
+        returns:
+            path of the rendition, raises when the origin or the image is unusable
+        """
+        key = "%s.%s" % (hashlib.sha256(("%s|%s" % (size, url)).encode("utf-8")).hexdigest(),
+                         format)
+        path = self.cache.get(key)
+        if path is not None:
+            return path
+
+        with self._lock:
+            job = self._pending.get(key)
+            if job is None:
+                job = self._pending[key] = self.pool.submit(self.render, url, size, format, key)
+        try:
+            return job.result()
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def fetch(self, url):
+        req = urllib.request.Request(url, headers={"User-Agent": "Fyyur image proxy"})
+        with self.opener.open(req, timeout=self.timeout) as response:
+            if response.headers.get_content_maintype() != "image":
+                raise ValueError("%s is not an image" % url)
+            data = response.read(self.max_source_bytes + 1)
+        if len(data) > self.max_source_bytes:
+            raise ValueError("%s is larger than %d bytes" % (url, self.max_source_bytes))
+        return data
+
+    def render(self, url, size, format, key):
+        image = Image.open(io.BytesIO(self.fetch(url)))
+        # lets JPEG decode at a reduced scale, far cheaper than a full decode
+        image.draft("RGB", SIZES[size])
+        image.thumbnail(SIZES[size])
+
+        pil_format, mimetype, options = FORMATS[format]
+        keep_alpha = format == "webp" and "A" in image.getbands()
+        image = image.convert("RGBA" if keep_alpha else "RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, pil_format, **options)
+        return self.cache.set(key, buffer.getvalue())
+
+
+thumbs = Blueprint("thumbs", __name__)
+
+
+@thumbs.route("/thumbs/<any(tile, hero):size>")
+def thumbnail(size):
+    """
+    function for serving the resized rendition of a signed image link
+
+    Falls back to a redirect to the original image when Pillow is missing or the
+    origin fails.
+    """
+    proxy = current_app.extensions["image_proxy"]
+    url = request.args.get("url", "")
+    if (not hmac.compare_digest(request.args.get("sig", ""), proxy.sign(url, size))
+            or urlsplit(url).scheme not in ("http", "https")):
+        abort(404)
+    if Image is None or proxy.failures.get(url):
+        return redirect(url)
+
+    format = "webp" if "image/webp" in request.headers.get("Accept", "") else "jpeg"
+    try:
+        path = proxy.thumbnail(url, size, format)
+    except Exception as e:
+        current_app.logger.warning("image proxy: %s failed: %s", url, e)
+        proxy.failures.set(url, True)
+        return redirect(url)
+
+    response = send_file(path, mimetype=FORMATS[format][1], max_age=proxy.max_age,
+                         conditional=True)
+    response.cache_control.public = True
+    response.vary.add("Accept")
+    return response
+
+
+def init_image_proxy(app):
+    """
+    function for registering the image proxy and its 'thumb' template filter
+
+    returns:
+        'ImageProxy' object, None without 'IMAGE_PROXY_KEY': the filter then
+        leaves the image links as they are
+    """
+    if not app.config.get("IMAGE_PROXY_KEY"):
+        app.logger.warning("IMAGE_PROXY_KEY is not set, pages link the original images")
+        app.jinja_env.filters["thumb"] = lambda image_link, size: image_link
+        return None
+
+    proxy = ImageProxy(app)
+    app.extensions["image_proxy"] = proxy
+    app.register_blueprint(thumbs)
+    app.jinja_env.filters["thumb"] = proxy.thumbnail_url
+    return proxy